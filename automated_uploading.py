@@ -2,9 +2,13 @@ import pyautogui
 import time
 from icecream import ic
 import cv2
+import numpy as np
 import pyperclip
 import pandas as pd
 import json
+import os
+from screen_matching import ScreenMatcher
+from screen_matching import SessionRecorder
 
 
 with open('secrets.json', 'r') as file:
@@ -71,6 +75,30 @@ If you are the rightful owner of the original footage and wish for it to be remo
 
 # Job Data
 HISTORY = "Jellyfish/HISTORY/Jellyfish.csv"
+HISTORY_STORE_PATH = "STATE/history.sqlite3"
+VIDEOS_DIR = "Jellyfish/VIDEOS_WITH_SUBTITLES"
+
+# Seconds between checks of the screen, and the longest each step waits
+# for the UI state it expects.
+POLL_INTERVAL = 0.2
+STEP_TIMEOUT = 10
+PAGE_LOAD_TIMEOUT = 30
+# The visibility step appears once the upload has been checked.
+UPLOAD_CHECKS_TIMEOUT = 300
+# The screen counts as settled once it is unchanged for this long.
+SETTLE_SECONDS = 0.5
+# A click counts as taking effect once this fraction of the screen
+# changed, more than a button changes when hovered.
+MIN_CHANGED_FRACTION = 0.01
+
+# One screenshot per poll, matched against preloaded templates. Set
+# RECORD_SESSION_DIR to save the screenshots and clicks of a session,
+# for helpers/template_matching_benchmark.py.
+RECORD_SESSION_DIR = os.environ.get("RECORD_SESSION_DIR")
+MATCHER = ScreenMatcher(
+    recorder=SessionRecorder(RECORD_SESSION_DIR)
+    if RECORD_SESSION_DIR else None
+)
 
 print(pyautogui.size())
 
@@ -99,16 +127,135 @@ def drag_to_coordinate(coordinate, duration=1):
 
 
 def find_area(image_path, confidence=0.9):
-    try:
-        coords = pyautogui.locateOnScreen(image_path, confidence=confidence)
-        return coords
-    except Exception as e:
-        return False
+    return MATCHER.find(image_path, confidence) or False
 
 
-def find_areas_to_click(image_path):
-    # Adjust confidence level as necessary
-    return list(pyautogui.locateAllOnScreen(image_path, confidence=0.9))
+def wait_for(
+        template,
+        timeout: float = STEP_TIMEOUT,
+        poll_interval: float = POLL_INTERVAL,
+        confidence: float = 0.9,
+        appear: bool = True):
+    """
+    DESCRIPTION:
+    Polls the screen until a UI element appears, or disappears, instead
+    of sleeping for a fixed time. Returns as soon as the browser shows
+    the expected state. Several elements are matched against the same
+    screenshot on each poll.
+
+    ARGS:
+    - template (str or list): Path to the reference image of the
+    element, or a list of paths when any of them will do.
+    - timeout (float): Longest time to wait in seconds.
+    - poll_interval (float): Seconds between checks of the screen.
+    - confidence (float): Confidence required to say it is found.
+    - appear (bool): Waits for the elements to disappear when False.
+
+    RETURNS:
+    coordinate object of the first element in the list that appeared,
+    True when they disappeared, otherwise False after the timeout.
+    """
+    templates = [template] if isinstance(template, str) else list(template)
+    deadline = time.monotonic() + timeout
+    while True:
+        found = MATCHER.find_all(templates, confidence)
+        if appear and found:
+            return next(found[name] for name in templates if name in found)
+        if not appear and not found:
+            return True
+        if time.monotonic() >= deadline:
+            ic(f"Timed out waiting for {templates}.")
+            return False
+        time.sleep(poll_interval)
+
+
+def grab_reduced_screen() -> np.ndarray:
+    """Grayscale screenshot at a quarter of the resolution, which is
+    enough to see a page change and cheap to compare."""
+    return np.asarray(
+        pyautogui.screenshot().reduce(4).convert("L"), dtype=np.int16)
+
+
+def wait_for_screen_to_change(
+        before: np.ndarray,
+        timeout: float = STEP_TIMEOUT,
+        poll_interval: float = POLL_INTERVAL,
+        min_changed_fraction: float = MIN_CHANGED_FRACTION) -> bool:
+    """
+    DESCRIPTION:
+    Waits until the screen differs from a screenshot taken before a
+    click, so the page is known to have reacted to the click.
+
+    ARGS:
+    - before (np.ndarray): Screenshot from grab_reduced_screen.
+    - timeout (float): Longest time to wait in seconds.
+    - poll_interval (float): Seconds between screenshots.
+    - min_changed_fraction (float): Fraction of the pixels that must 
+    change.
+
+    RETURNS:
+    changed (bool): False if the screen did not change.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        changed = np.mean(np.abs(grab_reduced_screen() - before) > 16)
+        if changed >= min_changed_fraction:
+            return True
+        if time.monotonic() >= deadline:
+            ic("Timed out waiting for the screen to change.")
+            return False
+        time.sleep(poll_interval)
+
+
+def wait_for_screen_to_settle(
+        timeout: float = PAGE_LOAD_TIMEOUT,
+        poll_interval: float = POLL_INTERVAL,
+        settle_seconds: float = SETTLE_SECONDS) -> bool:
+    """
+    DESCRIPTION:
+    Waits until the screen stops changing, for steps with no element to
+    wait for, like a page loading after pressing enter. Screenshots are
+    compared at a quarter of the resolution, which is enough to see a
+    page change and cheap to compare.
+
+    ARGS:
+    - timeout (float): Longest time to wait in seconds.
+    - poll_interval (float): Seconds between screenshots.
+    - settle_seconds (float): Seconds the screen must be unchanged.
+
+    RETURNS:
+    settled (bool): False if the screen was still changing.
+    """
+    deadline = time.monotonic() + timeout
+    previous = None
+    unchanged_since = time.monotonic()
+    while time.monotonic() < deadline:
+        screen = grab_reduced_screen().tobytes()
+        now = time.monotonic()
+        if screen != previous:
+            previous = screen
+            unchanged_since = now
+        elif now - unchanged_since >= settle_seconds:
+            return True
+        time.sleep(poll_interval)
+    ic("Timed out waiting for the screen to settle.")
+    return False
+
+
+def scroll_until(
+        template: str,
+        timeout: float = STEP_TIMEOUT,
+        confidence: float = 0.9,
+        clicks: int = -5):
+    """Scrolls until the element is on screen. Returns its coordinate
+    object, otherwise False after the timeout."""
+    deadline = time.monotonic() + timeout
+    coordinate = find_area(template, confidence)
+    while not coordinate and time.monotonic() < deadline:
+        pyautogui.scroll(clicks)
+        coordinate = wait_for(
+            template, timeout=POLL_INTERVAL * 2, confidence=confidence)
+    return coordinate
 
 
 def find_areas_to_click(image_path, confidence=0.7, tolerance=20):
@@ -121,19 +268,10 @@ def find_areas_to_click(image_path, confidence=0.7, tolerance=20):
 
     I will likely need to train a more generalized model because image files will all
     look different, and these just happen to be for surfing videos right now.
-    """
-    locations = list(pyautogui.locateAllOnScreen(
-        image_path, confidence=confidence))
-
-    def is_nearby(coord1, coord2, tolerance):
-        return abs(coord1[0] - coord2[0]) < tolerance and abs(coord1[1] - coord2[1]) < tolerance
 
-    filtered_locations = []
-    for loc in locations:
-        if not any(is_nearby(loc, other, tolerance) for other in filtered_locations):
-            filtered_locations.append(loc)
-
-    return filtered_locations
+    Every match is found on one grayscale screenshot by the MATCHER.
+    """
+    return MATCHER.find_every(image_path, confidence, tolerance=tolerance)
 
 
 def delete_text_in_current_area():
@@ -181,50 +319,84 @@ def paste_in_current_area():
         pyautogui.press('v')
 
 
-def load_history(history: str = HISTORY) -> pd.DataFrame:
-    df = pd.read_csv(HISTORY, index_col=0)
-    return df
+def load_history(
+        history_store: str = HISTORY_STORE_PATH,
+        videos_dir: str = VIDEOS_DIR,
+        history_csv: str = HISTORY) -> pd.DataFrame:
+    """
+    DESCRIPTION:
+    Loads the ID and title of each video waiting to be uploaded. Only
+    these two columns are read, and each .mp4 video is looked up by its
+    INFERENCE_ID in the history store. Falls back to the batch CSV when
+    there is no history store.
 
+    ARGS:
+    - history_store (str): Path to the history store.
+    - videos_dir (str): Dir of the finished videos, named by ID.
+    - history_csv (str): Path to the batch CSV.
 
-def find_and_click_button(button_reference_image_path: str, confidence=0.9, button="LEFT"):
+    RETURNS:
+    df (pd.DataFrame): INFERENCE_ID and VIDEO_TITLE columns.
+    """
+    columns = ["INFERENCE_ID", "VIDEO_TITLE"]
+    if not os.path.exists(history_store):
+        return pd.read_csv(history_csv, usecols=columns)
+    if not os.path.isdir(videos_dir):
+        return pd.DataFrame(columns=columns)
+
+    from generate_youtube_videos.history import HistoryStore
+    inference_ids = sorted(
+        os.path.splitext(file_name)[0]
+        for file_name in os.listdir(videos_dir)
+        if file_name.endswith(".mp4")
+    )
+    history = HistoryStore(history_store)
+    try:
+        return history.read_columns(columns, inference_ids=inference_ids)
+    finally:
+        history.close()
+
+
+def find_and_click_button(
+        button_reference_image_path: str,
+        confidence=0.9,
+        button="LEFT",
+        timeout: float = STEP_TIMEOUT):
     """
     DESCRIPTION:
-    Finds and clicks a button.
+    Waits for a button to appear and clicks it. If it does not appear,
+    the window is brought to the front and the button looked for once
+    more.
 
     ARGS:
     - button_reference_image_path (str): Path to button image.
     - confidence (float): Confidence required to say a button is found.
+    - button (str): Mouse button to click with.
+    - timeout (float): Longest time to wait for the button in seconds.
 
     RETURNS:
     coordinate object if found, otherwise false.
     """
+    coordinate = wait_for(
+        button_reference_image_path, timeout=timeout, confidence=confidence)
+    if not coordinate:
+        bring_window_to_front()
+        switch_windows()
+        coordinate = wait_for(
+            button_reference_image_path, confidence=confidence)
+    if not coordinate:
+        return False
 
-    found_button = False
-    attempts = 0
-
-    while not found_button and attempts < 10:
-        time.sleep(3)
-        try:
-            coordinate = pyautogui.locateOnScreen(
-                button_reference_image_path, confidence=confidence)
-            found_button = True
-            center_x, center_y = apply_scaling_to_coordinate(coordinate)
-            pyautogui.moveTo(center_x, center_y)
-            pyautogui.click(button=button)
-            return coordinate
-        except Exception as e:
-            bring_window_to_front()
-            time.sleep(3)
-            switch_windows()
-            attempts += 1
-            confidence -= 0.1
-    return False
+    if MATCHER.recorder is not None:
+        MATCHER.recorder.record_click(button_reference_image_path, coordinate)
+    center_x, center_y = apply_scaling_to_coordinate(coordinate)
+    pyautogui.moveTo(center_x, center_y)
+    pyautogui.click(button=button)
+    return coordinate
 
 
 def pipeline():
 
-    time.sleep(5)
-
     df = load_history()
 
     PUBLISH_VIDEO = True
@@ -234,25 +406,23 @@ def pipeline():
     # find_and_click_button(NEXT_BUTTON, 0.6)
     find_and_click_button(CHROME_BUTTON, button="RIGHT")
 
-    time.sleep(3)
     find_and_click_button(INCOGNITIO_DARK, confidence=0.7)
 
-    time.sleep(3)
+    wait_for_screen_to_settle()
     pyperclip.copy(YOUTUBE_URL)
     paste_in_current_area()
-
-    time.sleep(3)
     press_key("enter")
 
-    time.sleep(3)
+    wait_for_screen_to_settle()
     pyperclip.copy(EMAIL)
     paste_in_current_area()
     press_key("enter")
 
-    time.sleep(3)
+    wait_for_screen_to_settle()
     pyperclip.copy(EMAIL_PASSWORD)
     paste_in_current_area()
     press_key("enter")
+    wait_for_screen_to_settle()
 
     for row in df.iterrows():
         ic(row[1].to_dict())
@@ -261,39 +431,31 @@ def pipeline():
 
         find_and_click_button(SEARCH_MAC_BUTTON_DARK, confidence=0.8)
 
-        time.sleep(1)
-
-        time.sleep(4)
-
         add_text_in_current_area(inference_id)
-
-        time.sleep(1)
-
         press_key("enter")
 
-        time.sleep(1)
-
         # Step #1: Find and click the create button.
         find_and_click_button(CREATE_BUTTON_DARK, 0.7)
         pyautogui.click()
-        time.sleep(2)
 
         # Step #2: Find and click the upload video button.
         find_and_click_button(UPLOAD_BUTTON_DARK, 0.7)
 
-        time.sleep(2)
-
         # Only need to zoom out once?
         # if not zoomed_out:
         #     zoom_out(4)
         #     zoomed_out = True
 
+        # The search results show the video file once the search is done.
         find_and_click_button(FILE_IMAGE_DARK)
 
-        time.sleep(1)
-
         # Pull video file into drag and drop upload spot.
-        drag_and_drop_coordinate = find_area(DRAG_AND_DROP_BUTTON_DARK, 0.8)
+        drag_and_drop_coordinate = wait_for(
+            DRAG_AND_DROP_BUTTON_DARK, confidence=0.8)
+        if not drag_and_drop_coordinate:
+            ic(f"No upload area for {inference_id}, skipping it.")
+            press_key("esc")
+            continue
         drag_to_coordinate(drag_and_drop_coordinate)
 
         if PUBLISH_VIDEO:
@@ -302,18 +464,20 @@ def pipeline():
 
             # find_and_click_button(TITLE_BUTTON_DARK, 0.7)
 
-            time.sleep(3)
+            # The details form opens with the title selected.
+            wait_for(
+                DESCRIPTION_BUTTON_DARK,
+                timeout=PAGE_LOAD_TIMEOUT,
+                confidence=0.7
+            )
             delete_text_in_current_area()
             title = row[1].to_dict()["VIDEO_TITLE"].strip('""')
             pyperclip.copy(title)
             # add_text_in_current_area(title)
             paste_in_current_area()
-            time.sleep(1)
             press_key("enter")
 
-            time.sleep(3)
             bring_window_to_front()
-            time.sleep(3)
 
             find_and_click_button(DESCRIPTION_BUTTON_DARK, 0.7)
             delete_text_in_current_area()
@@ -321,34 +485,29 @@ def pipeline():
             pyperclip.copy(VIDEO_DESCRIPTION)
             paste_in_current_area()
 
-            time.sleep(3)
-
-            pyautogui.scroll(-5)
-            while not find_area(MADE_FOR_KIDS_BUTTON_DARK, 0.6):
-                pyautogui.scroll(-5)
-                time.sleep(2)
+            scroll_until(MADE_FOR_KIDS_BUTTON_DARK, confidence=0.6)
 
             find_and_click_button(MADE_FOR_KIDS_BUTTON_DARK, 0.6)
 
-            time.sleep(2)
-            find_and_click_button(NEXT_BUTTON)
-            time.sleep(1)
-            find_and_click_button(NEXT_BUTTON)
-            time.sleep(1)
-            find_and_click_button(NEXT_BUTTON)
-
-            time.sleep(30)
-            find_and_click_button(PUBLIC_BUTTON_DARK)
-            time.sleep(3)
+            # The next button stays in place, so each step is waited for
+            # by the page changing after the click, then settling. The 
+            # screen can be settled before the click takes effect.
+            for _ in range(3):
+                before = grab_reduced_screen()
+                find_and_click_button(NEXT_BUTTON)
+                wait_for_screen_to_change(before)
+                wait_for_screen_to_settle()
+
+            find_and_click_button(
+                PUBLIC_BUTTON_DARK, timeout=UPLOAD_CHECKS_TIMEOUT)
             find_and_click_button(PUBLISH_BUTTON)
             find_and_click_button(EXIT_BUTTON)
 
         find_and_click_button(EXIT_BUTTON)
+        wait_for(EXIT_BUTTON, appear=False)
 
 
 def run_pipeline():
-    ic("Sleeping")
-    time.sleep(5)
     # Step #3: Local all video files.
     video_file_image_locations = find_areas_to_click(FILE_IMAGE)
 
@@ -358,20 +517,21 @@ def run_pipeline():
 
         # Step #2: Find and click the upload video button.
         find_and_click_button(UPLOAD_BUTTON)
-        time.sleep(3)
+        wait_for(DRAG_AND_DROP_BUTTON)
         ic(video_file_image_location)
         coordinate = move_to_coordinate(video_file_image_location)
         pyautogui.click()
-        time.sleep(2)
 
         # Pull video file into drag and drop upload spot.
-        drag_and_drop_coordinate = find_area(DRAG_AND_DROP_BUTTON)
+        drag_and_drop_coordinate = wait_for(DRAG_AND_DROP_BUTTON)
+        if not drag_and_drop_coordinate:
+            ic(f"No upload area for {video_file_image_location}, skipping it.")
+            press_key("esc")
+            continue
         drag_to_coordinate(drag_and_drop_coordinate)
 
-        time.sleep(3)
-
         if PUBLISH_VIDEO:
-            find_and_click_button(TITLE_BUTTON)
+            find_and_click_button(TITLE_BUTTON, timeout=PAGE_LOAD_TIMEOUT)
             delete_text_in_current_area()
             add_text_in_current_area("ANOTHER TEST")
 
@@ -379,30 +539,27 @@ def run_pipeline():
             delete_text_in_current_area()
             add_text_in_current_area("DESCRIPTION")
 
-            pyautogui.scroll(-20)
+            scroll_until(MADE_FOR_KIDS_BUTTON, clicks=-20)
             find_and_click_button(MADE_FOR_KIDS_BUTTON)
 
-            time.sleep(2)
-            find_and_click_button(NEXT_BUTTON)
-            time.sleep(1)
-            find_and_click_button(NEXT_BUTTON)
-            time.sleep(1)
-            find_and_click_button(NEXT_BUTTON)
+            for _ in range(3):
+                before = grab_reduced_screen()
+                find_and_click_button(NEXT_BUTTON)
+                wait_for_screen_to_change(before)
+                wait_for_screen_to_settle()
 
-            time.sleep(30)
-            find_and_click_button(PUBLIC_BUTTON)
-            time.sleep(3)
+            find_and_click_button(
+                PUBLIC_BUTTON, timeout=UPLOAD_CHECKS_TIMEOUT)
             find_and_click_button(PUBLISH_BUTTON)
             find_and_click_button(EXIT_BUTTON)
 
         find_and_click_button(EXIT_BUTTON)
+        wait_for(EXIT_BUTTON, appear=False)
 
 
 def main():
-    time.sleep(5)
     find_and_click_button(TERMINAL_DARK, button="RIGHT")
 
-    time.sleep(3)
     find_and_click_button(NEW_WINDOW_DARK, confidence=0.7)
 
     # zoom_out(5)
@@ -416,15 +573,10 @@ def main():
 
     #    delete_text_in_current_area()
 
-    #    time.sleep(2)
-
     # pyautogui.click()
     # pyautogui.hotkey('command', 'a', interval=0.1)
-    # time.sleep(1)
     # pyautogui.hotkey('ctrl', 'c')
 
-    # time.sleep(1)
-
     # clipboard_data = pyperclip.paste()
     # print(clipboard_data)
 
@@ -18,20 +18,24 @@ Typical usage example:
 """
 
 
+from __future__ import annotations
 from types import MappingProxyType
-import pandas as pd
 import random
 # from icecream import ic
-from generate_youtube_videos.configs import OPEN_AI_CLIENT
-from generate_youtube_videos.configs import GPT_VOICES
+from configs import get_open_ai_client
+from configs import GPT_VOICES
+from configs import TTS_MODEL
 from dataclasses import dataclass
 from typing import Iterable
 from typing import Callable
 from typing import Tuple
-import httpx
+from typing import TYPE_CHECKING
 from functools import partial
-from audio.helpers import first_order_function
-from audio.helpers import higher_order_function
+from generate_youtube_videos.audio.helpers import first_order_function
+from generate_youtube_videos.audio.helpers import higher_order_function
+
+if TYPE_CHECKING:
+    import httpx
 
 
 @dataclass(frozen=True)
@@ -72,10 +76,18 @@ def _pick_random_voice(voices: tuple = GPT_VOICES) -> str:
 
 @first_order_function
 def _get_script_and_id_tuples_from_csv(
-        job: SpeechJob) -> Tuple[Tuple[str, str], ...]:
-    """Gets the video 'scripts' generated by LLM stored in a csv."""
-    rows = pd.read_csv(job.script_csv_file).iterrows()
-    return tuple((row["VIDEO_SCRIPT"], row["INFERENCE_ID"]) for _, row in rows)
+        job: SpeechJob) -> Tuple[Tuple[str, str, str], ...]:
+    """Gets the video 'scripts' generated by LLM stored in a csv, with
+    the VOICE picked for each script. The VOICE is None for csv files 
+    without one. Only the columns needed are parsed."""
+    import pandas as pd
+    df = pd.read_csv(
+        job.script_csv_file,
+        usecols=lambda column: column in (
+            "VIDEO_SCRIPT", "INFERENCE_ID", "VOICE")
+    )
+    voices = df["VOICE"] if "VOICE" in df else (None,) * len(df)
+    return tuple(zip(df["VIDEO_SCRIPT"], df["INFERENCE_ID"], voices))
 
 
 # TODO: Move to a general helpers file.
@@ -96,7 +108,7 @@ def _map_with_multiple_args(function: Callable, iter: Iterable) -> tuple:
 @first_order_function
 def _call_open_ai_tts_api(job: SpeechApiData) -> httpx.Response:
     """Calls open AI API to generate speech, using job dataclass."""
-    tts_response = OPEN_AI_CLIENT.audio.speech.create(
+    tts_response = get_open_ai_client().audio.speech.create(
         model=job.model,
         voice=job.voice,
         input=job.input
@@ -118,12 +130,14 @@ def _create_open_ai_api_tts_job(
         job: SpeechJob,
         video_script: str,
         inference_id: str,
+        voice: str = None,
         pick_voice: Callable = _pick_random_voice) -> SpeechApiData:
     """Creates an API job dataclass, which is used to call OpenAI API.
-    """
+    Uses the voice recorded with the script, or picks one when there is
+    none."""
     job = SpeechApiData(
-        model="tts-1",
-        voice=pick_voice(),
+        model=TTS_MODEL,
+        voice=voice if isinstance(voice, str) else pick_voice(),
         input=video_script,
         inference_id=inference_id,
         speech_job=job
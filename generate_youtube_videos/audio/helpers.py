@@ -1,13 +1,13 @@
 from types import MappingProxyType
+import os
 import subprocess
 import time
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Callable
-from icecream import ic
-import inspect
-from google.cloud import storage
+from functools import lru_cache
 from functools import wraps
-from colorama import init, Fore, Style
 # from file_operations import pull_test_history_data_from_GCP
 # import tempfile
 # import os
@@ -31,14 +31,24 @@ COLOR_CODES = MappingProxyType(
 )
 
 
-# Initialize colorama
-init(autoreset=True)
+# Kinds of functions recorded by the instrumentation decorators.
+FIRST_ORDER = "FIRST ORDER"
+HIGHER_ORDER = "HIGHER ORDER"
+
+
+@lru_cache(maxsize=None)
+def init_colorama():
+    """Initialize colorama, the first time something is printed in color.
+    Returns the colorama module."""
+    import colorama
+    colorama.init(autoreset=True)
+    return colorama
 
 
-# TODO: Refactor this function (break into smaller functions).
 def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     """
-    Uploads a file to Google Cloud Storage
+    Uploads a file to Google Cloud Storage, using the shared storage 
+    client. Large files are uploaded in resumable chunks.
 
     Args:
     bucket_name (str): Name of the GCS bucket.
@@ -48,30 +58,26 @@ def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     Returns:
     str: GCS URL of the uploaded file
     """
-    # Initialize a storage client using your service account key
-    storage_client = storage.Client()
-
-    # Get the bucket object
-    bucket = storage_client.bucket(bucket_name)
-
-    # Create a new blob and upload the file's content to GCS
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
-
-    # The public URL can be used to access the file directly via HTTP
-    return f"gs://{bucket_name}/{destination_blob_name}"
+    from generate_youtube_videos.cloud_storage import get_bucket
+    from generate_youtube_videos.cloud_storage import upload_file
+    return upload_file(
+        get_bucket(bucket_name),
+        source_file_name,
+        destination_blob_name
+    )
 
 
 def get_function_name(func: Callable) -> str:
     return func.__name__
 
 
-def create_time_stamp() -> datetime:
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def create_time_stamp(timestamp: float = None) -> str:
+    return datetime.fromtimestamp(timestamp or time.time())\
+        .strftime("%Y-%m-%d %H:%M:%S")
 
 
-def get_time_now() -> time:
-    return time.time()
+def get_time_now() -> float:
+    return time.perf_counter()
 
 
 def print_in_color(message: str, color: str) -> None:
@@ -79,87 +85,131 @@ def print_in_color(message: str, color: str) -> None:
     print(color + message)
 
 
-def print_formatted_func_name(
-        func_name: str, color: str = COLOR_CODES["CYAN"]) -> None:
-    print_in_color(f"Function Name: {func_name}", color)
-
-
-def print_input_info(input_args, input_kwargs, input_types) -> None:
-    print("Input Arguments:")
-    ic(input_args)
-
-    print("Input Keyword Arugments:")
-    ic(input_kwargs)
-
-    print("Input Data Types:")
-    ic(input_types)
-
-
-def get_input_types(args, kwargs) -> list:
-    input_types = [type(arg).__name__ for arg in args]
-    input_types_kwargs =\
-        [f"{key}: {type(value).__name__}" for key, value in kwargs.items()]
-    return input_types + input_types_kwargs
-
-
-# TODO: Refactor this function (break into smaller functions).
-def wrapper_helper(func, *args, **kwargs):
-    func_name = get_function_name(func)
-    timestamp = create_time_stamp()
-    start_time = get_time_now()
-    print_formatted_func_name(func_name=func_name)
-    frame = inspect.currentframe()
-    outer_frames = inspect.getouterframes(frame)
-    file_path = outer_frames[1].filename
-    print(f"Source File: {file_path}")
-    print(f"Call Time: {timestamp}")
-
-    # Get input arguments and their types
-    input_args = args
-    input_kwargs = kwargs
-    input_types = get_input_types(args, kwargs)
-
-    print_input_info(input_args, input_kwargs, input_types)
-
-    # Execute the function and get the result
-    result = func(*args, **kwargs)
-    print("Output Data:")
-    ic(result)
-
-    # End time
-    end_time = get_time_now()
-    duration = end_time - start_time
-
-    # Get output type
-    output_type = type(result).__name__
-
-    # ic the collected information
-    print("Output Data Types:")
-    ic(output_type)
-    print(f"Execution Time: {duration}")
-    print()
+def summarize_value(value, max_length: int = 60) -> str:
+    """Short description of a value, without the full repr of large 
+    values like tuples of jobs."""
+    if isinstance(value, (bool, int, float)) or value is None:
+        return repr(value)
+    if isinstance(value, str):
+        text = repr(value)
+        if len(text) > max_length:
+            text = text[:max_length - 3] + "..."
+        return text
+    if isinstance(value, (tuple, list, dict, set, frozenset)):
+        return f"{type(value).__name__}[len={len(value)}]"
+    return type(value).__name__
+
+
+def summarize_arguments(args: tuple, kwargs: dict) -> tuple:
+    """Summarizes the positional and keyword arguments of a call."""
+    return tuple(summarize_value(arg) for arg in args) + tuple(
+        f"{key}={summarize_value(value)}" for key, value in kwargs.items())
+
+
+@dataclass(frozen=True)
+class CallRecord:
+    function: str
+    module: str
+    kind: str
+    call_time: float
+    duration: float
+    arguments: tuple
+    output_type: str
+    error: str = None
+
+
+class Instrumentation:
+    """Records calls of the decorated functions into a bounded buffer.
+
+    When disabled, the decorators only check the enabled attribute 
+    before calling the function. Enable it with the JELLYFISH_TRACE=1 
+    environment variable, or INSTRUMENTATION.enable().
+    """
 
-    return result
+    def __init__(self, enabled: bool = False, max_records: int = 10_000):
+        self.enabled = enabled
+        self.records = deque(maxlen=max_records)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def call(self, func: Callable, kind: str, args: tuple, kwargs: dict):
+        """Calls the function, and records its timing and arguments."""
+        call_time = time.time()
+        start_time = get_time_now()
+        result, error = None, None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            self.records.append(CallRecord(
+                function=get_function_name(func),
+                module=func.__module__,
+                kind=kind,
+                call_time=call_time,
+                duration=get_time_now() - start_time,
+                arguments=summarize_arguments(args, kwargs),
+                output_type=type(result).__name__,
+                error=error
+            ))
+
+    def drain(self) -> list:
+        """Removes and returns every record in the buffer."""
+        records = []
+        while self.records:
+            records.append(self.records.popleft())
+        return records
+
+
+INSTRUMENTATION = Instrumentation(
+    enabled=os.environ.get("JELLYFISH_TRACE") == "1")
+
+
+def print_call_records(records: list) -> None:
+    """Prints the recorded calls in color, for debugging."""
+    colorama = init_colorama()
+    for record in records:
+        color = colorama.Fore.YELLOW
+        if record.kind == HIGHER_ORDER:
+            color += colorama.Style.BRIGHT
+        print()
+        print_in_color(f"{record.kind} FUNCTION", color)
+        print_in_color(f"Function Name: {record.function}", COLOR_CODES["CYAN"])
+        print(f"Module: {record.module}")
+        print(f"Call Time: {create_time_stamp(record.call_time)}")
+        print(f"Input Arguments: {', '.join(record.arguments)}")
+        print(f"Output Data Type: {record.output_type}")
+        if record.error:
+            print(f"Error: {record.error}")
+        print(f"Execution Time: {record.duration}")
+
+
+def instrument(kind: str) -> Callable:
+    """Creates a decorator recording calls when instrumentation is on."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return func(*args, **kwargs)
+            return INSTRUMENTATION.call(func, kind, args, kwargs)
+        return wrapper
+    return decorator
 
 
 def first_order_function(func: Callable) -> Callable:
-    """Decorator used print useful messages for first order functions."""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        print()
-        print(Fore.YELLOW + f"FIRST ORDER FUNCTION")
-        return wrapper_helper(func, *args, **kwargs)
-    return wrapper
+    """Decorator used to record calls of first order functions."""
+    return instrument(FIRST_ORDER)(func)
 
 
 def higher_order_function(func: Callable) -> Callable:
-    """Decorator used print useful messages for higher order functions."""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        print()
-        print(Fore.YELLOW + Style.BRIGHT + f"HIGHER ORDER FUNCTION")
-        return wrapper_helper(func, *args, **kwargs)
-    return wrapper
+    """Decorator used to record calls of higher order functions."""
+    return instrument(HIGHER_ORDER)(func)
 
 
 @first_order_function
@@ -1,8 +1,7 @@
-from faster_whisper import WhisperModel
-from icecream import ic
-from audio.helpers import first_order_function
-from audio.helpers import higher_order_function
-from audio.helpers import run_ffmpeg_command
+from functools import lru_cache
+from generate_youtube_videos.audio.helpers import first_order_function
+from generate_youtube_videos.audio.helpers import higher_order_function
+from generate_youtube_videos.audio.helpers import run_ffmpeg_command
 
 SUBTITLES_TEMPLATE = "generate_youtube_videos/audio/subtitle_template.txt"
 
@@ -39,10 +38,19 @@ def get_audio_duration(audio_path: str) -> float:
     return duration
 
 
+@lru_cache(maxsize=None)
+def load_whisper_model(model_size: str = "small"):
+    """Loads the whisper model once, on the first transcription.
+    faster_whisper (CTranslate2) is only imported here, because it is 
+    slow to import."""
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_size)
+
+
 @first_order_function
 def extract_segments_and_info(audio: str) -> tuple:
     """"""
-    return WhisperModel("small").transcribe(audio)
+    return load_whisper_model().transcribe(audio)
 
 
 @higher_order_function
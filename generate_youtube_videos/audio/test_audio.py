@@ -26,6 +26,8 @@ from generate_youtube_videos.audio.generation import generate_raw_audio_files
 from generate_youtube_videos.audio.generation import _pick_random_voice
 from generate_youtube_videos.audio.generation import SpeechJob
 from generate_youtube_videos.audio.generation import SpeechApiData
+from generate_youtube_videos.audio.helpers import INSTRUMENTATION
+from generate_youtube_videos.audio.helpers import first_order_function
 import shutil
 from configs import TEST_DATA_BUCKET_GCP
 
@@ -278,6 +280,49 @@ def test_generate_subtitle_file_ass():
             assert found_sections == required_sections, message
 
 
+def test_instrumentation():
+    """DESCRIPTION:
+    Tests calls are only recorded when instrumentation is enabled, and
+    that large arguments are summarized instead of printed in full. 
+    Includes a call of the audio operations, which must be decorated 
+    through the same helpers module the switch is on.
+    Has no I/O operations.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    @first_order_function
+    def add(a, b):
+        return a + b
+
+    was_enabled = INSTRUMENTATION.enabled
+    INSTRUMENTATION.drain()
+    try:
+        INSTRUMENTATION.disable()
+        add(1, 2)
+        message = "Call was recorded while instrumentation was disabled."
+        assert not INSTRUMENTATION.drain(), message
+
+        INSTRUMENTATION.enable()
+        message = "Decorated function returned the wrong result."
+        assert add((1,) * 1000, (2,)) == (1,) * 1000 + (2,), message
+        records = INSTRUMENTATION.drain()
+        message = "Call was not recorded while instrumentation was enabled."
+        assert len(records) == 1 and records[0].function == "add", message
+        message = "Tuple argument was not summarized."
+        assert records[0].arguments == ("tuple[len=1000]", "tuple[len=1]"),\
+            message
+
+        format_time_ass(61.5)
+        records = INSTRUMENTATION.drain()
+        message = "Calls of the audio operations were not recorded."
+        assert [record.function for record in records] == ["format_time_ass"],\
+            message
+    finally:
+        INSTRUMENTATION.enabled = was_enabled
+
+
 def main():
     pass
 
@@ -0,0 +1,543 @@
+"""Pulls the clicks published by the redirect app, and stores them for
+reports joined with the history.
+
+Clicks are pulled from the Pub/Sub subscription in batches. Each batch
+is written as one chunk of numpy columns (INFERENCE_ID, TIMESTAMP,
+COUNT), with the IDs dictionary encoded, and the per INFERENCE_ID click
+counters are updated in the same SQLite transaction that lists the
+chunk. Messages are acknowledged after the transaction commits, so a
+crash loses no clicks. The IDs of the stored messages are kept, so
+redelivered messages are not counted twice.
+
+Reports read only the chunk columns, aggregate the clicks per video
+with numpy before joining, and join the few thousand videos of the
+history instead of the millions of clicks.
+
+LocalSubscriber is a stand-in with the parts of the Pub/Sub
+SubscriberClient used here, for tests.
+
+Typical usage example:
+
+    store = ClickStore(os.path.join(STATE_DIR, CLICKS_DIR))
+    ClickSubscriber(get_subscriber(), store).drain()
+    report = daily_report(store, history)
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from datetime import timezone
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+from configs import GCP_PROJECT_ID
+from configs import STATE_DIR
+from configs import HISTORY_STORE
+from configs import CLICKS_DIR
+from configs import CLICKED_LINK_SUBSCRIPTION_ID
+from configs import CLICK_PULL_MAX_MESSAGES
+from configs import CLICK_PULL_TIMEOUT
+from configs import CLICK_MESSAGE_RETENTION_DAYS
+from generate_youtube_videos.history import HistoryStore
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+# Message formats of the redirect app, see redirect_app/click_aggregator.py.
+RAW_FORMAT = "CLICK_JSON"
+COUNTS_FORMAT = "CLICK_COUNTS_MSGPACK"
+
+# Pub/Sub raises DeadlineExceeded (504) when no message arrives in time.
+DEADLINE_EXCEEDED = 504
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def get_subscriber():
+    """Pub/Sub subscriber client, imported here as it is slow to import."""
+    from google.cloud import pubsub_v1
+    return pubsub_v1.SubscriberClient()
+
+
+def decode_clicks(data: bytes, attributes: dict, publish_time: float) -> list:
+    """DESCRIPTION:
+    Decodes a message of the redirect app into clicks.
+
+    ARGS:
+    - data (bytes): Message data.
+    - attributes (dict): Message attributes, FORMAT is the format of
+    the data. Messages from before the FORMAT attribute are raw clicks.
+    - publish_time (float): Unix time the message was published.
+
+    RETURNS:
+    clicks (list): (INFERENCE_ID, TIMESTAMP, COUNT) tuples.
+    """
+    message_format = attributes.get("FORMAT", RAW_FORMAT)
+    if message_format == RAW_FORMAT:
+        return [(json.loads(data)["INFERENCE_ID"], publish_time, 1)]
+    if message_format == COUNTS_FORMAT:
+        import msgpack
+        record = msgpack.unpackb(data)
+        return [
+            (inference_id, record["WINDOW_END"], count)
+            for inference_id, count in record["COUNTS"].items()
+        ]
+    raise ValueError(f"Unknown click message format: {message_format}")
+
+
+class ClickStore:
+    """Clicks in chunks of numpy columns, listed in a SQLite database
+    with the click counters of each INFERENCE_ID."""
+
+    def __init__(
+            self,
+            directory: str,
+            retention_days: float = CLICK_MESSAGE_RETENTION_DAYS):
+        self.directory = directory
+        self.chunks_dir = os.path.join(directory, "chunks")
+        self.retention_days = retention_days
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "clicks.sqlite3"))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "NAME TEXT PRIMARY KEY, "
+                "NUM_ROWS INTEGER NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS click_counts ("
+                "INFERENCE_ID TEXT PRIMARY KEY, "
+                "CLICKS INTEGER NOT NULL, "
+                "LAST_CLICK REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "MESSAGE_KEY TEXT PRIMARY KEY, "
+                "RECEIVED REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS messages_received "
+                "ON messages (RECEIVED)"
+            )
+        self._remove_unlisted_chunks()
+
+    def _chunk_names(self) -> list:
+        return [
+            name for (name,) in self._connection.execute(
+                "SELECT NAME FROM chunks ORDER BY ROWID")
+        ]
+
+    def _remove_unlisted_chunks(self) -> None:
+        """Chunks written by a batch that did not commit are deleted,
+        their messages were not acknowledged and are pulled again."""
+        listed = set(self._chunk_names())
+        for name in os.listdir(self.chunks_dir):
+            if name not in listed:
+                os.remove(os.path.join(self.chunks_dir, name))
+
+    def _save_chunk(self, ids, codes, timestamps, counts) -> str:
+        """Writes the columns of a chunk, the INFERENCE_IDs as the
+        unique ids and the int32 code of each click."""
+        import numpy as np
+        name = f"{uuid.uuid4().hex}.npz"
+        path = os.path.join(self.chunks_dir, name)
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                IDS=np.asarray(ids, dtype=str),
+                INFERENCE_ID=np.asarray(codes, dtype=np.int32),
+                TIMESTAMP=np.asarray(timestamps, dtype=np.float64),
+                COUNT=np.asarray(counts, dtype=np.int32),
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        return name
+
+    def _write_chunk(self, clicks: list) -> str:
+        import numpy as np
+        inference_ids, timestamps, counts = zip(*clicks)
+        ids, codes = np.unique(np.array(inference_ids), return_inverse=True)
+        return self._save_chunk(ids, codes, timestamps, counts)
+
+    def insert_batch(self, messages: list) -> int:
+        """DESCRIPTION:
+        Stores the clicks of a batch of messages in one chunk, and
+        updates the counters, in one transaction. Messages already
+        stored are skipped.
+
+        ARGS:
+        - messages (list): (MESSAGE_KEY, clicks) tuples, the clicks as
+        returned by decode_clicks.
+
+        RETURNS:
+        num_clicks (int): Clicks stored, counting the COUNT of each.
+        """
+        now = time.time()
+        with self._connection:
+            clicks = []
+            for key, message_clicks in messages:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO messages (MESSAGE_KEY, RECEIVED) "
+                    "VALUES (?, ?)",
+                    (key, now)
+                )
+                if cursor.rowcount:
+                    clicks.extend(message_clicks)
+            self._connection.execute(
+                "DELETE FROM messages WHERE RECEIVED < ?",
+                (now - self.retention_days * SECONDS_PER_DAY,)
+            )
+            if not clicks:
+                return 0
+
+            name = self._write_chunk(clicks)
+            self._connection.execute(
+                "INSERT INTO chunks (NAME, NUM_ROWS) VALUES (?, ?)",
+                (name, len(clicks))
+            )
+            totals = {}
+            for inference_id, timestamp, count in clicks:
+                clicks_so_far, last_click = totals.get(inference_id, (0, 0.0))
+                totals[inference_id] =\
+                    (clicks_so_far + count, max(last_click, timestamp))
+            self._connection.executemany(
+                "INSERT INTO click_counts (INFERENCE_ID, CLICKS, LAST_CLICK) "
+                "VALUES (?, ?, ?) ON CONFLICT (INFERENCE_ID) DO UPDATE SET "
+                "CLICKS = CLICKS + excluded.CLICKS, "
+                "LAST_CLICK = MAX(LAST_CLICK, excluded.LAST_CLICK)",
+                [
+                    (inference_id, count, last_click)
+                    for inference_id, (count, last_click) in totals.items()
+                ]
+            )
+        return sum(count for _, _, count in clicks)
+
+    def counts(self) -> dict:
+        """Total clicks of each INFERENCE_ID, without reading the
+        chunks."""
+        return dict(self._connection.execute(
+            "SELECT INFERENCE_ID, CLICKS FROM click_counts"))
+
+    def read_clicks(self) -> pd.DataFrame:
+        """DESCRIPTION:
+        Reads every click, with the INFERENCE_IDs as a categorical
+        column, which keeps millions of clicks small in memory.
+
+        ARGS: None
+
+        RETURNS:
+        df (pd.DataFrame): INFERENCE_ID, TIMESTAMP and COUNT columns.
+        """
+        import numpy as np
+        import pandas as pd
+        from pandas.api.types import union_categoricals
+
+        ids, timestamps, counts = [], [], []
+        for name in self._chunk_names():
+            with np.load(os.path.join(self.chunks_dir, name)) as chunk:
+                ids.append(pd.Categorical.from_codes(
+                    chunk["INFERENCE_ID"], categories=chunk["IDS"]))
+                timestamps.append(chunk["TIMESTAMP"])
+                counts.append(chunk["COUNT"])
+
+        if not ids:
+            return pd.DataFrame({
+                "INFERENCE_ID": pd.Categorical([]),
+                "TIMESTAMP": np.array([], dtype=np.float64),
+                "COUNT": np.array([], dtype=np.int32),
+            })
+        return pd.DataFrame({
+            "INFERENCE_ID": union_categoricals(ids),
+            "TIMESTAMP": np.concatenate(timestamps),
+            "COUNT": np.concatenate(counts),
+        })
+
+    def compact(self) -> int:
+        """DESCRIPTION:
+        Merges the chunks into one, so reads open one file instead of
+        one per batch.
+
+        ARGS: None
+
+        RETURNS:
+        num_rows (int): Rows in the merged chunk.
+        """
+        old_names = self._chunk_names()
+        if len(old_names) < 2:
+            (num_rows,) = self._connection.execute(
+                "SELECT COALESCE(SUM(NUM_ROWS), 0) FROM chunks").fetchone()
+            return num_rows
+        clicks = self.read_clicks()
+        inference_ids = clicks["INFERENCE_ID"].cat
+        with self._connection:
+            name = self._save_chunk(
+                inference_ids.categories,
+                inference_ids.codes,
+                clicks["TIMESTAMP"],
+                clicks["COUNT"]
+            )
+            self._connection.executemany(
+                "DELETE FROM chunks WHERE NAME = ?",
+                [(old_name,) for old_name in old_names]
+            )
+            self._connection.execute(
+                "INSERT INTO chunks (NAME, NUM_ROWS) VALUES (?, ?)",
+                (name, len(clicks))
+            )
+        for old_name in old_names:
+            os.remove(os.path.join(self.chunks_dir, old_name))
+        return len(clicks)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def publish_timestamp(message) -> float:
+    """Unix time a Pub/Sub message was published."""
+    publish_time = message.publish_time
+    if isinstance(publish_time, datetime):
+        return publish_time.timestamp()
+    return float(publish_time)
+
+
+class ClickSubscriber:
+    """Pulls click messages in batches into a ClickStore."""
+
+    def __init__(
+            self,
+            subscriber,
+            store: ClickStore,
+            subscription_path: str = None,
+            max_messages: int = CLICK_PULL_MAX_MESSAGES,
+            timeout: float = CLICK_PULL_TIMEOUT):
+        self.subscriber = subscriber
+        self.store = store
+        self.subscription_path = subscription_path or\
+            subscriber.subscription_path(
+                GCP_PROJECT_ID, CLICKED_LINK_SUBSCRIPTION_ID)
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.clicks = 0
+        self.invalid = 0
+
+    def pull_once(self) -> int:
+        """DESCRIPTION:
+        Pulls a batch of messages, stores their clicks, and then
+        acknowledges them. Messages that can not be decoded are logged
+        and acknowledged, so they are not redelivered forever.
+
+        ARGS: None
+
+        RETURNS:
+        num_messages (int): Messages pulled, 0 when none are left.
+        """
+        try:
+            response = self.subscriber.pull(
+                request={
+                    "subscription": self.subscription_path,
+                    "max_messages": self.max_messages,
+                },
+                timeout=self.timeout
+            )
+        except Exception as e:
+            if getattr(e, "code", None) == DEADLINE_EXCEEDED:
+                return 0
+            raise
+        received = list(response.received_messages)
+        if not received:
+            return 0
+
+        messages = []
+        for received_message in received:
+            message = received_message.message
+            attributes = dict(message.attributes)
+            try:
+                clicks = decode_clicks(
+                    message.data, attributes, publish_timestamp(message))
+            except Exception as e:
+                LOGGER.error(
+                    "Click message %s not decoded: %s", message.message_id, e)
+                self.invalid += 1
+                continue
+            # Clicks republished from the spool of the redirect app get
+            # a new message ID, but keep their SPOOL_ID.
+            key = f"SPOOL:{attributes['SPOOL_ID']}"\
+                if "SPOOL_ID" in attributes else message.message_id
+            messages.append((key, clicks))
+
+        self.clicks += self.store.insert_batch(messages)
+        self.subscriber.acknowledge(request={
+            "subscription": self.subscription_path,
+            "ack_ids": [
+                received_message.ack_id for received_message in received
+            ],
+        })
+        return len(received)
+
+    def drain(self, max_batches: int = None) -> int:
+        """Pulls batches until the subscription is empty, or max_batches
+        were pulled. Returns the number of clicks stored."""
+        start_clicks = self.clicks
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            if not self.pull_once():
+                break
+            batches += 1
+        return self.clicks - start_clicks
+
+
+def read_videos(history: HistoryStore) -> pd.DataFrame:
+    """Columns of the history that clicks are reported by, with the
+    TOPIC of each video found from its prompt. The TOPIC is "unknown" 
+    when the history has no prompts yet."""
+    from generate_youtube_videos.text.prompts import prompt_combinations
+    columns = [
+        column for column in (
+            "INFERENCE_ID", "VIDEO_TITLE", "VIDEO_SCRIPT_PROMPT", "VOICE",
+            "COST_OF_INFERENCE", "VIEWS")
+        if column in history.columns()
+    ]
+    videos = history.read_columns(columns)
+    if "VIDEO_SCRIPT_PROMPT" not in videos:
+        videos["TOPIC"] = "unknown"
+        return videos
+    topics = {
+        prompt: topic
+        for prompt, (topic, _) in prompt_combinations().items()
+    }
+    videos["TOPIC"] = videos["VIDEO_SCRIPT_PROMPT"].map(topics)\
+        .fillna("unknown")
+    return videos
+
+
+def join_history(
+        clicks: pd.DataFrame,
+        history: HistoryStore) -> pd.DataFrame:
+    """DESCRIPTION:
+    Sums the clicks of each video per day, and joins the title, voice,
+    topic and cost of the videos from the history.
+
+    ARGS:
+    - clicks (pd.DataFrame): Clicks as returned by read_clicks.
+    - history (HistoryStore)
+
+    RETURNS:
+    df (pd.DataFrame): One row per video and DAY, with its CLICKS.
+    """
+    import numpy as np
+    import pandas as pd
+    days = (clicks["TIMESTAMP"].to_numpy() // SECONDS_PER_DAY)\
+        .astype(np.int64)
+    per_video = pd.DataFrame({
+        "INFERENCE_ID": clicks["INFERENCE_ID"],
+        "DAY": days,
+        "CLICKS": clicks["COUNT"],
+    }).groupby(["INFERENCE_ID", "DAY"], observed=True, as_index=False)\
+        ["CLICKS"].sum()
+    per_video["INFERENCE_ID"] = per_video["INFERENCE_ID"].astype(str)
+    per_video["DAY"] = pd.to_datetime(per_video["DAY"], unit="D").dt.date
+
+    return per_video.merge(
+        read_videos(history), on="INFERENCE_ID", how="left")\
+        .fillna({"TOPIC": "unknown"})
+
+
+def daily_report(store: ClickStore, history: HistoryStore) -> pd.DataFrame:
+    """DESCRIPTION:
+    Clicks by day and topic, with the clicks per video clicked and the
+    cost of those videos per click. The click through rate is added
+    when the history has the VIEWS of each video.
+
+    ARGS:
+    - store (ClickStore)
+    - history (HistoryStore)
+
+    RETURNS:
+    df (pd.DataFrame)
+    """
+    joined = join_history(store.read_clicks(), history)
+    aggregations = {
+        "CLICKS": ("CLICKS", "sum"),
+        "VIDEOS_CLICKED": ("INFERENCE_ID", "nunique"),
+    }
+    if "COST_OF_INFERENCE" in joined:
+        aggregations["COST_OF_VIDEOS"] = ("COST_OF_INFERENCE", "sum")
+    if "VIEWS" in joined:
+        aggregations["VIEWS"] = ("VIEWS", "sum")
+
+    report = joined.groupby(["DAY", "TOPIC"], as_index=False)\
+        .agg(**aggregations)
+    report["CLICKS_PER_VIDEO"] = report["CLICKS"] / report["VIDEOS_CLICKED"]
+    if "COST_OF_VIDEOS" in report:
+        report["COST_PER_CLICK"] = report["COST_OF_VIDEOS"] / report["CLICKS"]
+    if "VIEWS" in report:
+        report["CTR"] = report["CLICKS"] / report["VIEWS"]
+    return report.sort_values(["DAY", "CLICKS"], ascending=[True, False])\
+        .reset_index(drop=True)
+
+
+class LocalSubscriber:
+    """Stand-in for the Pub/Sub SubscriberClient. Pulled messages stay
+    outstanding until acknowledged, and expire() redelivers them like
+    an ack deadline passing."""
+
+    def __init__(self):
+        self.acknowledged = 0
+        self._queue = deque()
+        self._outstanding = {}
+        self._next_id = 0
+
+    def subscription_path(self, project: str, subscription: str) -> str:
+        return f"projects/{project}/subscriptions/{subscription}"
+
+    def publish(self, data: bytes, publish_time: float = None, **attributes):
+        """Adds a message to the subscription."""
+        self._next_id += 1
+        self._queue.append(SimpleNamespace(
+            data=data,
+            attributes=attributes,
+            message_id=str(self._next_id),
+            publish_time=datetime.fromtimestamp(
+                publish_time if publish_time is not None else time.time(),
+                tz=timezone.utc
+            ),
+        ))
+
+    def pull(self, request: dict, timeout: float = None):
+        received = []
+        while self._queue and len(received) < request["max_messages"]:
+            message = self._queue.popleft()
+            ack_id = f"ack-{message.message_id}-{uuid.uuid4().hex[:8]}"
+            self._outstanding[ack_id] = message
+            received.append(SimpleNamespace(ack_id=ack_id, message=message))
+        return SimpleNamespace(received_messages=received)
+
+    def acknowledge(self, request: dict) -> None:
+        for ack_id in request["ack_ids"]:
+            if self._outstanding.pop(ack_id, None) is not None:
+                self.acknowledged += 1
+
+    def expire(self) -> None:
+        """Redelivers the messages not acknowledged."""
+        self._queue.extendleft(reversed(list(self._outstanding.values())))
+        self._outstanding.clear()
+
+
+def main():
+    store = ClickStore(os.path.join(STATE_DIR, CLICKS_DIR))
+    subscriber = ClickSubscriber(get_subscriber(), store)
+    print(f"Stored {subscriber.drain()} clicks.")
+    history = HistoryStore(os.path.join(STATE_DIR, HISTORY_STORE))
+    print(daily_report(store, history).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Parallel transfers to and from Google Cloud Storage.
+
+One storage client is shared by every transfer, instead of creating a
+new client per call. Files are transferred concurrently with a thread
+pool, large files are uploaded in chunks with resumable uploads, and
+files that are unchanged (same md5, or crc32c for composite objects)
+are skipped in both directions.
+
+LocalBucket is a stand-in backed by a local directory, with the parts
+of the google.cloud.storage Bucket and Blob interface used here, so
+transfers can be tested without GCP.
+
+Typical usage example:
+
+    bucket = get_bucket(TEST_DATA_BUCKET_GCP)
+    audio_files = download_blobs(bucket, "Jellyfish/RAW_AUDIO/", temp_dir,
+                                 suffix=".mp3")
+    sync_directory_to_bucket(bucket, "Jellyfish/VIDEOS_WITH_SUBTITLES",
+                             "Jellyfish/VIDEOS_WITH_SUBTITLES/")
+"""
+import base64
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from configs import MAX_TRANSFER_WORKERS
+from configs import UPLOAD_CHUNK_SIZE
+from configs import CHUNKED_UPLOAD_THRESHOLD
+
+# Read files in blocks when hashing, so large videos are not loaded
+# into memory.
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_storage_client():
+    """Storage client shared by every transfer. Its connection pool is
+    sized for the number of transfer workers."""
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+    client = storage.Client()
+    adapter = HTTPAdapter(
+        pool_connections=MAX_TRANSFER_WORKERS,
+        pool_maxsize=MAX_TRANSFER_WORKERS
+    )
+    client._http.mount("https://", adapter)
+    return client
+
+
+def get_bucket(bucket_name: str):
+    """Gets a bucket using the shared storage client."""
+    return get_storage_client().bucket(bucket_name)
+
+
+def file_md5_base64(path: str) -> str:
+    """Base64 encoded md5 of a file, the format GCS uses for md5_hash."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            md5.update(block)
+    return base64.b64encode(md5.digest()).decode("utf-8")
+
+
+def file_crc32c_base64(path: str) -> str:
+    """Base64 encoded crc32c of a file, the format GCS uses for crc32c."""
+    import google_crc32c
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            checksum.update(block)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+def is_unchanged(blob, local_path: str) -> bool:
+    """DESCRIPTION:
+    Checks if a local file has the same content as a blob. Sizes are
+    compared first, so files are only hashed when the sizes match.
+    Composite objects have no md5, so their crc32c is compared instead.
+
+    ARGS:
+    - blob: Blob with its metadata loaded (from list_blobs or get_blob).
+    - local_path (str): Path to the local file.
+
+    RETURNS:
+    bool
+    """
+    if blob is None or not os.path.exists(local_path):
+        return False
+    if blob.size is not None and blob.size != os.path.getsize(local_path):
+        return False
+    if blob.md5_hash:
+        return blob.md5_hash == file_md5_base64(local_path)
+    if blob.crc32c:
+        return blob.crc32c == file_crc32c_base64(local_path)
+    return False
+
+
+def download_blob(blob, local_path: str) -> str:
+    """Downloads a blob, unless the local file is unchanged."""
+    if not is_unchanged(blob, local_path):
+        directory = os.path.dirname(local_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        blob.download_to_filename(local_path)
+    return local_path
+
+
+def download_blobs(
+        bucket,
+        prefix: str,
+        dest_dir: str,
+        suffix: str = None,
+        file_name: str = None,
+        max_workers: int = MAX_TRANSFER_WORKERS) -> list:
+    """DESCRIPTION:
+    Downloads every blob under a prefix into a directory, in parallel.
+    Files already in the directory with the same content are skipped.
+
+    ARGS:
+    - bucket: GCS bucket, or a LocalBucket stand-in.
+    - prefix (str): Only blobs with names starting with this prefix.
+    - dest_dir (str): Directory to download the files into.
+    - suffix (str): Only blobs with names ending with this suffix.
+    - file_name (str): Only blobs with this base name.
+    - max_workers (int): Number of concurrent downloads.
+
+    RETURNS:
+    local_paths (list): Paths of the downloaded files, in blob order.
+    """
+    blobs = []
+    for blob in bucket.list_blobs(prefix=prefix):
+        name = os.path.basename(blob.name)
+        if not name:
+            # Folder placeholder objects.
+            continue
+        if suffix and not name.endswith(suffix):
+            continue
+        if file_name and name != file_name:
+            continue
+        blobs.append(blob)
+
+    local_paths = [
+        os.path.join(dest_dir, os.path.basename(blob.name)) for blob in blobs
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download_blob, blobs, local_paths))
+
+
+def upload_file(
+        bucket,
+        source_file_name: str,
+        destination_blob_name: str,
+        skip_unchanged: bool = True) -> str:
+    """DESCRIPTION:
+    Uploads a file to a bucket. Files larger than the chunked upload
+    threshold are uploaded with a resumable upload in chunks, so a
+    failed request only retries one chunk of a large video.
+
+    ARGS:
+    - bucket: GCS bucket, or a LocalBucket stand-in.
+    - source_file_name (str): Path to the file to upload.
+    - destination_blob_name (str): The desired name for the file in the
+    bucket.
+    - skip_unchanged (bool): Skip the upload when the blob already has
+    the same content.
+
+    RETURNS:
+    str: GCS URL of the uploaded file
+    """
+    url = f"gs://{bucket.name}/{destination_blob_name}"
+
+    if skip_unchanged:
+        existing_blob = bucket.get_blob(destination_blob_name)
+        if is_unchanged(existing_blob, source_file_name):
+            return url
+
+    blob = bucket.blob(destination_blob_name)
+    if os.path.getsize(source_file_name) > CHUNKED_UPLOAD_THRESHOLD:
+        blob.chunk_size = UPLOAD_CHUNK_SIZE
+    blob.upload_from_filename(source_file_name)
+    return url
+
+
+def upload_files(
+        bucket,
+        files: list,
+        max_workers: int = MAX_TRANSFER_WORKERS,
+        skip_unchanged: bool = True) -> list:
+    """DESCRIPTION:
+    Uploads files to a bucket in parallel.
+
+    ARGS:
+    - bucket: GCS bucket, or a LocalBucket stand-in.
+    - files (list): Tuples of (source_file_name, destination_blob_name).
+    - max_workers (int): Number of concurrent uploads.
+    - skip_unchanged (bool): Skip blobs that already have the same content.
+
+    RETURNS:
+    urls (list): GCS URLs of the uploaded files, in the same order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(upload_file, bucket, source, destination,
+                            skip_unchanged)
+            for source, destination in files
+        ]
+        return [future.result() for future in futures]
+
+
+def sync_directory_to_bucket(
+        bucket,
+        local_dir: str,
+        prefix: str,
+        max_workers: int = MAX_TRANSFER_WORKERS) -> list:
+    """DESCRIPTION:
+    Uploads every file in a local directory (recursively) under a
+    prefix in the bucket, skipping files that are unchanged.
+
+    ARGS:
+    - bucket: GCS bucket, or a LocalBucket stand-in.
+    - local_dir (str): Directory to upload, for example
+    VIDEOS_WITH_SUBTITLES or HISTORY.
+    - prefix (str): Prefix of the blob names in the bucket.
+    - max_workers (int): Number of concurrent uploads.
+
+    RETURNS:
+    urls (list): GCS URLs of the files in the directory.
+    """
+    files = []
+    for root, _, file_names in os.walk(local_dir):
+        for file_name in sorted(file_names):
+            source = os.path.join(root, file_name)
+            relative_path = os.path.relpath(source, local_dir)
+            destination = prefix + relative_path.replace(os.sep, "/")
+            files.append((source, destination))
+    return upload_files(bucket, files, max_workers=max_workers)
+
+
+class LocalBlob:
+    """Stand-in for a GCS blob, stored as a file under a LocalBucket."""
+
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.bucket.root, *self.name.split("/"))
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path) if self.exists() else None
+
+    @property
+    def md5_hash(self) -> str:
+        return file_md5_base64(self.path) if self.exists() else None
+
+    @property
+    def crc32c(self) -> str:
+        return file_crc32c_base64(self.path) if self.exists() else None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def download_to_filename(self, filename: str) -> None:
+        self.bucket.downloads.append(self.name)
+        shutil.copyfile(self.path, filename)
+
+    def upload_from_filename(self, filename: str) -> None:
+        self.bucket.uploads.append(self.name)
+        self.bucket.chunk_sizes[self.name] = self.chunk_size
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def delete(self) -> None:
+        os.remove(self.path)
+
+
+class LocalBucket:
+    """Stand-in for a GCS bucket, backed by a local directory. Keeps
+    the names of the blobs transferred, so tests can check which
+    transfers were skipped, and the chunk size of each upload."""
+
+    def __init__(self, root: str, name: str = "local-bucket"):
+        self.root = root
+        self.name = name
+        self.downloads = []
+        self.uploads = []
+        self.chunk_sizes = {}
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+    def get_blob(self, name: str) -> LocalBlob:
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix: str = "") -> list:
+        blobs = []
+        for root, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    blobs.append(LocalBlob(self, name))
+        return sorted(blobs, key=lambda blob: blob.name)
@@ -1,27 +1,149 @@
 import json
-import openai
-from openai import OpenAI
 import os
-from icecream import ic
+from dataclasses import dataclass
+from functools import lru_cache
 
 # Configs file can be edited to adjust prompts, voices and more.
-config_path = "video_domains/jellyfish_domain/configs.json"
-with open(config_path, 'r') as file:
-    configs = json.load(file)
+CONFIG_PATH = "video_domains/jellyfish_domain/configs.json"
+SECRETS_PATH = "./secrets.json"
+
+
+@dataclass(frozen=True)
+class Settings:
+    gpt_voices: tuple
+    gpt_base_model: str
+    tts_model: str
+    model_prices: dict
+    video_topics: tuple
+    topic_weights: dict
+    question_rules: str
+    questions: tuple
+    create_title_prompt: dict
+    create_script_and_title_prompt: str
+    spreadsheet_id: str
+    google_sheet_name: str
+
+
+@lru_cache(maxsize=None)
+def get_settings(config_path: str = CONFIG_PATH) -> Settings:
+    """DESCRIPTION:
+    Loads the domain configs into a typed settings object. Only reads 
+    the local configs file, so it is safe to call at import time.
+
+    ARGS:
+    - config_path (str): Path to the domain configs.json.
+
+    RETURNS:
+    settings (Settings)
+    """
+    with open(config_path, 'r') as file:
+        configs = json.load(file)
+
+    return Settings(
+        gpt_voices=tuple(configs["GPT_VOICES"]),
+        gpt_base_model=configs["GPT_BASE_MODEL"],
+        tts_model=configs["TTS_MODEL"],
+        model_prices=configs["MODEL_PRICES"],
+        video_topics=tuple(configs["VIDEO_TOPICS"]),
+        topic_weights=configs.get("TOPIC_WEIGHTS", {}),
+        question_rules=configs["QUESTION_RULES"],
+        questions=tuple(configs["QUESTIONS"]),
+        create_title_prompt=configs["CREATE_TITLE_PROMPT"],
+        create_script_and_title_prompt=configs[
+            "CREATE_SCRIPT_AND_TITLE_PROMPT"],
+        spreadsheet_id=configs["SPREADSHEET_ID"],
+        google_sheet_name=configs["GOOGLE_SHEET_NAME"],
+    )
+
+
+@lru_cache(maxsize=None)
+def get_secrets(secrets_path: str = SECRETS_PATH) -> dict:
+    """DESCRIPTION:
+    Loads the secrets file the first time a secret is needed. Secrets 
+    set as environment variables are used when there is no file.
+
+    ARGS:
+    - secrets_path (str): Path to secrets.json.
+
+    RETURNS:
+    secrets (dict)
+    """
+    secrets = {}
+    if os.path.exists(secrets_path):
+        with open(secrets_path, 'r') as file:
+            secrets = json.load(file)
+
+    for name in ("OPENAI_API_KEY", "GPT_ASSISTANT_ID"):
+        if name not in secrets and name in os.environ:
+            secrets[name] = os.environ[name]
+
+    return secrets
+
+
+def get_secret(name: str) -> str:
+    """Gets a single secret, raising a KeyError naming the secret."""
+    secrets = get_secrets()
+    if name not in secrets:
+        raise KeyError(f"{name} is not in {SECRETS_PATH} or the environment.")
+    return secrets[name]
+
+
+@lru_cache(maxsize=None)
+def get_open_ai_client():
+    """Open AI client used for text generation and audio generation.
+    Created on first use, so importing the package needs no secrets."""
+    from openai import OpenAI
+    return OpenAI(api_key=get_secret("OPENAI_API_KEY"))
+
+
+@lru_cache(maxsize=None)
+def get_assistant():
+    """Loading the assistant with domain knowledge already loaded in.
+    Makes a network call on first use only."""
+    return get_open_ai_client().beta.assistants.retrieve(
+        assistant_id=get_secret("GPT_ASSISTANT_ID")
+    )
+
+
+@lru_cache(maxsize=None)
+def get_thread():
+    """Threads keep track of the assistants conversation. Created on 
+    first use, so processes that never ask the assistant anything do 
+    not leave an orphan thread behind."""
+    return get_open_ai_client().beta.threads.create()
+
+
+# Clients and secrets previously created at import, now created lazily
+# when accessed as module attributes.
+_LAZY_ATTRIBUTES = {
+    "OPENAI_API_KEY": lambda: get_secret("OPENAI_API_KEY"),
+    "GPT_ASSISTANT_ID": lambda: get_secret("GPT_ASSISTANT_ID"),
+    "OPEN_AI_CLIENT": get_open_ai_client,
+    "ASSISTANT": get_assistant,
+    "THREAD": get_thread,
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-with open('./secrets.json', 'r') as file:
-    secrets = json.load(file)
 
 # Unpacking and assigning configurations.
-GPT_VOICES = tuple(configs["GPT_VOICES"])
-GPT_BASE_MODEL = configs["GPT_BASE_MODEL"]
-VIDEO_TOPICS = configs["VIDEO_TOPICS"]
-QUESTION_RULES = configs["QUESTION_RULES"]
-QUESTIONS = configs["QUESTIONS"]
-CREATE_TITLE_PROMPT = configs["CREATE_TITLE_PROMPT"]
-PRICE_PER_TOKEN = configs["PRICE_PER_TOKEN"]
-SPREADSHEET_ID = configs["SPREADSHEET_ID"]
-GOOGLE_SHEET_NAME = configs["GOOGLE_SHEET_NAME"]
+SETTINGS = get_settings()
+GPT_VOICES = SETTINGS.gpt_voices
+GPT_BASE_MODEL = SETTINGS.gpt_base_model
+VIDEO_TOPICS = SETTINGS.video_topics
+QUESTION_RULES = SETTINGS.question_rules
+QUESTIONS = SETTINGS.questions
+TOPIC_WEIGHTS = SETTINGS.topic_weights
+CREATE_TITLE_PROMPT = SETTINGS.create_title_prompt
+CREATE_SCRIPT_AND_TITLE_PROMPT = SETTINGS.create_script_and_title_prompt
+MODEL_PRICES = SETTINGS.model_prices
+TTS_MODEL = SETTINGS.tts_model
+SPREADSHEET_ID = SETTINGS.spreadsheet_id
+GOOGLE_SHEET_NAME = SETTINGS.google_sheet_name
 DESKTOP_PATH = "."
 
 # Folder names
@@ -34,9 +156,55 @@ HISTORY = "HISTORY"
 SUBTITLES = "SUBTITLES"
 ROOT_DIR = "./Jellyfish"
 VIDEO_TITLE_TEMP = 1
+# Generates the script and title with one JSON response from the assistant.
+GENERATE_SCRIPT_AND_TITLE_TOGETHER = True
 NUM_VIDEOS_TO_GENERATE = 2
 URL_TO_REDIRECT_TO = "https://www.wildanimalinitiative.org/donate"
+# Each video links to SHORT_LINK_BASE_URL + its short code, which the
+# redirect app resolves to its TARGET_URL. Set it to the public address
+# of the redirect app. Uploads link to URL_TO_REDIRECT_TO instead while
+# it is a loopback address.
+SHORT_LINK_BASE_URL = "http://127.0.0.1:8000/s/"
+SHORT_CODE_LENGTH = 8
+
+# Data kept across runs. Not inside ROOT_DIR, which is deleted pre run.
+STATE_DIR = "./STATE"
+SCRIPT_INDEX = "script_index.jsonl"
+USED_PROMPTS = "used_prompts.txt"
+# Every script generated, appended to as each script completes.
+HISTORY_STORE = "history.sqlite3"
+# Short code to INFERENCE_ID and TARGET_URL, loaded by the redirect app.
+CODE_MAP = "code_map.json"
+# Clicks pulled from Pub/Sub, and the IDs of the messages stored, kept
+# as long as Pub/Sub can redeliver them.
+CLICKS_DIR = "clicks"
+CLICK_MESSAGE_RETENTION_DAYS = 7
+
+# Scripts at least this similar to a previous script are regenerated,
+# and dropped if still too similar after the max regenerations.
+NEAR_DUPLICATE_THRESHOLD = 0.5
+MAX_SCRIPT_REGENERATIONS = 2
 
+# Videos rendered at once. Intermediate files are deleted as soon as no
+# stage needs them, and new renders are held back while the workspace
+# plus RENDER_DISK_RESERVE per render in flight is over the budget. A
+# render always starts when none is in flight, so with one worker the
+# budget never holds a render back, and only deleting intermediates
+# bounds the disk used.
+MAX_RENDER_WORKERS = 1
+DELETE_INTERMEDIATES = True
+DISK_BUDGET_BYTES = 20 * 1024 ** 3
+RENDER_DISK_RESERVE = 512 * 1024 ** 2
+
+
+# GOOGLE SHEETS SETTINGS
+# IDs of the history rows already pushed to the sheet.
+SHEETS_SYNCED = "sheets_synced.txt"
+SHEETS_CREDENTIALS = "credentials.json"
+# Rows per values.append request, and retries of quota errors.
+SHEETS_BATCH_ROWS = 500
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_SECONDS = 1.0
 
 # SUBTITLES SETTINGS
 
@@ -44,26 +212,58 @@ URL_TO_REDIRECT_TO = "https://www.wildanimalinitiative.org/donate"
 TEST_DATA_BUCKET_GCP = "test-data-jellyfish"
 GCP_PROJECT_ID = "video-generation-404817"
 CLICKED_LINK_TOPIC_ID = "CLICKED-LINK"
+# Subscription the clicks are pulled from, in batches.
+CLICKED_LINK_SUBSCRIPTION_ID = "CLICKED-LINK-INGESTION"
+CLICK_PULL_MAX_MESSAGES = 1000
+CLICK_PULL_TIMEOUT = 10.0
+# Concurrent GCS transfers, sharing one storage client.
+MAX_TRANSFER_WORKERS = 8
+# Files larger than the threshold are uploaded in resumable chunks.
+# Chunk size must be a multiple of 256 KB.
+CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Where the finished videos and history are kept: "local" (ROOT_DIR),
+# "tmpfs" (render in memory, keep outputs in ROOT_DIR), or "gcs" (render
+# in memory, upload outputs to OUTPUT_BUCKET_GCP).
+STORAGE_BACKEND = "local"
+OUTPUT_BUCKET_GCP = "videos-with-subtitles"
+
+# YOUTUBE SETTINGS
+YOUTUBE_UPLOAD_URL = "https://www.googleapis.com/upload/youtube/v3/videos"
+# Authorized user token with the youtube.upload scope.
+YOUTUBE_TOKEN = "youtube_token.json"
+# Upload URIs and progress of each video, kept in STATE_DIR.
+YOUTUBE_UPLOAD_STATE = "youtube_uploads.sqlite3"
+# Chunk size must be a multiple of 256 KB.
+YOUTUBE_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_YOUTUBE_UPLOADS = 2
+# Each upload costs 1600 of the 10000 quota units a project gets per
+# day, which resets at midnight Pacific time.
+YOUTUBE_DAILY_QUOTA = 10000
+YOUTUBE_UPLOAD_COST = 1600
+YOUTUBE_MAX_RETRIES = 5
+YOUTUBE_BACKOFF_SECONDS = 1.0
+YOUTUBE_PRIVACY_STATUS = "private"
+# Pets & Animals.
+YOUTUBE_CATEGORY_ID = "15"
+# {link} is replaced with the SHORT_LINK of the video.
+YOUTUBE_DESCRIPTION = """Please donate to protect wild animals: {link}
 
+🪼 Jellyfish are mesmerizing creatures!
 
-# Unpacking secrets.
-OPENAI_API_KEY = secrets["OPENAI_API_KEY"]
-GPT_ASSISTANT_ID = secrets["GPT_ASSISTANT_ID"]
-os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
+🪼 This channel is dedicated to sharing interesting facts about jellyfish for entertainment and educational purposes.
 
-# Open AI client used for text generation and audio generation.
-OPEN_AI_CLIENT = OpenAI()
+🪼 If you love wild animals like jellyfish too, please donate to the wild animal initiative, which seeks to reduce harm caused to animals in the wild.
 
-# Loading the assistant with domain knowledge already loaded in.
-ASSISTANT = OPEN_AI_CLIENT.beta.assistants.retrieve(
-    assistant_id=GPT_ASSISTANT_ID
-)
+Disclaimer:
+The video content provided herein is used for educational and informational purposes only, with the intent of promoting awareness and appreciation for the animals depicted. This content is not monetized, and no financial gain is derived from its use.
 
-# Threads keep track of the assistants conversation.
-THREAD = OPEN_AI_CLIENT.beta.threads.create()
+Original Video: https://www.youtube.com/watch?v=I6yC840UJ2Y
+"""
 
 
 def main():
+    from icecream import ic
     ic(CREATE_TITLE_PROMPT)
 
 
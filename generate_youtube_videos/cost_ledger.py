@@ -0,0 +1,196 @@
+"""Keeps track of the cost of every API call made for a single video.
+
+Costs are priced from the usage the API returns (tokens for chat and
+assistant runs, characters for TTS) using the per model price table in
+the domain configs, instead of tokenizing the text again locally. A
+model missing from the table, like a dated version of a model, is 
+priced as the model it is a version of, or as GPT_BASE_MODEL, and the
+fallback is recorded in the row.
+
+Typical usage example:
+
+    ledger = CostLedger()
+    ledger.record_tokens("SCRIPT", "gpt-4", 120, 150, latency=4.2)
+    ledger.record_characters("TTS", "tts-1", 740)
+    row = {**ledger.to_columns(), "COST_OF_INFERENCE": ledger.total_cost()}
+"""
+from dataclasses import dataclass
+from dataclasses import field
+from configs import GPT_BASE_MODEL
+from configs import MODEL_PRICES
+
+# Every row gets the same columns for these calls, even when a call
+# was not made, so the history table has no missing values.
+LEDGER_CALLS = ("SCRIPT", "TITLE", "TTS")
+
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    call: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    characters: int
+    latency: float
+    cost: float
+    priced_model: str
+
+
+def price_model(
+        model: str,
+        prices: dict = MODEL_PRICES,
+        fallback_model: str = GPT_BASE_MODEL) -> str:
+    """DESCRIPTION:
+    Finds the model whose prices are used for a model. Models missing
+    from the price table are priced as the longest model name in the 
+    table they start with, like gpt-4 for gpt-4-0613, or else as the 
+    fallback model.
+
+    ARGS:
+    - model (str): Model used for the call.
+    - prices (dict): Price per unit for each model.
+    - fallback_model (str): Model priced when no name matches.
+
+    RETURNS:
+    priced_model (str)
+    """
+    if model in prices:
+        return model
+    from icecream import ic
+    versions_of = [name for name in prices if model.startswith(name)]
+    priced_model = max(versions_of, key=len) if versions_of\
+        else fallback_model
+    ic(f"No price configured for {model}, priced as {priced_model}.")
+    return priced_model
+
+
+def price_usage(
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        characters: int = 0,
+        prices: dict = MODEL_PRICES,
+        fallback_model: str = GPT_BASE_MODEL) -> float:
+    """DESCRIPTION:
+    Prices the usage of a single API call in dollars, with the prices
+    of the model found by price_model. Costs nothing when even the 
+    fallback model has no price, so a new model does not stop the run.
+
+    ARGS:
+    - model (str): Model used for the call.
+    - prompt_tokens (int): Number of input tokens billed.
+    - completion_tokens (int): Number of output tokens billed.
+    - characters (int): Number of input characters billed (TTS).
+    - prices (dict): Price per unit for each model.
+    - fallback_model (str): Model priced when no name matches.
+
+    RETURNS:
+    cost (float)
+    """
+    model_prices = prices.get(price_model(model, prices, fallback_model), {})
+    return (
+        prompt_tokens * model_prices.get("PROMPT_TOKEN", 0)
+        + completion_tokens * model_prices.get("COMPLETION_TOKEN", 0)
+        + characters * model_prices.get("CHARACTER", 0)
+    )
+
+
+@dataclass
+class CostLedger:
+    prices: dict = field(default_factory=lambda: MODEL_PRICES)
+    fallback_model: str = GPT_BASE_MODEL
+    entries: list = field(default_factory=list)
+
+    def record_tokens(
+            self,
+            call: str,
+            model: str,
+            prompt_tokens: int,
+            completion_tokens: int,
+            latency: float = 0.0) -> LedgerEntry:
+        """Records a chat or assistant run call from its token usage."""
+        priced_model = price_model(model, self.prices, self.fallback_model)
+        entry = LedgerEntry(
+            call=call,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            characters=0,
+            latency=latency,
+            cost=price_usage(
+                priced_model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                prices=self.prices,
+                fallback_model=self.fallback_model
+            ),
+            priced_model=priced_model
+        )
+        self.entries.append(entry)
+        return entry
+
+    def record_usage(
+            self,
+            call: str,
+            model: str,
+            usage,
+            latency: float = 0.0) -> LedgerEntry:
+        """Records a call from the usage object returned by the API."""
+        return self.record_tokens(
+            call,
+            model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency=latency
+        )
+
+    def record_characters(
+            self,
+            call: str,
+            model: str,
+            characters: int,
+            latency: float = 0.0) -> LedgerEntry:
+        """Records a call billed per character, like TTS."""
+        priced_model = price_model(model, self.prices, self.fallback_model)
+        entry = LedgerEntry(
+            call=call,
+            model=model,
+            prompt_tokens=0,
+            completion_tokens=0,
+            characters=characters,
+            latency=latency,
+            cost=price_usage(
+                priced_model,
+                characters=characters,
+                prices=self.prices,
+                fallback_model=self.fallback_model
+            ),
+            priced_model=priced_model
+        )
+        self.entries.append(entry)
+        return entry
+
+    def total_cost(self) -> float:
+        """Total cost in dollars of every recorded call."""
+        return sum(entry.cost for entry in self.entries)
+
+    def to_columns(self, calls: tuple = LEDGER_CALLS) -> dict:
+        """Sums the entries for each call into history table columns."""
+        columns = {}
+        for call in calls:
+            entries = [entry for entry in self.entries if entry.call == call]
+            columns[f"{call}_PROMPT_TOKENS"] =\
+                sum(entry.prompt_tokens for entry in entries)
+            columns[f"{call}_COMPLETION_TOKENS"] =\
+                sum(entry.completion_tokens for entry in entries)
+            columns[f"{call}_CHARACTERS"] =\
+                sum(entry.characters for entry in entries)
+            columns[f"{call}_LATENCY"] = sum(entry.latency for entry in entries)
+            columns[f"{call}_COST"] = sum(entry.cost for entry in entries)
+        # Models priced with the prices of another model, so the costs
+        # of the row are an estimate.
+        columns["PRICE_FALLBACKS"] = ", ".join(sorted({
+            f"{entry.model} as {entry.priced_model}"
+            for entry in self.entries if entry.priced_model != entry.model
+        }))
+        return columns
@@ -1,10 +1,11 @@
 # OS used for directory actions.
+# google.cloud.storage and pandas are imported inside the functions that
+# use them, so importing this module is fast.
+from __future__ import annotations
 import os
 import shutil
-from google.cloud import storage
-from icecream import ic
 import tempfile
-import pandas as pd
+from typing import TYPE_CHECKING
 
 from configs import DESKTOP_PATH
 from configs import GOOGLE_SHEET_NAME
@@ -17,9 +18,17 @@ from configs import HISTORY
 from configs import SUBTITLES
 from configs import ROOT_DIR
 from configs import TEST_DATA_BUCKET_GCP
+from generate_youtube_videos.cloud_storage import get_bucket
+from generate_youtube_videos.cloud_storage import download_blobs
+from generate_youtube_videos.storage_backends import LocalDiskBackend
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def initialize_empty_directories(output_dir: str = None):
+
+def initialize_empty_directories(
+        output_dir: str = None,
+        storage: LocalDiskBackend = None):
     """
     DESCRIPTION:
     Multiple directories are created for the pipeline, because the files
@@ -28,28 +37,28 @@ def initialize_empty_directories(output_dir: str = None):
 
     ARGS:
     - output_dir (str): Path where the generated data will be stored.
+    - storage (LocalDiskBackend): Storage backend that owns the 
+    workspace. Defaults to a local disk backend at output_dir.
 
     RETURNS:
     output_dir (str)
     """
 
-    if not output_dir:
+    if storage is None:
         # If no path passed, then use desktop.
-        output_dir = os.path.join(DESKTOP_PATH, GOOGLE_SHEET_NAME)
-
-    if not os.path.exists(output_dir):
-        os.mkdir(output_dir)
+        storage = LocalDiskBackend(
+            output_dir or os.path.join(DESKTOP_PATH, GOOGLE_SHEET_NAME))
 
     # Creating sub dirs.
-    os.mkdir(os.path.join(output_dir, RAW_AUDIO))
-    os.mkdir(os.path.join(output_dir, ONE_MINUTE_VIDEOS))
-    os.mkdir(os.path.join(output_dir, VIDEOS_MERGED_WITH_AUDIO))
-    os.mkdir(os.path.join(output_dir, FADED_AND_SLICED_VIDEOS))
-    os.mkdir(os.path.join(output_dir, VIDEOS_WITH_SUBTITLES))
-    os.mkdir(os.path.join(output_dir, HISTORY))
-    os.mkdir(os.path.join(output_dir, SUBTITLES))
-
-    return output_dir
+    return storage.make_dirs([
+        RAW_AUDIO,
+        ONE_MINUTE_VIDEOS,
+        VIDEOS_MERGED_WITH_AUDIO,
+        FADED_AND_SLICED_VIDEOS,
+        VIDEOS_WITH_SUBTITLES,
+        HISTORY,
+        SUBTITLES
+    ])
 
 
 FINAL_DATA = [HISTORY, VIDEOS_WITH_SUBTITLES]
@@ -126,52 +135,48 @@ def clean_up_pre_run():
     delete_dir(ROOT_DIR)
 
 
-def pull_test_history_data_from_GCP() -> pd.DataFrame:
+def pull_test_history_data_from_GCP(bucket=None) -> pd.DataFrame:
     """DESCRIPTION:
     Pulls down the history dataframe GCP. Save it as a file in a temp
     folder. Converts CSV to dataframe, and returns the dataframe.
 
-    ARGS: None
+    ARGS:
+    - bucket: Bucket to pull from, defaults to the test data bucket.
 
     RETURNS:
     df (pd.DataFrame)
     """
-    client = storage.Client()
-    bucket_name = f"{TEST_DATA_BUCKET_GCP}"
-    bucket = client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix="Jellyfish/HISTORY/")
+    import pandas as pd
+
+    if bucket is None:
+        bucket = get_bucket(TEST_DATA_BUCKET_GCP)
 
     df = pd.DataFrame()
 
     with tempfile.TemporaryDirectory() as temp_output_dir:
-        for blob in blobs:
-            name = os.path.basename(blob.name)
-            if name == "Jellyfish.csv":
-                file_name = os.path.join(temp_output_dir, name)
-                blob.download_to_filename(file_name)
-                df = pd.read_csv(file_name, index_col=0)
+        file_names = download_blobs(
+            bucket,
+            prefix="Jellyfish/HISTORY/",
+            dest_dir=temp_output_dir,
+            file_name="Jellyfish.csv"
+        )
+        for file_name in file_names:
+            df = pd.read_csv(file_name, index_col=0)
 
     return df
 
 
-def download_audio_files_from_gcp(bucket_name, prefix, temp_dir):
-    """Download audio files from a specified GCP bucket into a temporary directory."""
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=prefix)
-    audio_files = []
-
-    for blob in blobs:
-        name = os.path.basename(blob.name)
-        if name.endswith(".mp3"):
-            local_path = os.path.join(temp_dir, name)
-            blob.download_to_filename(local_path)
-            audio_files.append(local_path)
-
-    return audio_files
+def download_audio_files_from_gcp(bucket_name, prefix, temp_dir, bucket=None):
+    """Download audio files from a specified GCP bucket into a temporary 
+    directory. Files are downloaded in parallel, and files already in 
+    the directory with the same content are skipped."""
+    if bucket is None:
+        bucket = get_bucket(bucket_name)
+    return download_blobs(bucket, prefix, temp_dir, suffix=".mp3")
 
 
 def main():
+    from icecream import ic
     ic(pull_test_history_data_from_GCP().shape)
 
 
@@ -0,0 +1,232 @@
+"""Append only store of the generated scripts and their meta data.
+
+Rows are appended to a SQLite database as each script completes,
+instead of writing the whole batch to a CSV at the end, so the scripts
+of a batch that crashes part way through are kept. Each append is its
+own transaction in write ahead log (WAL) mode, which keeps appends
+cheap and lets readers run while the pipeline writes.
+
+INFERENCE_ID and DATE_TIME are indexed, so looking up a single video
+is a B-tree search instead of a scan of the whole history, and reads
+only select the columns they need. The CSV export is kept for the
+Google Sheet and the stages that still read a CSV.
+
+Typical usage example:
+
+    history = HistoryStore(os.path.join(STATE_DIR, HISTORY_STORE))
+    history.append(row)
+    title = history.get(inference_id)["VIDEO_TITLE"]
+    history.export_csv(csv_path, since=run_started)
+"""
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TABLE = "history"
+
+# Column names become SQL identifiers, so only plain names are allowed.
+COLUMN_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def column_type(value) -> str:
+    """SQLite type of a column, from the first value appended to it."""
+    if isinstance(value, bool) or isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    return "TEXT"
+
+
+class HistoryStore:
+    """History table in a SQLite database. Columns are added the first
+    time a row has them, so new meta data needs no migration."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Committed rows survive a crash of the process, and WAL keeps
+        # the database consistent if the machine loses power.
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                "ROW_ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "INFERENCE_ID TEXT NOT NULL UNIQUE, "
+                "DATE_TIME TEXT)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_date_time "
+                f"ON {TABLE} (DATE_TIME)"
+            )
+        self._columns = self._read_column_names()
+
+    def _read_column_names(self) -> list:
+        cursor = self._connection.execute(f"PRAGMA table_info({TABLE})")
+        return [row[1] for row in cursor.fetchall()]
+
+    def columns(self) -> list:
+        """Columns of the history table, in the order they were added,
+        without the internal ROW_ID."""
+        return [column for column in self._columns if column != "ROW_ID"]
+
+    def _add_missing_columns(self, row: dict) -> None:
+        for column, value in row.items():
+            if column in self._columns:
+                continue
+            if not COLUMN_NAME.match(column):
+                raise ValueError(f"Invalid history column name: {column}")
+            self._connection.execute(
+                f"ALTER TABLE {TABLE} ADD COLUMN {column} {column_type(value)}"
+            )
+            self._columns.append(column)
+
+    def append(self, row: dict) -> None:
+        """DESCRIPTION:
+        Appends a row, and commits it right away so it survives a crash
+        later in the batch.
+
+        ARGS:
+        - row (dict): Column values, must include INFERENCE_ID.
+
+        RETURNS: None
+        """
+        if "INFERENCE_ID" not in row:
+            raise ValueError("History rows must have an INFERENCE_ID.")
+        columns = list(row)
+        placeholders = ", ".join("?" for _ in columns)
+        with self._lock, self._connection:
+            self._add_missing_columns(row)
+            self._connection.execute(
+                f"INSERT INTO {TABLE} ({', '.join(columns)}) "
+                f"VALUES ({placeholders})",
+                [row[column] for column in columns]
+            )
+
+    def append_many(self, rows: list) -> None:
+        """Appends rows, one transaction per row."""
+        for row in rows:
+            self.append(row)
+
+    def __len__(self) -> int:
+        cursor = self._connection.execute(f"SELECT COUNT(*) FROM {TABLE}")
+        return cursor.fetchone()[0]
+
+    def __contains__(self, inference_id: str) -> bool:
+        cursor = self._connection.execute(
+            f"SELECT 1 FROM {TABLE} WHERE INFERENCE_ID = ?", (inference_id,))
+        return cursor.fetchone() is not None
+
+    def get(self, inference_id: str) -> dict:
+        """DESCRIPTION:
+        Looks up the row of a single video, using the INFERENCE_ID
+        index.
+
+        ARGS:
+        - inference_id (str): The id that connects data in pipeline.
+
+        RETURNS:
+        row (dict | None): None when the ID is not in the history.
+        """
+        columns = self.columns()
+        cursor = self._connection.execute(
+            f"SELECT {', '.join(columns)} FROM {TABLE} WHERE INFERENCE_ID = ?",
+            (inference_id,)
+        )
+        values = cursor.fetchone()
+        return dict(zip(columns, values)) if values is not None else None
+
+    def _select(
+            self,
+            columns: list = None,
+            since: str = None,
+            inference_ids: list = None) -> tuple:
+        """Builds a query for the columns of the rows matching the
+        filters, in the order they were appended."""
+        columns = list(columns) if columns else self.columns()
+        for column in columns:
+            if column not in self._columns:
+                raise KeyError(f"No history column named {column}.")
+        query = f"SELECT {', '.join(columns)} FROM {TABLE}"
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("DATE_TIME >= ?")
+            parameters.append(since)
+        if inference_ids is not None:
+            placeholders = ", ".join("?" for _ in inference_ids)
+            conditions.append(f"INFERENCE_ID IN ({placeholders})")
+            parameters.extend(inference_ids)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return columns, query + " ORDER BY ROW_ID", parameters
+
+    def iter_rows(
+            self,
+            columns: list = None,
+            since: str = None,
+            inference_ids: list = None):
+        """DESCRIPTION:
+        Lazily yields rows as tuples, without loading the history into
+        memory.
+
+        ARGS:
+        - columns (list): Columns to read, defaults to every column.
+        - since (str): Only rows with a DATE_TIME at or after this time,
+        in the "%Y-%m-%d %H:%M:%S" format.
+        - inference_ids (list): Only rows with these IDs.
+
+        YIELDS:
+        row (tuple): Values in the order of the columns.
+        """
+        _, query, parameters = self._select(columns, since, inference_ids)
+        yield from self._connection.execute(query, parameters)
+
+    def read_columns(
+            self,
+            columns: list = None,
+            since: str = None,
+            inference_ids: list = None) -> pd.DataFrame:
+        """DESCRIPTION:
+        Reads only the requested columns into a dataframe.
+
+        ARGS:
+        - columns (list): Columns to read, defaults to every column.
+        - since (str): Only rows with a DATE_TIME at or after this time.
+        - inference_ids (list): Only rows with these IDs.
+
+        RETURNS:
+        df (pd.DataFrame)
+        """
+        import pandas as pd
+        columns, query, parameters = self._select(
+            columns, since, inference_ids)
+        return pd.read_sql_query(query, self._connection, params=parameters)\
+            .reindex(columns=columns)
+
+    def export_csv(self, path: str, since: str = None) -> str:
+        """DESCRIPTION:
+        Exports the history to a CSV in the format the pipeline has
+        always written, for the Google Sheet and the audio stage.
+
+        ARGS:
+        - path (str): Path of the CSV file.
+        - since (str): Only rows with a DATE_TIME at or after this time.
+
+        RETURNS:
+        path (str)
+        """
+        self.read_columns(since=since).to_csv(path)
+        return path
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,163 @@
+"""Deletes intermediate files as soon as no stage needs them, and holds
+back new renders when the workspace gets close to its disk budget.
+
+Every render writes a merged video, a faded and sliced video and a
+subtitle file before the final video, and reads a raw audio file and a
+one minute video that other renders may share. Without cleanup these
+pile up for the whole batch. Each intermediate is registered with the
+number of stages that read it, and deleted when the last one releases
+it, so peak disk usage depends on how many renders run at once instead
+of on the batch size.
+
+Typical usage example:
+
+    budget = DiskBudget(output_dir)
+    tracker = IntermediateTracker(on_delete=budget.notify)
+    tracker.register(raw_video, uses=2)
+    with budget.reserve():
+        merge_audio_video(raw_video, raw_audio, merged_video)
+        tracker.release(raw_video)
+"""
+import os
+import threading
+from contextlib import contextmanager
+from configs import DISK_BUDGET_BYTES
+from configs import RENDER_DISK_RESERVE
+
+
+def directory_size(root: str) -> int:
+    """Total size in bytes of the files under a directory."""
+    total = 0
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(directory, file_name))
+            except FileNotFoundError:
+                # Deleted by another render while walking.
+                pass
+    return total
+
+
+class IntermediateTracker:
+    """Reference counts intermediate files, deleting each file when the
+    last stage reading it releases it. Safe to share between renders
+    running in different threads. A disabled tracker counts uses but
+    never deletes, which keeps every intermediate like before."""
+
+    def __init__(self, on_delete=None, enabled: bool = True):
+        self.on_delete = on_delete
+        self.enabled = enabled
+        self.deleted = []
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    def register(self, path: str, uses: int = 1) -> None:
+        """DESCRIPTION:
+        Adds uses to an intermediate file. A file registered with no
+        uses is not needed by any stage, and is deleted right away.
+
+        ARGS:
+        - path (str): Path to the intermediate file.
+        - uses (int): Number of stages that will read the file.
+
+        RETURNS: None
+        """
+        with self._lock:
+            self._uses[path] = self._uses.get(path, 0) + uses
+            delete = self._uses[path] <= 0
+            if delete:
+                del self._uses[path]
+        if delete:
+            self._delete(path)
+
+    def release(self, path: str) -> None:
+        """Marks one use of a file as finished, deleting it after the
+        last use. Files that are not registered are left alone."""
+        with self._lock:
+            if path not in self._uses:
+                return
+            self._uses[path] -= 1
+            delete = self._uses[path] <= 0
+            if delete:
+                del self._uses[path]
+        if delete:
+            self._delete(path)
+
+    def discard(self, path: str) -> None:
+        """Deletes a file whatever its remaining uses, for outputs of a
+        failed render."""
+        with self._lock:
+            self._uses.pop(path, None)
+        self._delete(path)
+
+    def pending(self) -> dict:
+        """Remaining uses of each file not yet deleted."""
+        with self._lock:
+            return dict(self._uses)
+
+    def _delete(self, path: str) -> None:
+        if self.enabled and os.path.exists(path):
+            os.remove(path)
+            self.deleted.append(path)
+            if self.on_delete is not None:
+                self.on_delete()
+
+
+class DiskBudget:
+    """Holds back new renders while the workspace is close to its disk
+    budget. Each render in flight reserves the disk it may still write,
+    and a render is always allowed to start when none are in flight, so
+    the batch cannot deadlock on a budget smaller than one render."""
+
+    def __init__(
+            self,
+            root: str,
+            max_bytes: int = DISK_BUDGET_BYTES,
+            render_bytes: int = RENDER_DISK_RESERVE,
+            poll_interval: float = 1.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.render_bytes = render_bytes
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self.held_back = 0
+        self._condition = threading.Condition()
+
+    def usage(self) -> int:
+        """Bytes currently used by the workspace."""
+        return directory_size(self.root)
+
+    def has_room(self) -> bool:
+        """True when one more render fits in the budget."""
+        reserved = (self.in_flight + 1) * self.render_bytes
+        return self.usage() + reserved <= self.max_bytes
+
+    def acquire(self) -> None:
+        """Waits until a new render fits in the budget. Files deleted
+        outside the tracker are noticed every poll interval."""
+        with self._condition:
+            if self.in_flight > 0 and not self.has_room():
+                self.held_back += 1
+                while self.in_flight > 0 and not self.has_room():
+                    self._condition.wait(self.poll_interval)
+            self.in_flight += 1
+
+    def release(self) -> None:
+        """Marks a render as finished."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def notify(self) -> None:
+        """Wakes renders waiting for room, after files are deleted."""
+        with self._condition:
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self):
+        """Holds a place in the budget for the duration of a render."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
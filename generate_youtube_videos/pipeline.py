@@ -9,34 +9,54 @@ from configs import RAW_AUDIO
 from configs import GOOGLE_SHEET_NAME
 from configs import HISTORY
 from configs import ONE_MINUTE_VIDEOS
+from configs import STATE_DIR
+from configs import SCRIPT_INDEX
+from configs import USED_PROMPTS
+from configs import HISTORY_STORE
+from configs import CODE_MAP
+from configs import MAX_RENDER_WORKERS
+from configs import DELETE_INTERMEDIATES
 from generate_youtube_videos.file_operations import clean_up_pre_run
 from generate_youtube_videos.file_operations import clean_up_post_run
 from generate_youtube_videos.file_operations import initialize_empty_directories
 from generate_youtube_videos.text.generation import generate_youtube_shorts_scripts
 from generate_youtube_videos.text.generation import create_video_script_prompts
+from generate_youtube_videos.text.prompts import UsedPrompts
+from generate_youtube_videos.short_links import export_code_map
+from generate_youtube_videos.storage_backends import BackgroundUploader
+from generate_youtube_videos.storage_backends import get_storage_backend
+from generate_youtube_videos.intermediates import DiskBudget
+from generate_youtube_videos.intermediates import IntermediateTracker
 from generate_youtube_videos.video.operations import segment_video
 from generate_youtube_videos.video.operations import fade_and_slice_video
 from generate_youtube_videos.video.operations import merge_audio_video
 from generate_youtube_videos.video.operations import burn_subtitles_into_video
+from generate_youtube_videos.audio.generation import SpeechJob
 from generate_youtube_videos.audio.generation import generate_raw_audio_files
 from generate_youtube_videos.audio.operations import get_audio_duration
 from generate_youtube_videos.audio.operations import generate_subtitle_file_ass
 from generate_youtube_videos.audio.operations import transcribe
-from icecream import ic
 import os
 import random
+from contextlib import nullcontext
+from datetime import datetime
+from datetime import timezone
 
 # Need to run:
 # export PYTHONPATH="/Users/paulfentress/Desktop/jelly_fish/Jellyfish-Videos:$PYTHONPATH"
 # For imports to work.
 
+# Heavy libraries (icecream, numpy, faster_whisper, pandas, google cloud)
+# are imported on first use, so each stage only pays for what it needs.
+
 
 def add_subtitles_to_video(
         audio: str,
         video: str,
         inference_id: str,
         subtitles_dir: str,
-        videos_with_subtitles_dir: str) -> str:
+        videos_with_subtitles_dir: str,
+        tracker: IntermediateTracker = None) -> str:
     """DESCRIPTION:
     Adds subtitles to a video including doing the transcription, 
     creating a subtitle file in ASS format, then burning the subtitles
@@ -47,10 +67,14 @@ def add_subtitles_to_video(
     - video (str): The path to the merged and sliced video.
     - inference_id (str): The id that connects data in pipeline.
     - output_dir (str): The path to the videos with subtitles dir.
+    - tracker (IntermediateTracker): Deletes the subtitle file once it
+    is burned into the video.
 
     RETURNS:
     video_with_subtitles (str): The path to the video with subtitles.
     """
+    if tracker is None:
+        tracker = IntermediateTracker(enabled=False)
 
     language, segments = transcribe(audio)
 
@@ -60,12 +84,16 @@ def add_subtitles_to_video(
         segments=segments,
         subtitles_dir=subtitles_dir,
     )
+    tracker.register(subtitles)
 
-    video_with_subtitles = burn_subtitles_into_video(
-        video=video,
-        subtitles=subtitles,
-        videos_with_subtitles_dir=videos_with_subtitles_dir
-    )
+    try:
+        video_with_subtitles = burn_subtitles_into_video(
+            video=video,
+            subtitles=subtitles,
+            videos_with_subtitles_dir=videos_with_subtitles_dir
+        )
+    finally:
+        tracker.release(subtitles)
 
     return video_with_subtitles
 
@@ -77,7 +105,8 @@ def process_raw_video_and_audio(
     fade_and_sliced_videos:  str,
     subtitles_dir: str,
     videos_with_subtitles_dir: str,
-    inference_id: str
+    inference_id: str,
+    tracker: IntermediateTracker = None
 ):
     """
     DESCRIPTION:
@@ -97,22 +126,34 @@ def process_raw_video_and_audio(
     - subtitles_dir (str): Path to dir, to store .ASS subtitle files.
     - videos_with_subtitles (str): Path to save the video with 
     subtitles.
+    - tracker (IntermediateTracker): Releases each input after the last
+    stage reading it, deleting it when no other render needs it.
 
     RETURNS:
-    (str) "Done"
+    video_with_subtitles (str): The path to the finished video.
     """
-    # Compute audio length. Used for meta data.
-    ic("Compute audio length. Used for meta data.")
-    audio_duration = get_audio_duration(raw_audio)
-    ic(audio_duration)
-
-    # Merge audio with video.
-    ic("Merge audio with video.")
-    merged_video_path = merge_audio_video(
-        raw_video,
-        raw_audio,
-        merged_video
-    )
+    from icecream import ic
+
+    if tracker is None:
+        tracker = IntermediateTracker(enabled=False)
+
+    try:
+        # Compute audio length. Used for meta data.
+        ic("Compute audio length. Used for meta data.")
+        audio_duration = get_audio_duration(raw_audio)
+        ic(audio_duration)
+
+        # Merge audio with video.
+        ic("Merge audio with video.")
+        merged_video_path = merge_audio_video(
+            raw_video,
+            raw_audio,
+            merged_video
+        )
+    finally:
+        # The raw video may still be needed by other renders. Released
+        # even when a stage reading it fails.
+        tracker.release(raw_video)
 
     ic(merged_video_path)
 
@@ -122,6 +163,7 @@ def process_raw_video_and_audio(
         fade_and_sliced_videos,
         audio_duration
     )
+    tracker.release(merged_video_path)
     ic(fade_and_sliced_video)
 
     # Add subtitles to the video.
@@ -130,11 +172,76 @@ def process_raw_video_and_audio(
         video=fade_and_sliced_video,
         inference_id=inference_id,
         subtitles_dir=subtitles_dir,
-        videos_with_subtitles_dir=videos_with_subtitles_dir
+        videos_with_subtitles_dir=videos_with_subtitles_dir,
+        tracker=tracker
     )
+    tracker.release(raw_audio)
+    tracker.release(fade_and_sliced_video)
     ic(video_with_subtitles)
 
-    return "Done"
+    return video_with_subtitles
+
+
+def render_video(
+    inference_id: str,
+    raw_video: str,
+    audio_data_dir: str,
+    merged_videos_dir: str,
+    fade_and_sliced_videos: str,
+    subtitles_dir: str,
+    videos_with_subtitles_dir: str,
+    tracker: IntermediateTracker,
+    budget: DiskBudget = None,
+    uploader: BackgroundUploader = None
+) -> str:
+    """
+    DESCRIPTION:
+    Renders a single video, waiting for room in the disk budget first.
+    The outputs of a failed render are deleted.
+
+    ARGS:
+    - inference_id (str): The id that connects data in pipeline.
+    - raw_video (str): Path to the one minute video assigned to the ID.
+    - tracker (IntermediateTracker): Deletes intermediate files.
+    - budget (DiskBudget): Holds back the render while the workspace is
+    close to its disk budget.
+    - uploader (BackgroundUploader): Publishes the finished video.
+    - The remaining args are the stage directories, as in 
+    generate_video_data.
+
+    RETURNS:
+    video_with_subtitles (str | None): None when the render failed.
+    """
+    raw_audio = os.path.join(audio_data_dir, f"{inference_id}.mp3")
+    merged_video = os.path.join(merged_videos_dir, f"{inference_id}.mp4")
+    fade_and_sliced_video = os.path.join(
+        fade_and_sliced_videos, f"{inference_id}.mp4")
+
+    with budget.reserve() if budget is not None else nullcontext():
+        # Generating and saving the YouTube video.
+        try:
+            video_with_subtitles = process_raw_video_and_audio(
+                raw_video=raw_video,
+                raw_audio=raw_audio,
+                merged_video=merged_video,
+                fade_and_sliced_videos=fade_and_sliced_video,
+                subtitles_dir=subtitles_dir,
+                videos_with_subtitles_dir=videos_with_subtitles_dir,
+                inference_id=inference_id,
+                tracker=tracker
+            )
+
+        except Exception as e:
+            from icecream import ic
+            ic(e)
+            ic(f"Failed on ID: {inference_id}")
+            for path in (raw_audio, merged_video, fade_and_sliced_video):
+                tracker.discard(path)
+            return None
+
+    if uploader is not None:
+        uploader.submit(VIDEOS_WITH_SUBTITLES, video_with_subtitles)
+    return video_with_subtitles
 
 
 def generate_video_data(
@@ -143,7 +250,11 @@ def generate_video_data(
     merged_videos_dir: str,
     fade_and_sliced_videos: str,
     subtitles_dir: str,
-    videos_with_subtitles_dir: str
+    videos_with_subtitles_dir: str,
+    uploader: BackgroundUploader = None,
+    tracker: IntermediateTracker = None,
+    budget: DiskBudget = None,
+    max_workers: int = MAX_RENDER_WORKERS
 ) -> str:
     """
     Creates the entire batch of YouTube shorts videos. Iterates over 
@@ -160,42 +271,68 @@ def generate_video_data(
     subtitles added. This is currently the last processing applied and 
     therefore the final folder, and therefore where the completed 
     videos are stored.
+    - uploader (BackgroundUploader): Publishes each finished video as 
+    soon as it is rendered, while the next video renders.
+    - tracker (IntermediateTracker): Deletes intermediate files once no
+    render needs them. Intermediates are kept when not passed.
+    - budget (DiskBudget): Holds back new renders while the workspace 
+    is close to its disk budget.
+    - max_workers (int): Number of videos rendered at once.
 
     RETURNS:
     (str) "Done"
     """
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    if tracker is None:
+        tracker = IntermediateTracker(enabled=False)
 
     # All the one minute videos.
-    video_files = os.listdir(video_data_dir)
+    video_files = sorted(os.listdir(video_data_dir))
 
     # Inference IDs used to name videos. Important to keep same ID to
     # reference the correct title when uploading.
     inference_ids = [x.replace(".mp3", "") for x in os.listdir(audio_data_dir)]
 
-    # Iterating over every audio transcript.
+    # Raw videos are assigned up front, so each one is deleted after the
+    # last render using it. Videos not assigned are deleted right away.
+    raw_videos = {
+        inference_id: os.path.join(video_data_dir, random.choice(video_files))
+        for inference_id in inference_ids
+    }
+    uses = Counter(raw_videos.values())
+    for video_file in video_files:
+        raw_video = os.path.join(video_data_dir, video_file)
+        tracker.register(raw_video, uses=uses[raw_video])
 
     for inference_id in inference_ids:
-        raw_audio = os.path.join(audio_data_dir, f"{inference_id}.mp3")
-        raw_video = os.path.join(video_data_dir, random.choice(video_files))
-        merged_video = os.path.join(merged_videos_dir, f"{inference_id}.mp4")
-        fade_and_sliced_video = os.path.join(
-            fade_and_sliced_videos, f"{inference_id}.mp4")
+        tracker.register(os.path.join(audio_data_dir, f"{inference_id}.mp3"))
+        tracker.register(
+            os.path.join(merged_videos_dir, f"{inference_id}.mp4"))
+        tracker.register(
+            os.path.join(fade_and_sliced_videos, f"{inference_id}.mp4"))
 
-        # Generating and saving the YouTube video.
-        try:
-            process_raw_video_and_audio(
-                raw_video=raw_video,
-                raw_audio=raw_audio,
-                merged_video=merged_video,
-                fade_and_sliced_videos=fade_and_sliced_video,
+    # Iterating over every audio transcript.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                render_video,
+                inference_id=inference_id,
+                raw_video=raw_videos[inference_id],
+                audio_data_dir=audio_data_dir,
+                merged_videos_dir=merged_videos_dir,
+                fade_and_sliced_videos=fade_and_sliced_videos,
                 subtitles_dir=subtitles_dir,
                 videos_with_subtitles_dir=videos_with_subtitles_dir,
-                inference_id=inference_id
+                tracker=tracker,
+                budget=budget,
+                uploader=uploader
             )
-
-        except Exception as e:
-            ic(e)
-            ic(f"Failed on ID: {inference_id}")
+            for inference_id in inference_ids
+        ]
+        for future in futures:
+            future.result()
 
     return "Done"
 
@@ -211,16 +348,23 @@ def pipeline(num_videos_to_generate: int = NUM_VIDEOS_TO_GENERATE) -> bool:
     - num_videos_to_generate (int): The number of videos to generate.
 
     RETURNS:
-    bool
+    bool: False when every prompt combination is already used.
     """
-    # TODO: Make this within a temp dir, and save data to GCP after. Do not want
-    # any directories or files to be saved locally.
+    from icecream import ic
+    from generate_youtube_videos.text.deduplication import ScriptIndex
+    from generate_youtube_videos.history import HistoryStore
+    from generate_youtube_videos.sheets_sync import SheetsSync
+
     # 0. Creating directories for script.
     ic("🪼 0. Creating directories for script.")
     # The long video path will be made into a parameter.
     clean_up_pre_run()
     long_video_path = "/Users/paulfentress/Desktop/long_jellyfish_vid.mp4"
-    output_dir = initialize_empty_directories()
+    # The storage backend decides where the workspace is, and where the
+    # finished videos and history are published to.
+    storage = get_storage_backend()
+    uploader = BackgroundUploader(storage)
+    output_dir = initialize_empty_directories(storage=storage)
     ic(long_video_path)
     ic(output_dir)
 
@@ -230,37 +374,83 @@ def pipeline(num_videos_to_generate: int = NUM_VIDEOS_TO_GENERATE) -> bool:
     short_videos = segment_video(long_video_path, video_data_dir)
     ic(short_videos)
 
+    # Rows are appended to the history as each script completes.
+    history = HistoryStore(os.path.join(STATE_DIR, HISTORY_STORE))
+
     # 2. Generate n prompts.
     ic("🪼 2. Generates num_videos_to_generate prompts.")
+    used_prompts = UsedPrompts.load(os.path.join(STATE_DIR, USED_PROMPTS))
+    # Prompts in the history are used, including those of runs that
+    # stopped before the used prompts were saved.
+    if "VIDEO_SCRIPT_PROMPT" in history.columns():
+        used_prompts.add_history(
+            history.read_columns(["VIDEO_SCRIPT_PROMPT"]))
     video_script_prompts = create_video_script_prompts(
-        num_prompts=num_videos_to_generate)
+        num_prompts=num_videos_to_generate,
+        used_prompts=used_prompts
+    )
     ic(video_script_prompts)
+    # Each topic and question combination is only used once, so the
+    # combinations run out unless topics or questions are added.
+    if len(video_script_prompts) < num_videos_to_generate:
+        ic(f"Only {len(video_script_prompts)} of {num_videos_to_generate} "
+           "prompts are unused. Add topics or questions to the configs.")
+    if not video_script_prompts:
+        history.close()
+        uploader.close()
+        storage.cleanup()
+        return False
 
     # 3. Generate the scripts by calling API.
     ic("🪼 3. Generate the scripts by calling API.")
-    data = generate_youtube_shorts_scripts(video_script_prompts)
+    script_index = ScriptIndex.load(os.path.join(STATE_DIR, SCRIPT_INDEX))
+    # Scripts in the history are checked against too. Only those not
+    # indexed yet are hashed.
+    if "VIDEO_SCRIPT" in history.columns():
+        script_index.add_history(
+            history.read_columns(["INFERENCE_ID", "VIDEO_SCRIPT"]))
+    run_started = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    data = generate_youtube_shorts_scripts(
+        video_script_prompts,
+        script_index=script_index,
+        history=history
+    )
     ic(data)
 
     # 4. Save data locally.
     ic("🪼 4. Save data locally.")
     csv_path = f"{output_dir}/{HISTORY}/{GOOGLE_SHEET_NAME}.csv"
-    data.to_csv(csv_path)
+    history.export_csv(csv_path, since=run_started)
     ic(csv_path)
+    # The local copy is kept, because the audio is generated from it.
+    uploader.submit(HISTORY, csv_path, keep_local=True)
+
+    # Combinations used in this run are skipped in future runs.
+    used_prompts.add_history(data)
+
+    # The redirect app reloads the code map when it changes, so the new
+    # short links work as soon as the map is copied to it.
+    code_map_path = os.path.join(STATE_DIR, CODE_MAP)
+    export_code_map(history, code_map_path)
+    ic(code_map_path)
 
     # 5. Upload script data to Google Sheet.
     ic("🪼 5. Upload script data to Google Sheet.")
-    ic("SKIPPING")
-    # upload_data_to_google_sheets(data)
+    # Only the rows not pushed before are appended, in the background.
+    # The sync reads the history with its own connection.
+    sheets_sync = SheetsSync(HistoryStore(history.path))
+    sheets_thread = sheets_sync.start()
 
     # 6. Create audio files from scripts.
     ic("🪼 6. Create audio files from scripts.")
     audio_path = f"{output_dir}/{RAW_AUDIO}"
-    audio_data_dir = generate_raw_audio_files(csv_path, output_dir=audio_path)
+    # Each script is spoken with the VOICE recorded in its history row.
+    audio_data_dir = generate_raw_audio_files(
+        SpeechJob(script_csv_file=csv_path, output_dir=audio_path))
     ic(audio_data_dir)
 
     # 7. Setting up paths for data.
     ic("🪼 7. Setting up paths for data.")
-    output_dir = "Jellyfish"
     video_data_dir = f"{output_dir}/{ONE_MINUTE_VIDEOS}/"
     merged_videos_dir = f"{output_dir}/{VIDEOS_MERGED_WITH_AUDIO}/"
     fade_and_slice_videos = f"{output_dir}/{FADED_AND_SLICED_VIDEOS}/"
@@ -270,17 +460,34 @@ def pipeline(num_videos_to_generate: int = NUM_VIDEOS_TO_GENERATE) -> bool:
 
     # 8. Generate YouTube videos from short videos and audio.
     ic("🪼 8. Generate YouTube videos from short videos and audio. ")
+    # Intermediates are deleted once no render needs them, so peak disk
+    # usage depends on MAX_RENDER_WORKERS instead of the batch size.
+    budget = DiskBudget(output_dir)
+    tracker = IntermediateTracker(
+        on_delete=budget.notify,
+        enabled=DELETE_INTERMEDIATES
+    )
     job_status = generate_video_data(
         video_data_dir=video_data_dir,
         audio_data_dir=audio_data_dir,
         merged_videos_dir=merged_videos_dir,
         fade_and_sliced_videos=fade_and_slice_videos,
         subtitles_dir=subtitles_dir,
-        videos_with_subtitles_dir=videos_with_subtitles_dir
+        videos_with_subtitles_dir=videos_with_subtitles_dir,
+        uploader=uploader,
+        tracker=tracker,
+        budget=budget
     )
     ic(job_status)
-
-    # 9. Cleaning up data.
+    ic(budget.held_back)
+
+    # 9. Waiting for the last uploads, and cleaning up data.
+    ic("🪼 9. Waiting for the last uploads.")
+    ic(uploader.close())
+    ic(uploader.errors)
+    storage.cleanup()
+    sheets_thread.join()
+    ic(sheets_sync.error)
     # clean_up_post_run()
 
     return True
@@ -0,0 +1,299 @@
+"""Pushes new history rows to the Google Sheet.
+
+The INFERENCE_IDs already pushed are kept in a text file, one ID per
+line, so each sync only appends the rows added since the last one.
+Rows are appended in batches with the values.append API, so a sync
+costs one request to read the header plus one request per batch, no
+matter how large the history grows. Quota errors (429) and server
+errors are retried with exponential backoff.
+
+LocalSpreadsheet is a stand-in with the parts of the gspread
+Spreadsheet interface used here, so the sync can be tested without
+Google credentials.
+
+Typical usage example:
+
+    sync = SheetsSync(history)
+    thread = sync.start()
+    ...
+    thread.join()
+"""
+import os
+import random
+import threading
+import time
+from typing import Callable
+from configs import SPREADSHEET_ID
+from configs import GOOGLE_SHEET_NAME
+from configs import STATE_DIR
+from configs import SHEETS_SYNCED
+from configs import SHEETS_CREDENTIALS
+from configs import SHEETS_BATCH_ROWS
+from configs import SHEETS_MAX_RETRIES
+from configs import SHEETS_BACKOFF_SECONDS
+from generate_youtube_videos.history import HistoryStore
+
+# Quota exceeded, and server errors worth retrying.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def get_spreadsheet(
+        spreadsheet_id: str = SPREADSHEET_ID,
+        sheet_name: str = GOOGLE_SHEET_NAME,
+        credentials: str = SHEETS_CREDENTIALS):
+    """Opens the spreadsheet with the service account, and adds the
+    worksheet the history is synced to if it does not exist yet."""
+    import gspread
+    client = gspread.service_account(filename=credentials)
+    spreadsheet = client.open_by_key(spreadsheet_id)
+    try:
+        spreadsheet.worksheet(sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        spreadsheet.add_worksheet(title=sheet_name, rows=1, cols=1)
+    return spreadsheet
+
+
+def status_code(error: Exception) -> int:
+    """HTTP status code of an API error, None for other errors."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def with_backoff(
+        request: Callable,
+        max_retries: int = SHEETS_MAX_RETRIES,
+        backoff_seconds: float = SHEETS_BACKOFF_SECONDS,
+        sleep: Callable = time.sleep):
+    """DESCRIPTION:
+    Makes a request, retrying quota and server errors with exponential
+    backoff and jitter. Other errors are raised right away.
+
+    ARGS:
+    - request (Callable): Makes the request, takes no arguments.
+    - max_retries (int): Retries before the error is raised.
+    - backoff_seconds (float): Wait before the first retry, doubled
+    after each retry.
+    - sleep (Callable): Used to wait between retries.
+
+    RETURNS:
+    The response of the request.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if status_code(e) not in RETRYABLE_STATUS_CODES\
+                    or attempt == max_retries:
+                raise
+            wait = backoff_seconds * 2 ** attempt
+            sleep(wait + random.uniform(0, wait))
+
+
+class SyncedIds:
+    """INFERENCE_IDs already pushed to the sheet, persisted to a text
+    file that is appended to after each batch."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.ids = set()
+
+    @classmethod
+    def load(cls, path: str) -> "SyncedIds":
+        """Loads the pushed IDs from the file, if it exists."""
+        synced = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                synced.ids = {line.strip() for line in file if line.strip()}
+        return synced
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, inference_id: str) -> bool:
+        return inference_id in self.ids
+
+    def add_many(self, inference_ids: list) -> None:
+        """Marks IDs as pushed, and appends them to the file."""
+        new_ids = [
+            inference_id for inference_id in inference_ids
+            if inference_id not in self.ids
+        ]
+        self.ids.update(new_ids)
+
+        if self.path and new_ids:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as file:
+                file.writelines(
+                    inference_id + "\n" for inference_id in new_ids)
+
+
+def to_cell(value):
+    """Sheets has no null, so missing values are empty cells."""
+    return "" if value is None else value
+
+
+class SheetsSync:
+    """Appends the history rows not yet in the sheet."""
+
+    def __init__(
+            self,
+            history: HistoryStore,
+            spreadsheet=None,
+            synced: SyncedIds = None,
+            sheet_name: str = GOOGLE_SHEET_NAME,
+            batch_rows: int = SHEETS_BATCH_ROWS,
+            sleep: Callable = time.sleep):
+        self.history = history
+        self.spreadsheet = spreadsheet
+        self.synced = synced if synced is not None else\
+            SyncedIds.load(os.path.join(STATE_DIR, SHEETS_SYNCED))
+        self.sheet_name = sheet_name
+        self.batch_rows = batch_rows
+        self.sleep = sleep
+        self.error = None
+
+    def _request(self, request: Callable):
+        return with_backoff(request, sleep=self.sleep)
+
+    def _sync_header(self) -> list:
+        """Reads the header row, and extends it with history columns
+        added since the last sync. Columns are never reordered, so the
+        rows already in the sheet stay aligned."""
+        response = self._request(lambda: self.spreadsheet.values_get(
+            f"'{self.sheet_name}'!1:1"))
+        values = response.get("values", [])
+        header = list(values[0]) if values else []
+
+        missing = [
+            column for column in self.history.columns()
+            if column not in header
+        ]
+        if missing:
+            header += missing
+            self._request(lambda: self.spreadsheet.values_update(
+                f"'{self.sheet_name}'!A1",
+                params={"valueInputOption": "RAW"},
+                body={"values": [header]}
+            ))
+        return header
+
+    def sync(self) -> int:
+        """DESCRIPTION:
+        Appends every history row whose INFERENCE_ID has not been
+        pushed, in batches. IDs are marked as pushed after each batch,
+        so a failed sync resumes from the first batch not appended.
+
+        ARGS: None
+
+        RETURNS:
+        num_rows (int): Number of rows appended.
+        """
+        header = self._sync_header()
+        # Columns in the sheet but no longer in the history are blank.
+        columns = [
+            column for column in header if column in self.history.columns()
+        ]
+        id_index = columns.index("INFERENCE_ID")
+
+        pending = [
+            row for row in self.history.iter_rows(columns)
+            if row[id_index] not in self.synced
+        ]
+
+        # Position of each sheet column in the history rows.
+        positions = [
+            columns.index(column) if column in columns else None
+            for column in header
+        ]
+
+        for start in range(0, len(pending), self.batch_rows):
+            batch = pending[start:start + self.batch_rows]
+            values = [
+                [
+                    to_cell(row[position] if position is not None else None)
+                    for position in positions
+                ]
+                for row in batch
+            ]
+            # RAW stores the values as they are. USER_ENTERED would parse
+            # scripts and titles starting with "=" as formulas, and turn
+            # numbers and dates in text into other values.
+            self._request(lambda: self.spreadsheet.values_append(
+                f"'{self.sheet_name}'!A1",
+                params={
+                    "valueInputOption": "RAW",
+                    "insertDataOption": "INSERT_ROWS"
+                },
+                body={"values": values}
+            ))
+            self.synced.add_many([row[id_index] for row in batch])
+
+        return len(pending)
+
+    def _run(self) -> None:
+        try:
+            if self.spreadsheet is None:
+                self.spreadsheet = get_spreadsheet(sheet_name=self.sheet_name)
+            self.sync()
+        except Exception as e:
+            self.error = e
+
+    def start(self) -> threading.Thread:
+        """Syncs on a background thread, opening the spreadsheet first
+        if none was passed. Errors are kept in self.error, instead of
+        stopping the pipeline."""
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return thread
+
+
+class QuotaExceededResponse:
+    status_code = 429
+
+
+class LocalSheetsError(Exception):
+    """Error raised by LocalSpreadsheet, with a response status code
+    like gspread's APIError."""
+
+    def __init__(self, response=QuotaExceededResponse()):
+        super().__init__(f"Sheets API error {response.status_code}")
+        self.response = response
+
+
+class LocalSpreadsheet:
+    """Stand-in for a gspread Spreadsheet holding a single worksheet.
+    Counts the requests made, and can fail the next requests with a
+    quota error, so tests can check batching and backoff."""
+
+    def __init__(self, fail_next: int = 0):
+        self.rows = []
+        self.requests = 0
+        self.fail_next = fail_next
+        self.value_input_options = set()
+
+    def _handle_request(self) -> None:
+        self.requests += 1
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise LocalSheetsError()
+
+    def values_get(self, range: str) -> dict:
+        self._handle_request()
+        return {"values": self.rows[:1]}
+
+    def values_update(self, range: str, params: dict, body: dict) -> dict:
+        self._handle_request()
+        self.value_input_options.add(params["valueInputOption"])
+        if self.rows:
+            self.rows[0] = body["values"][0]
+        else:
+            self.rows.append(body["values"][0])
+        return {"updatedRows": 1}
+
+    def values_append(self, range: str, params: dict, body: dict) -> dict:
+        self._handle_request()
+        self.value_input_options.add(params["valueInputOption"])
+        self.rows.extend(body["values"])
+        return {"updates": {"updatedRows": len(body["values"])}}
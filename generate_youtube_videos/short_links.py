@@ -0,0 +1,122 @@
+"""Short link codes for the video descriptions.
+
+Each video gets a base62 SHORT_CODE derived from its INFERENCE_ID when
+its script is generated, stored in the history with the TARGET_URL the
+link redirects to. Links like http://host/s/3kTMd9xQ replace the long
+?source=<uuid4> query string.
+
+The code map is exported as a JSON file of code to INFERENCE_ID and
+TARGET_URL, which the redirect app loads into memory and reloads when
+the file changes.
+
+Typical usage example:
+
+    codes = existing_codes(history)
+    code = short_code(inference_id, taken=codes)
+    export_code_map(history, os.path.join(STATE_DIR, CODE_MAP))
+"""
+import hashlib
+import json
+import os
+import string
+from configs import SHORT_CODE_LENGTH
+from configs import URL_TO_REDIRECT_TO
+from generate_youtube_videos.history import HistoryStore
+
+BASE62 = string.digits + string.ascii_letters
+
+
+def encode_base62(number: int) -> str:
+    """Base62 digits of a non negative integer."""
+    if number == 0:
+        return BASE62[0]
+    digits = []
+    while number:
+        number, remainder = divmod(number, 62)
+        digits.append(BASE62[remainder])
+    return "".join(reversed(digits))
+
+
+def short_code(
+        inference_id: str,
+        length: int = SHORT_CODE_LENGTH,
+        taken: set = None) -> str:
+    """DESCRIPTION:
+    Derives the short code of an INFERENCE_ID from its hash, so the
+    same ID always gets the same code. A code already taken by another
+    ID is lengthened until it is free.
+
+    ARGS:
+    - inference_id (str): The id that connects data in pipeline.
+    - length (int): Characters in the code, 8 gives 62^8 codes.
+    - taken (set): Codes already in use, the new code is added to it.
+
+    RETURNS:
+    code (str)
+    """
+    digest = hashlib.blake2b(inference_id.encode("utf-8")).digest()
+    # 64 bytes of hash gives far more than enough base62 digits.
+    digits = encode_base62(int.from_bytes(digest, "big"))
+    taken = taken if taken is not None else set()
+    while digits[:length] in taken:
+        length += 1
+    code = digits[:length]
+    taken.add(code)
+    return code
+
+
+def existing_codes(history: HistoryStore) -> set:
+    """Short codes already in the history."""
+    if "SHORT_CODE" not in history.columns():
+        return set()
+    return {
+        code for (code,) in history.iter_rows(["SHORT_CODE"])
+        if code is not None
+    }
+
+
+def export_code_map(history: HistoryStore, path: str) -> int:
+    """DESCRIPTION:
+    Writes the code map of every video in the history. Videos from
+    before short links have no SHORT_CODE, so they are added with the
+    code derived from their ID and URL_TO_REDIRECT_TO, which keeps the
+    clicks on their ?source= links recorded. The file is replaced in 
+    one rename, so the redirect app never reads a partly written map.
+
+    ARGS:
+    - history (HistoryStore): History with SHORT_CODE and TARGET_URL.
+    - path (str): Path of the JSON code map.
+
+    RETURNS:
+    num_codes (int): Number of codes in the map.
+    """
+    code_map = {}
+    if "SHORT_CODE" in history.columns():
+        rows = history.iter_rows(["SHORT_CODE", "INFERENCE_ID", "TARGET_URL"])
+        code_map = {
+            code: {"INFERENCE_ID": inference_id, "TARGET_URL": target_url}
+            for code, inference_id, target_url in rows
+            if code is not None
+        }
+        rows = history.iter_rows(["INFERENCE_ID", "SHORT_CODE"])
+        old_ids = [inference_id for inference_id, code in rows if code is None]
+    else:
+        old_ids = [inference_id for (inference_id,) in
+                   history.iter_rows(["INFERENCE_ID"])]
+    # Codes given to new videos are kept, a derived code that collides
+    # with one is lengthened.
+    taken = set(code_map)
+    for inference_id in old_ids:
+        code_map[short_code(inference_id, taken=taken)] = {
+            "INFERENCE_ID": inference_id,
+            "TARGET_URL": URL_TO_REDIRECT_TO,
+        }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(code_map, file)
+    os.replace(temp_path, path)
+    return len(code_map)
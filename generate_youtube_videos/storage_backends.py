@@ -0,0 +1,247 @@
+"""Where the pipeline keeps its working files and finished outputs.
+
+The ffmpeg and whisper stages read and write local paths, so every
+stage renders into a local workspace. A storage backend decides where
+that workspace lives, and where finished outputs (videos with subtitles
+and the HISTORY CSV) end up:
+
+- LocalDiskBackend: workspace on disk, outputs stay in the workspace.
+- TmpfsBackend: workspace in memory (/dev/shm), outputs are moved to
+  the output directory on disk.
+- ObjectStoreBackend: workspace in memory, outputs are uploaded to a
+  bucket, verified, and the local copies deleted.
+
+Outputs are published by a BackgroundUploader thread as soon as each
+video finishes rendering, so publishing overlaps with rendering the
+rest of the batch instead of running as a serial phase afterwards.
+
+Typical usage example:
+
+    storage = get_storage_backend()
+    with BackgroundUploader(storage) as uploader:
+        video = render(storage.path(VIDEOS_WITH_SUBTITLES))
+        uploader.submit(VIDEOS_WITH_SUBTITLES, video)
+    storage.cleanup()
+"""
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from configs import DESKTOP_PATH
+from configs import GOOGLE_SHEET_NAME
+from configs import STORAGE_BACKEND
+from configs import OUTPUT_BUCKET_GCP
+from generate_youtube_videos.cloud_storage import get_bucket
+from generate_youtube_videos.cloud_storage import is_unchanged
+from generate_youtube_videos.cloud_storage import upload_file
+
+# Memory backed file system on Linux. Other platforms fall back to the
+# temp dir.
+TMPFS_DIR = "/dev/shm"
+
+
+def default_output_dir() -> str:
+    """Directory the pipeline has always written to."""
+    return os.path.join(DESKTOP_PATH, GOOGLE_SHEET_NAME)
+
+
+def tmpfs_workspace() -> str:
+    """Creates a new workspace directory in memory, when available."""
+    parent = TMPFS_DIR if os.path.isdir(TMPFS_DIR) else None
+    return tempfile.mkdtemp(prefix=f"{GOOGLE_SHEET_NAME}_", dir=parent)
+
+
+class LocalDiskBackend:
+    """Renders and keeps every file in a directory on disk."""
+
+    def __init__(self, root: str = None):
+        self.root = root or default_output_dir()
+
+    def path(self, stage: str, file_name: str = "") -> str:
+        """Local path of a file in a stage directory."""
+        return os.path.join(self.root, stage, file_name)
+
+    def make_dirs(self, stages: list) -> str:
+        """DESCRIPTION:
+        Creates the workspace directory for each stage.
+
+        ARGS:
+        - stages (list): Stage directory names.
+
+        RETURNS:
+        root (str): The workspace directory.
+        """
+        for stage in stages:
+            os.makedirs(self.path(stage), exist_ok=True)
+        return self.root
+
+    def publish(
+            self,
+            stage: str,
+            local_path: str,
+            keep_local: bool = False) -> str:
+        """Outputs are already in their final location."""
+        return local_path
+
+    def cleanup(self) -> None:
+        """Files on disk are kept after the run."""
+        pass
+
+
+class TmpfsBackend(LocalDiskBackend):
+    """Renders in memory, and moves finished outputs to disk."""
+
+    def __init__(self, output_dir: str = None, root: str = None):
+        super().__init__(root or tmpfs_workspace())
+        self.output_dir = output_dir or default_output_dir()
+
+    def publish(
+            self,
+            stage: str,
+            local_path: str,
+            keep_local: bool = False) -> str:
+        """DESCRIPTION:
+        Copies a finished output to the output directory, and deletes
+        the local copy once the sizes match.
+
+        ARGS:
+        - stage (str): Stage directory name of the output.
+        - local_path (str): Path of the output in the workspace.
+        - keep_local (bool): Keep the workspace copy, for outputs read
+        by later stages.
+
+        RETURNS:
+        destination (str): Path of the published output.
+        """
+        destination = os.path.join(
+            self.output_dir, stage, os.path.basename(local_path))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(local_path, destination)
+        if os.path.getsize(destination) != os.path.getsize(local_path):
+            raise RuntimeError(
+                f"Copy of {local_path} to {destination} is incomplete.")
+        if not keep_local:
+            os.remove(local_path)
+        return destination
+
+    def cleanup(self) -> None:
+        """Frees the memory used by the workspace."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class ObjectStoreBackend(TmpfsBackend):
+    """Renders in memory, and uploads finished outputs to a bucket."""
+
+    def __init__(
+            self,
+            bucket,
+            prefix: str = GOOGLE_SHEET_NAME,
+            root: str = None):
+        super().__init__(root=root)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def blob_name(self, stage: str, file_name: str) -> str:
+        """Name of the blob an output is uploaded to."""
+        return f"{self.prefix}/{stage}/{file_name}"
+
+    def publish(
+            self,
+            stage: str,
+            local_path: str,
+            keep_local: bool = False) -> str:
+        """DESCRIPTION:
+        Uploads a finished output, and deletes the local copy once the
+        checksum of the uploaded blob matches the local file.
+
+        ARGS:
+        - stage (str): Stage directory name of the output.
+        - local_path (str): Path of the output in the workspace.
+        - keep_local (bool): Keep the workspace copy, for outputs read
+        by later stages.
+
+        RETURNS:
+        url (str): GCS URL of the published output.
+        """
+        blob_name = self.blob_name(stage, os.path.basename(local_path))
+        url = upload_file(self.bucket, local_path, blob_name)
+        if not is_unchanged(self.bucket.get_blob(blob_name), local_path):
+            raise RuntimeError(
+                f"Uploaded {url} does not match {local_path}.")
+        if not keep_local:
+            os.remove(local_path)
+        return url
+
+
+def get_storage_backend(name: str = STORAGE_BACKEND) -> LocalDiskBackend:
+    """DESCRIPTION:
+    Creates the storage backend set in the configs.
+
+    ARGS:
+    - name (str): One of "local", "tmpfs" or "gcs".
+
+    RETURNS:
+    storage (LocalDiskBackend)
+    """
+    if name == "local":
+        return LocalDiskBackend()
+    if name == "tmpfs":
+        return TmpfsBackend()
+    if name == "gcs":
+        return ObjectStoreBackend(get_bucket(OUTPUT_BUCKET_GCP))
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+class BackgroundUploader:
+    """Publishes outputs on a background thread, in the order they
+    were submitted. Failures are kept per file instead of stopping the
+    thread, so one failed upload does not lose the rest of the batch."""
+
+    def __init__(self, storage: LocalDiskBackend):
+        self.storage = storage
+        self.published = {}
+        self.errors = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(
+            self,
+            stage: str,
+            local_path: str,
+            keep_local: bool = False) -> None:
+        """Queues a finished output to be published."""
+        self._queue.put((stage, local_path, keep_local))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            stage, local_path, keep_local = item
+            try:
+                self.published[local_path] = self.storage.publish(
+                    stage, local_path, keep_local)
+            except Exception as e:
+                self.errors[local_path] = e
+
+    def close(self) -> dict:
+        """DESCRIPTION:
+        Waits for every queued output to be published.
+
+        ARGS: None
+
+        RETURNS:
+        published (dict): Published location for each local path.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        return self.published
+
+    def __enter__(self) -> "BackgroundUploader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,135 @@
+"""
+Tests for pulling clicks into the click store, and the daily report.
+"""
+import json
+import os
+import tempfile
+import msgpack
+from configs import VIDEO_TOPICS
+from configs import QUESTIONS
+from generate_youtube_videos.click_ingestion import COUNTS_FORMAT
+from generate_youtube_videos.click_ingestion import RAW_FORMAT
+from generate_youtube_videos.click_ingestion import ClickStore
+from generate_youtube_videos.click_ingestion import ClickSubscriber
+from generate_youtube_videos.click_ingestion import LocalSubscriber
+from generate_youtube_videos.click_ingestion import daily_report
+from generate_youtube_videos.click_ingestion import join_history
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.text.prompts import format_prompt
+
+DAY = 24 * 60 * 60
+
+
+def raw_click(inference_id: str) -> bytes:
+    return json.dumps({"INFERENCE_ID": inference_id}).encode("utf-8")
+
+
+def test_click_subscriber() -> None:
+    """DESCRIPTION:
+    Tests that raw and count messages are stored and acknowledged, that
+    redelivered and republished messages are counted once, that bad
+    messages are dropped, and that the store survives reopening and
+    compaction.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = ClickStore(temp_dir)
+        local = LocalSubscriber()
+        subscriber = ClickSubscriber(
+            local, store, subscription_path="clicks", max_messages=2)
+
+        local.publish(raw_click("id-a"), FORMAT=RAW_FORMAT)
+        local.publish(raw_click("id-a"))
+        local.publish(
+            msgpack.packb({"WINDOW_END": 100.0, "COUNTS": {"id-b": 5}}),
+            FORMAT=COUNTS_FORMAT)
+        local.publish(b"not json", FORMAT=RAW_FORMAT)
+        # The same spooled click, published again after a failed publish.
+        local.publish(raw_click("id-c"), FORMAT=RAW_FORMAT, SPOOL_ID="7")
+        local.publish(raw_click("id-c"), FORMAT=RAW_FORMAT, SPOOL_ID="7")
+
+        assert subscriber.drain() == 8, "Every click should be stored once."
+        message = "Every message pulled should be acknowledged."
+        assert local.acknowledged == 6, message
+        assert subscriber.invalid == 1, "The bad message should be counted."
+        message = "Counters should sum the clicks of each video."
+        assert store.counts() == {"id-a": 2, "id-b": 5, "id-c": 1}, message
+
+        # A batch stored but not acknowledged before a crash.
+        local.publish(raw_click("id-a"), FORMAT=RAW_FORMAT)
+        response = local.pull({"subscription": "clicks", "max_messages": 1})
+        pulled = response.received_messages[0].message
+        store.insert_batch([(pulled.message_id, [("id-a", 1.0, 1)])])
+        local.expire()
+        subscriber.drain()
+        message = "A redelivered message should not be counted again."
+        assert store.counts()["id-a"] == 3, message
+        store.close()
+
+        store = ClickStore(temp_dir)
+        clicks = store.read_clicks()
+        message = "Clicks should survive reopening the store."
+        assert int(clicks["COUNT"].sum()) == 9, message
+        assert store.compact() == len(clicks), "Chunks should be merged."
+        assert len(os.listdir(store.chunks_dir)) == 1, "One chunk is left."
+        message = "Compaction should keep every click."
+        assert store.read_clicks()["COUNT"].sum() == 9, message
+        store.close()
+
+
+def test_daily_report() -> None:
+    """DESCRIPTION:
+    Tests that clicks are summed by day and topic, with the cost per
+    click of the videos clicked, and that a history without prompts 
+    reports every click under the unknown topic.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        for index, topic in enumerate(VIDEO_TOPICS[:2]):
+            history.append({
+                "INFERENCE_ID": f"id-{index}",
+                "VIDEO_TITLE": f"Title {index}",
+                "VIDEO_SCRIPT_PROMPT": format_prompt(topic, QUESTIONS[0]),
+                "COST_OF_INFERENCE": 0.5,
+                "VOICE": "nova",
+            })
+
+        store = ClickStore(os.path.join(temp_dir, "clicks"))
+        store.insert_batch([("1", [
+            ("id-0", 10.0, 3),
+            ("id-1", 20.0, 1),
+            ("id-0", DAY + 10.0, 1),
+            ("id-unknown", 30.0, 2),
+        ])])
+        report = daily_report(store, history)
+        rows = {
+            (str(row.DAY), row.TOPIC): row for row in report.itertuples()
+        }
+
+        first_day = rows[("1970-01-01", VIDEO_TOPICS[0])]
+        message = "Clicks should be summed per day and topic."
+        assert first_day.CLICKS == 3, message
+        assert rows[("1970-01-02", VIDEO_TOPICS[0])].CLICKS == 1, message
+        message = "Cost per click should be the cost over the clicks."
+        assert abs(first_day.COST_PER_CLICK - 0.5 / 3) < 1e-9, message
+        message = "Clicks of videos missing from the history are kept."
+        assert rows[("1970-01-01", "unknown")].CLICKS == 2, message
+        message = "The VOICE of the videos should be joined to the clicks."
+        joined = join_history(store.read_clicks(), history)
+        assert set(joined["VOICE"].dropna()) == {"nova"}, message
+
+        message = "Clicks should be reported before the history has prompts."
+        empty_history = HistoryStore(os.path.join(temp_dir, "empty.sqlite3"))
+        report = daily_report(store, empty_history)
+        assert set(report["TOPIC"]) == {"unknown"}, message
+        assert report["CLICKS"].sum() == 7, message
+        empty_history.close()
+        store.close()
+        history.close()
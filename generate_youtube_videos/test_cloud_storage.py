@@ -0,0 +1,124 @@
+"""
+Tests for parallel GCS transfers, using a LocalBucket stand-in so
+they run without GCP credentials.
+"""
+import os
+import tempfile
+from generate_youtube_videos.cloud_storage import LocalBucket
+from generate_youtube_videos.cloud_storage import download_blobs
+from generate_youtube_videos.cloud_storage import upload_file
+from generate_youtube_videos.cloud_storage import sync_directory_to_bucket
+from configs import CHUNKED_UPLOAD_THRESHOLD
+from configs import UPLOAD_CHUNK_SIZE
+
+
+def write_file(path: str, content: bytes) -> str:
+    """Writes content to a file, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(content)
+    return path
+
+
+def test_download_blobs() -> None:
+    """DESCRIPTION:
+    Tests downloading blobs in parallel, filtering by suffix, and
+    skipping files that are already downloaded and unchanged.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bucket = LocalBucket(os.path.join(temp_dir, "bucket"))
+        for i in range(5):
+            write_file(
+                os.path.join(bucket.root, "Jellyfish", "RAW_AUDIO", f"{i}.mp3"),
+                f"audio {i}".encode("utf-8")
+            )
+        write_file(
+            os.path.join(bucket.root, "Jellyfish", "RAW_AUDIO", "notes.txt"),
+            b"not audio"
+        )
+
+        dest_dir = os.path.join(temp_dir, "downloads")
+        os.makedirs(dest_dir)
+        paths = download_blobs(bucket, "Jellyfish/RAW_AUDIO/", dest_dir,
+                               suffix=".mp3", max_workers=4)
+
+        message = "Only the mp3 files should be downloaded, in blob order."
+        expected = [os.path.join(dest_dir, f"{i}.mp3") for i in range(5)]
+        assert paths == expected, message
+        assert all(os.path.exists(path) for path in paths), message
+
+        # Change one local file, so only that file is downloaded again.
+        write_file(paths[0], b"changed")
+        bucket.downloads.clear()
+        download_blobs(bucket, "Jellyfish/RAW_AUDIO/", dest_dir,
+                       suffix=".mp3")
+
+        message = "Unchanged files should not be downloaded again."
+        assert bucket.downloads == ["Jellyfish/RAW_AUDIO/0.mp3"], message
+        with open(paths[0], "rb") as file:
+            assert file.read() == b"audio 0", message
+
+
+def test_upload_file() -> None:
+    """DESCRIPTION:
+    Tests that unchanged files are not uploaded again, and that large
+    files are uploaded in chunks.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bucket = LocalBucket(os.path.join(temp_dir, "bucket"), "videos")
+        source = write_file(os.path.join(temp_dir, "video.mp4"), b"video")
+
+        url = upload_file(bucket, source, "Jellyfish/video.mp4")
+        message = "Upload should return the GCS URL."
+        assert url == "gs://videos/Jellyfish/video.mp4", message
+
+        upload_file(bucket, source, "Jellyfish/video.mp4")
+        message = "Unchanged file should not be uploaded again."
+        assert bucket.uploads == ["Jellyfish/video.mp4"], message
+
+        large_source = write_file(
+            os.path.join(temp_dir, "large.mp4"),
+            b"0" * (CHUNKED_UPLOAD_THRESHOLD + 1)
+        )
+        upload_file(bucket, large_source, "Jellyfish/large.mp4")
+
+        message = "Large files should be uploaded in chunks."
+        chunk_size = bucket.chunk_sizes["Jellyfish/large.mp4"]
+        assert chunk_size == UPLOAD_CHUNK_SIZE, message
+        message = "Small files should be uploaded in a single request."
+        assert bucket.chunk_sizes["Jellyfish/video.mp4"] is None, message
+
+
+def test_sync_directory_to_bucket() -> None:
+    """DESCRIPTION:
+    Tests uploading a directory in parallel, and that only changed files
+    are uploaded when the directory is synced again.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bucket = LocalBucket(os.path.join(temp_dir, "bucket"))
+        local_dir = os.path.join(temp_dir, "VIDEOS_WITH_SUBTITLES")
+        for i in range(3):
+            write_file(os.path.join(local_dir, f"{i}.mp4"), bytes([i]) * 10)
+
+        urls = sync_directory_to_bucket(bucket, local_dir, "Jellyfish/")
+        message = "Every file should be uploaded."
+        assert len(urls) == 3 and len(bucket.uploads) == 3, message
+
+        write_file(os.path.join(local_dir, "1.mp4"), b"edited")
+        bucket.uploads.clear()
+        sync_directory_to_bucket(bucket, local_dir, "Jellyfish/")
+
+        message = "Only the changed file should be uploaded."
+        assert bucket.uploads == ["Jellyfish/1.mp4"], message
@@ -0,0 +1,82 @@
+"""
+Tests for the append only history store.
+"""
+import os
+import tempfile
+import pandas as pd
+from generate_youtube_videos.history import HistoryStore
+
+
+def make_row(index: int, date_time: str) -> dict:
+    """History row with the columns used by the later stages."""
+    return {
+        "VIDEO_SCRIPT": f"Script {index}",
+        "VIDEO_TITLE": f"Title {index}",
+        "INFERENCE_ID": f"id-{index}",
+        "DATE_TIME": date_time,
+        "COST_OF_INFERENCE": 0.5 * index,
+    }
+
+
+def test_history_store() -> None:
+    """DESCRIPTION:
+    Tests appending rows, looking up single IDs, reading only some
+    columns, and that appended rows survive reopening the store.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "STATE", "history.sqlite3")
+        history = HistoryStore(path)
+        history.append(make_row(0, "2024-01-01 10:00:00"))
+        history.append(make_row(1, "2024-01-02 10:00:00"))
+        # Rows from a crashed batch are committed as they are appended.
+        history.close()
+
+        history = HistoryStore(path)
+        message = "Appended rows should survive reopening the store."
+        assert len(history) == 2, message
+
+        row = history.get("id-1")
+        message = "Lookup by ID returned the wrong row."
+        assert row["VIDEO_TITLE"] == "Title 1", message
+        assert row["COST_OF_INFERENCE"] == 0.5, message
+        assert history.get("missing") is None, message
+
+        # New meta data adds a column without a migration.
+        history.append({**make_row(2, "2024-01-03 10:00:00"), "VOICE": "echo"})
+        message = "New columns should be added to the table."
+        assert history.get("id-2")["VOICE"] == "echo", message
+
+        df = history.read_columns(["INFERENCE_ID", "VIDEO_TITLE"],
+                                  since="2024-01-02 00:00:00")
+        message = "Only the requested columns and rows should be read."
+        assert list(df.columns) == ["INFERENCE_ID", "VIDEO_TITLE"], message
+        assert list(df["INFERENCE_ID"]) == ["id-1", "id-2"], message
+
+        df = history.read_columns(["VIDEO_TITLE"], inference_ids=["id-0"])
+        assert list(df["VIDEO_TITLE"]) == ["Title 0"], message
+
+
+def test_history_export_csv() -> None:
+    """DESCRIPTION:
+    Tests that the CSV export reads back like the CSV the pipeline used
+    to write.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        rows = [make_row(i, "2024-01-01 10:00:00") for i in range(3)]
+        history.append_many(rows)
+
+        csv_path = history.export_csv(os.path.join(temp_dir, "Jellyfish.csv"))
+        df = pd.read_csv(csv_path, index_col=0)
+
+        message = "Exported CSV does not match the appended rows."
+        pd.testing.assert_frame_equal(df, pd.DataFrame(rows), check_like=True)
+        assert list(df.columns)[:2] == ["INFERENCE_ID", "DATE_TIME"], message
@@ -0,0 +1,101 @@
+"""
+Tests for reference counted intermediate files and the disk budget.
+"""
+import os
+import tempfile
+import threading
+import time
+from generate_youtube_videos.intermediates import DiskBudget
+from generate_youtube_videos.intermediates import IntermediateTracker
+
+
+def write_file(path: str, size: int) -> str:
+    """Writes a file of the given size."""
+    with open(path, "wb") as file:
+        file.write(b"0" * size)
+    return path
+
+
+def test_intermediate_tracker() -> None:
+    """DESCRIPTION:
+    Tests that shared files are deleted after their last use, unused
+    files right away, and that a disabled tracker keeps every file.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shared = write_file(os.path.join(temp_dir, "shared.mp4"), 10)
+        unused = write_file(os.path.join(temp_dir, "unused.mp4"), 10)
+        failed = write_file(os.path.join(temp_dir, "failed.mp4"), 10)
+
+        tracker = IntermediateTracker()
+        tracker.register(shared, uses=2)
+        tracker.register(unused, uses=0)
+        tracker.register(failed)
+
+        message = "Files not needed by any stage should be deleted."
+        assert not os.path.exists(unused), message
+
+        tracker.release(shared)
+        message = "Files still needed by a stage should be kept."
+        assert os.path.exists(shared), message
+        assert tracker.pending() == {shared: 1, failed: 1}, message
+
+        tracker.release(shared)
+        message = "Files should be deleted after their last use."
+        assert not os.path.exists(shared), message
+
+        tracker.discard(failed)
+        message = "Discarded files should be deleted whatever their uses."
+        assert not os.path.exists(failed), message
+        assert tracker.pending() == {}, message
+
+        kept = write_file(os.path.join(temp_dir, "kept.mp4"), 10)
+        disabled = IntermediateTracker(enabled=False)
+        disabled.register(kept)
+        disabled.release(kept)
+        message = "A disabled tracker should not delete files."
+        assert os.path.exists(kept), message
+
+
+def test_disk_budget() -> None:
+    """DESCRIPTION:
+    Tests that a render is held back while the workspace is over the
+    budget, and starts once an intermediate is deleted.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        budget = DiskBudget(
+            temp_dir, max_bytes=1000, render_bytes=100, poll_interval=5)
+        tracker = IntermediateTracker(on_delete=budget.notify)
+        intermediate = write_file(os.path.join(temp_dir, "merged.mp4"), 900)
+        tracker.register(intermediate)
+
+        # Always allowed to start when no renders are in flight.
+        budget.acquire()
+
+        started = threading.Event()
+
+        def second_render():
+            with budget.reserve():
+                started.set()
+
+        thread = threading.Thread(target=second_render)
+        thread.start()
+        time.sleep(0.1)
+        message = "Render should be held back while over the budget."
+        assert not started.is_set(), message
+        assert budget.held_back == 1, message
+
+        tracker.release(intermediate)
+        thread.join(timeout=2)
+        message = "Deleting an intermediate should let the render start."
+        assert started.is_set(), message
+
+        budget.release()
+        assert budget.in_flight == 0, "Renders should release the budget."
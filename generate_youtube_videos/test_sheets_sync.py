@@ -0,0 +1,94 @@
+"""
+Tests for the Google Sheets sync, using a LocalSpreadsheet stand-in.
+"""
+import os
+import tempfile
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.sheets_sync import LocalSpreadsheet
+from generate_youtube_videos.sheets_sync import SheetsSync
+from generate_youtube_videos.sheets_sync import SyncedIds
+
+
+def append_rows(history: HistoryStore, start: int, stop: int) -> None:
+    """Appends history rows with IDs from start to stop."""
+    for index in range(start, stop):
+        history.append({
+            "INFERENCE_ID": f"id-{index}",
+            "DATE_TIME": "2024-01-01 10:00:00",
+            "VIDEO_TITLE": f"Title {index}",
+        })
+
+
+def test_sheets_sync() -> None:
+    """DESCRIPTION:
+    Tests that only new rows are appended, in batches, and that the 
+    number of requests depends on the new rows, not the history size.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        synced_path = os.path.join(temp_dir, "sheets_synced.txt")
+        spreadsheet = LocalSpreadsheet()
+        append_rows(history, 0, 25)
+
+        sync = SheetsSync(history, spreadsheet, SyncedIds.load(synced_path),
+                          batch_rows=10)
+        num_rows = sync.sync()
+
+        message = "Every row should be appended after the header."
+        assert num_rows == 25, message
+        assert spreadsheet.rows[0] == ["INFERENCE_ID", "DATE_TIME",
+                                       "VIDEO_TITLE"], message
+        assert spreadsheet.rows[1] == ["id-0", "2024-01-01 10:00:00",
+                                       "Title 0"], message
+        message = "Values should be stored as they are, not parsed."
+        assert spreadsheet.value_input_options == {"RAW"}, message
+        # Header read, header write and 3 batches.
+        message = "Rows should be appended in batches."
+        assert spreadsheet.requests == 5, message
+
+        # A new run loads the pushed IDs from the file.
+        append_rows(history, 25, 27)
+        spreadsheet.requests = 0
+        sync = SheetsSync(history, spreadsheet, SyncedIds.load(synced_path),
+                          batch_rows=10)
+        num_rows = sync.sync()
+
+        message = "Only the new rows should be appended."
+        assert num_rows == 2, message
+        assert len(spreadsheet.rows) == 28, message
+        assert spreadsheet.requests == 2, message
+
+        message = "Syncing with no new rows should only read the header."
+        spreadsheet.requests = 0
+        assert sync.sync() == 0 and spreadsheet.requests == 1, message
+
+
+def test_sheets_sync_backoff() -> None:
+    """DESCRIPTION:
+    Tests that quota errors are retried with backoff, on a background
+    thread.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        append_rows(history, 0, 3)
+        spreadsheet = LocalSpreadsheet(fail_next=2)
+        waits = []
+
+        sync = SheetsSync(history, spreadsheet, SyncedIds(),
+                          sleep=waits.append)
+        sync.start().join(timeout=5)
+
+        message = "Quota errors should be retried."
+        assert sync.error is None, message
+        assert len(spreadsheet.rows) == 4, message
+
+        message = "Retries should back off exponentially."
+        assert len(waits) == 2 and waits[1] >= waits[0], message
@@ -0,0 +1,73 @@
+"""
+Tests for the short link codes and the code map export.
+"""
+import json
+import os
+import tempfile
+from configs import URL_TO_REDIRECT_TO
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.short_links import BASE62
+from generate_youtube_videos.short_links import existing_codes
+from generate_youtube_videos.short_links import export_code_map
+from generate_youtube_videos.short_links import short_code
+
+
+def test_short_code() -> None:
+    """DESCRIPTION:
+    Tests that codes are base62, stable per ID, and lengthened when the
+    code is already taken.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    code = short_code("id-a", length=8)
+    message = "Codes should be 8 base62 characters."
+    assert len(code) == 8 and all(char in BASE62 for char in code), message
+    assert short_code("id-a") == code, "Codes should be stable per ID."
+    assert short_code("id-b") != code, "IDs should get different codes."
+
+    taken = {code}
+    message = "A taken code should be lengthened."
+    assert short_code("id-a", length=8, taken=taken) == \
+        short_code("id-a", length=9), message
+    assert len(taken) == 2, "The new code should be marked as taken."
+
+
+def test_export_code_map() -> None:
+    """DESCRIPTION:
+    Tests that the code map holds the codes in the history, and the
+    videos from before short links.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        history.append({"INFERENCE_ID": "id-old"})
+        assert existing_codes(history) == set(), "No codes yet."
+
+        history.append({
+            "INFERENCE_ID": "id-a",
+            "SHORT_CODE": "abc",
+            "TARGET_URL": "https://example.com/a",
+        })
+        path = os.path.join(temp_dir, "codes", "code_map.json")
+        message = "Every video in the history should be exported."
+        assert export_code_map(history, path) == 2, message
+        with open(path, "r") as file:
+            code_map = json.load(file)
+        message = "Videos with a short code should keep it."
+        assert code_map["abc"] == {
+            "INFERENCE_ID": "id-a",
+            "TARGET_URL": "https://example.com/a",
+        }, message
+        message = "Videos from before short links should get a derived "\
+            "code to the donation page."
+        assert code_map[short_code("id-old")] == {
+            "INFERENCE_ID": "id-old",
+            "TARGET_URL": URL_TO_REDIRECT_TO,
+        }, message
+        assert existing_codes(history) == {"abc"}, message
+        history.close()
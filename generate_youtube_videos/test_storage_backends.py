@@ -0,0 +1,89 @@
+"""
+Tests for the storage backends and the background uploader, using a
+LocalBucket stand-in for the object store.
+"""
+import os
+import tempfile
+from generate_youtube_videos.cloud_storage import LocalBucket
+from generate_youtube_videos.storage_backends import BackgroundUploader
+from generate_youtube_videos.storage_backends import ObjectStoreBackend
+from generate_youtube_videos.storage_backends import TmpfsBackend
+from generate_youtube_videos.file_operations import initialize_empty_directories
+from configs import HISTORY
+from configs import VIDEOS_WITH_SUBTITLES
+
+
+def render(storage, stage: str, file_name: str, content: bytes) -> str:
+    """Writes a file into a stage of the workspace, like a render."""
+    path = storage.path(stage, file_name)
+    with open(path, "wb") as file:
+        file.write(content)
+    return path
+
+
+def test_object_store_backend() -> None:
+    """DESCRIPTION:
+    Tests that finished videos are uploaded in the background, verified,
+    and deleted locally, while outputs kept for later stages stay.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bucket = LocalBucket(os.path.join(temp_dir, "bucket"), "videos")
+        storage = ObjectStoreBackend(
+            bucket, root=os.path.join(temp_dir, "workspace"))
+        initialize_empty_directories(storage=storage)
+
+        with BackgroundUploader(storage) as uploader:
+            csv_path = render(storage, HISTORY, "Jellyfish.csv", b"a,b")
+            uploader.submit(HISTORY, csv_path, keep_local=True)
+            videos = [
+                render(storage, VIDEOS_WITH_SUBTITLES, f"{i}.mp4", bytes([i]))
+                for i in range(3)
+            ]
+            for video in videos:
+                uploader.submit(VIDEOS_WITH_SUBTITLES, video)
+
+        message = "Every output should be published."
+        assert not uploader.errors, message
+        assert uploader.published[videos[0]] ==\
+            "gs://videos/Jellyfish/VIDEOS_WITH_SUBTITLES/0.mp4", message
+        assert len(bucket.uploads) == 4, message
+
+        message = "Uploaded videos should be deleted locally."
+        assert not any(os.path.exists(video) for video in videos), message
+
+        message = "The history CSV is still needed locally."
+        assert os.path.exists(csv_path), message
+
+        storage.cleanup()
+        message = "Cleanup should remove the workspace."
+        assert not os.path.exists(storage.root), message
+
+
+def test_tmpfs_backend() -> None:
+    """DESCRIPTION:
+    Tests that finished videos are moved from the workspace to the 
+    output directory.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = os.path.join(temp_dir, "Jellyfish")
+        storage = TmpfsBackend(output_dir=output_dir)
+        try:
+            initialize_empty_directories(storage=storage)
+            video = render(storage, VIDEOS_WITH_SUBTITLES, "id.mp4", b"video")
+            published = storage.publish(VIDEOS_WITH_SUBTITLES, video)
+        finally:
+            storage.cleanup()
+
+        message = "Video should be moved to the output directory."
+        assert published == os.path.join(
+            output_dir, VIDEOS_WITH_SUBTITLES, "id.mp4"), message
+        assert os.path.exists(published) and not os.path.exists(video),\
+            message
@@ -0,0 +1,249 @@
+"""
+Tests for the resumable YouTube uploads, against a local stand-in of
+the upload API.
+"""
+import os
+import tempfile
+import requests
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.youtube_upload import CHUNK_MULTIPLE
+from generate_youtube_videos.youtube_upload import LocalYouTubeServer
+from generate_youtube_videos.youtube_upload import QuotaExhausted
+from generate_youtube_videos.youtube_upload import UploadError
+from generate_youtube_videos.youtube_upload import UploadState
+from generate_youtube_videos.youtube_upload import YOUTUBE_UPLOAD_COST
+from generate_youtube_videos.youtube_upload import URL_TO_REDIRECT_TO
+from generate_youtube_videos.youtube_upload import YouTubeUploader
+from generate_youtube_videos.youtube_upload import video_metadata
+from generate_youtube_videos.youtube_upload import videos_to_upload
+
+
+def write_video(directory: str, inference_id: str, size: int) -> bytes:
+    data = os.urandom(size)
+    with open(os.path.join(directory, f"{inference_id}.mp4"), "wb") as file:
+        file.write(data)
+    return data
+
+
+class DroppedConnectionSession(requests.Session):
+    """Session whose connection drops after a number of chunks."""
+
+    def __init__(self, chunks_before_drop: int):
+        super().__init__()
+        self.chunks_before_drop = chunks_before_drop
+
+    def put(self, url, data=None, **kwargs):
+        if data:
+            if self.chunks_before_drop == 0:
+                raise requests.exceptions.ConnectionError("Connection lost")
+            self.chunks_before_drop -= 1
+        return super().put(url, data=data, **kwargs)
+
+
+class FailedStartSession(requests.Session):
+    """Session whose requests to start an upload fail a number of
+    times."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def post(self, url, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise requests.exceptions.ConnectionError("Connection refused")
+        return super().post(url, **kwargs)
+
+
+def test_upload_many() -> None:
+    """DESCRIPTION:
+    Tests that videos in the history are uploaded concurrently in
+    chunks with their titles, retrying server errors and continuing
+    from what the server kept, and that uploaded videos are skipped.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    server = LocalYouTubeServer().start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = HistoryStore(os.path.join(temp_dir, "history.sqlite3"))
+        videos_dir = os.path.join(temp_dir, "videos")
+        os.makedirs(videos_dir)
+        data = {}
+        for index in range(3):
+            inference_id = f"id-{index}"
+            history.append({
+                "INFERENCE_ID": inference_id,
+                "VIDEO_TITLE": f'"Title {index}"',
+                "SHORT_LINK": f"https://jelly.example/s/code{index}",
+            })
+            data[inference_id] = write_video(
+                videos_dir, inference_id, 2 * CHUNK_MULTIPLE + 1000 * index)
+        write_video(videos_dir, "not-in-history", 10)
+
+        state = UploadState(os.path.join(temp_dir, "uploads.sqlite3"))
+        server.fail_next = [503]
+        server.partial_next = 1
+        uploader = YouTubeUploader(
+            requests.Session(), state,
+            upload_url=server.upload_url,
+            chunk_size=CHUNK_MULTIPLE,
+            sleep=lambda seconds: None
+        )
+        videos = videos_to_upload(history, videos_dir, state)
+        message = "Only videos in the history should be uploaded."
+        assert [video[0] for video in videos] == list(data), message
+
+        results = uploader.upload_many(videos)
+        for inference_id, video_id in results.items():
+            message = f"{inference_id} should be uploaded, got {video_id}."
+            uploaded, metadata = server.videos[video_id]
+            assert uploaded == data[inference_id], message
+            assert state.get(inference_id)["STATUS"] == "uploaded", message
+        message = "Titles should be the history titles without quotes."
+        assert metadata["snippet"]["title"] == "Title 2", message
+        assert "code2" in metadata["snippet"]["description"], message
+
+        message = "Uploaded videos should not be uploaded again."
+        assert videos_to_upload(history, videos_dir, state) == [], message
+        state.close()
+        history.close()
+    server.stop()
+
+
+def test_resume_interrupted_upload() -> None:
+    """DESCRIPTION:
+    Tests that an upload interrupted by a crash continues from the
+    bytes the server has, in the same session, and that no session is
+    started once the daily quota is used up.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    server = LocalYouTubeServer().start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "id-a.mp4")
+        data = write_video(temp_dir, "id-a", 4 * CHUNK_MULTIPLE + 10)
+        metadata = {"snippet": {"title": "Title"}, "status": {}}
+        state_path = os.path.join(temp_dir, "uploads.sqlite3")
+
+        state = UploadState(state_path)
+        uploader = YouTubeUploader(
+            DroppedConnectionSession(chunks_before_drop=2), state,
+            upload_url=server.upload_url,
+            chunk_size=CHUNK_MULTIPLE,
+            max_retries=0
+        )
+        try:
+            uploader.upload("id-a", path, metadata)
+            assert False, "The dropped connection should fail the upload."
+        except requests.exceptions.ConnectionError:
+            pass
+        row = state.get("id-a")
+        message = "The upload URI and bytes sent should be kept."
+        assert row["UPLOAD_URI"] and row["BYTES_SENT"] == 2 * CHUNK_MULTIPLE,\
+            message
+        state.close()
+
+        state = UploadState(state_path)
+        uploader = YouTubeUploader(
+            requests.Session(), state,
+            upload_url=server.upload_url,
+            chunk_size=CHUNK_MULTIPLE,
+            daily_quota=1600
+        )
+        video_id = uploader.upload("id-a", path, metadata)
+        assert server.videos[video_id][0] == data, "The video should match."
+        message = "The upload should continue in the same session."
+        assert server.sessions_started == 1, message
+        message = "Bytes the server had should not be sent again."
+        assert server.bytes_received == len(data), message
+
+        write_video(temp_dir, "id-b", 10)
+        message = "No session should start once the quota is used up."
+        try:
+            uploader.upload("id-b", os.path.join(temp_dir, "id-b.mp4"), metadata)
+            assert False, message
+        except QuotaExhausted:
+            pass
+        assert server.sessions_started == 1, message
+        state.close()
+    server.stop()
+
+
+def test_quota_of_failed_sessions() -> None:
+    """DESCRIPTION:
+    Tests that retrying the start of a session reserves its quota once,
+    and that the quota is given back when no session is started.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    server = LocalYouTubeServer().start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state = UploadState(os.path.join(temp_dir, "uploads.sqlite3"))
+        metadata = {"snippet": {"title": "Title"}, "status": {}}
+        for inference_id in ("id-a", "id-b", "id-c"):
+            write_video(temp_dir, inference_id, 10)
+
+        uploader = YouTubeUploader(
+            FailedStartSession(failures=2), state,
+            upload_url=server.upload_url,
+            sleep=lambda seconds: None
+        )
+        uploader.upload("id-a", os.path.join(temp_dir, "id-a.mp4"), metadata)
+        message = "Retries of starting a session should reserve quota once."
+        assert state.quota_used() == YOUTUBE_UPLOAD_COST, message
+
+        uploader = YouTubeUploader(
+            FailedStartSession(failures=3), state,
+            upload_url=server.upload_url,
+            max_retries=2,
+            sleep=lambda seconds: None
+        )
+        try:
+            uploader.upload(
+                "id-b", os.path.join(temp_dir, "id-b.mp4"), metadata)
+            assert False, "The upload should fail without a session."
+        except requests.exceptions.ConnectionError:
+            pass
+        message = "Quota should be given back when the POST fails."
+        assert state.quota_used() == YOUTUBE_UPLOAD_COST, message
+
+        try:
+            uploader.upload(
+                "id-c", os.path.join(temp_dir, "id-c.mp4"), {"snippet": {}})
+            assert False, "A video without a title should be rejected."
+        except UploadError:
+            pass
+        message = "Quota should be given back when the POST is rejected."
+        assert state.quota_used() == YOUTUBE_UPLOAD_COST, message
+        assert state.get("id-c")["STATUS"] == "failed", message
+        state.close()
+    server.stop()
+
+
+def test_video_metadata() -> None:
+    """DESCRIPTION:
+    Tests that short links on a loopback address are not published in
+    the description.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    for link in ("http://127.0.0.1:8000/s/abc", "http://localhost/s/abc",
+                 "http://[::1]:8000/s/abc", None):
+        row = {"INFERENCE_ID": "id-a", "SHORT_LINK": link}
+        description = video_metadata(row, description="{link}")["snippet"][
+            "description"]
+        message = f"{link} should be replaced with the donation page."
+        assert description == URL_TO_REDIRECT_TO, message
+
+    row = {"INFERENCE_ID": "id-a", "SHORT_LINK": "https://jelly.example/s/abc"}
+    description = video_metadata(row, description="{link}")["snippet"][
+        "description"]
+    assert description == row["SHORT_LINK"], "Public links should be kept."
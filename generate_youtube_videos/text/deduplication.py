@@ -0,0 +1,217 @@
+"""Finds scripts that are near duplicates of scripts already generated.
+
+The assistant shares one thread for the whole batch, and often answers
+similar prompts with almost the same script. Exact duplicate checks do
+not catch these, so scripts are compared with MinHash signatures over
+word shingles. Locality sensitive hashing (LSH) buckets the signatures,
+so a lookup only compares against the few scripts sharing a bucket,
+instead of every historical script.
+
+The index is persisted as a JSON lines file, and new scripts are
+appended to it, so it is updated incrementally across runs.
+
+Typical usage example:
+
+    script_index = ScriptIndex.load("STATE/script_index.jsonl")
+    if not script_index.is_near_duplicate(video_script):
+        script_index.add(inference_id, video_script)
+"""
+import json
+import os
+import re
+import zlib
+import numpy as np
+from configs import NEAR_DUPLICATE_THRESHOLD
+
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32
+SHINGLE_SIZE = 3
+
+# Mersenne prime used for the permutation hashes. Shingle hashes are
+# 32 bit, so (a * x + b) fits in an unsigned 64 bit integer.
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+# Fixed seed so signatures stay comparable with the persisted index.
+_RANDOM = np.random.RandomState(seed=26)
+PERMUTATION_A = _RANDOM.randint(1, (1 << 31) - 1, NUM_PERMUTATIONS)\
+    .astype(np.uint64)
+PERMUTATION_B = _RANDOM.randint(0, (1 << 31) - 1, NUM_PERMUTATIONS)\
+    .astype(np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """DESCRIPTION:
+    Splits text into overlapping word n-grams, ignoring case and
+    punctuation.
+
+    ARGS:
+    - text (str): Script to split.
+    - size (int): Number of words in each shingle.
+
+    RETURNS:
+    shingles (set)
+    """
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {
+        " ".join(words[i:i + size]) for i in range(len(words) - size + 1)
+    }
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """DESCRIPTION:
+    Computes the MinHash signature of a script. The fraction of equal
+    values in two signatures estimates the Jaccard similarity of their
+    shingles.
+
+    ARGS:
+    - text (str): Script to compute the signature for.
+
+    RETURNS:
+    signature (np.ndarray)
+    """
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)),
+        dtype=np.uint64
+    )
+    permuted = (PERMUTATION_A[:, None] * hashes[None, :] + PERMUTATION_B[:, None])\
+        % MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def band_keys(signature: np.ndarray, num_bands: int = NUM_BANDS) -> list:
+    """DESCRIPTION:
+    Splits a signature into LSH bands. Scripts sharing any band key are
+    candidates for being near duplicates.
+
+    ARGS:
+    - signature (np.ndarray): MinHash signature.
+    - num_bands (int): Number of bands to split the signature into.
+
+    RETURNS:
+    keys (list): One hashable key per band.
+    """
+    return [
+        (band, bytes(rows)) for band, rows in
+        enumerate(np.split(signature, num_bands))
+    ]
+
+
+def estimate_similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimated Jaccard similarity between two signatures."""
+    return float(np.mean(signature == other))
+
+
+class ScriptIndex:
+    """MinHash LSH index over video scripts, persisted to a JSON lines
+    file."""
+
+    def __init__(
+            self,
+            path: str = None,
+            threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = {}
+
+    @classmethod
+    def load(
+            cls,
+            path: str,
+            threshold: float = NEAR_DUPLICATE_THRESHOLD) -> "ScriptIndex":
+        """Loads the index from the JSON lines file, if it exists."""
+        index = cls(path, threshold)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    record = json.loads(line)
+                    signature = np.array(record["signature"], dtype=np.uint64)
+                    index._insert(record["id"], signature)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def __contains__(self, script_id: str) -> bool:
+        return script_id in self.signatures
+
+    def _insert(self, script_id: str, signature: np.ndarray) -> None:
+        """Adds a signature to the in memory buckets."""
+        self.signatures[script_id] = signature
+        for key in band_keys(signature):
+            self.buckets.setdefault(key, []).append(script_id)
+
+    def most_similar(self, text: str) -> tuple:
+        """DESCRIPTION:
+        Finds the indexed script most similar to the text, only
+        comparing against scripts sharing an LSH bucket.
+
+        ARGS:
+        - text (str): Script to look up.
+
+        RETURNS:
+        (script_id: str | None, similarity: float)
+        """
+        signature = minhash_signature(text)
+        candidates = set()
+        for key in band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+
+        best_id, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = estimate_similarity(
+                signature, self.signatures[candidate])
+            if similarity > best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id, best_similarity
+
+    def is_near_duplicate(self, text: str) -> bool:
+        """True when an indexed script is at least threshold similar."""
+        _, similarity = self.most_similar(text)
+        return similarity >= self.threshold
+
+    def add(self, script_id: str, text: str) -> None:
+        """DESCRIPTION:
+        Adds a script to the index, and appends it to the persisted
+        file. Scripts already in the index are skipped.
+
+        ARGS:
+        - script_id (str): INFERENCE_ID of the script.
+        - text (str): The video script.
+
+        RETURNS: None
+        """
+        if script_id in self.signatures:
+            return
+        signature = minhash_signature(text)
+        self._insert(script_id, signature)
+
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            record = {"id": script_id, "signature": signature.tolist()}
+            with open(self.path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def add_history(self, df) -> int:
+        """DESCRIPTION:
+        Adds the VIDEO_SCRIPT values from a history dataframe, skipping
+        the INFERENCE_IDs already indexed, and rows without a script.
+
+        ARGS:
+        - df (pd.DataFrame): History data.
+
+        RETURNS:
+        num_added (int)
+        """
+        if "VIDEO_SCRIPT" not in df:
+            return 0
+        num_added = 0
+        for script_id, text in zip(df["INFERENCE_ID"], df["VIDEO_SCRIPT"]):
+            if script_id not in self.signatures and isinstance(text, str):
+                self.add(script_id, text)
+                num_added += 1
+        return num_added
@@ -1,70 +1,79 @@
+"""Generates the video scripts, titles and their metadata using the 
+OpenAI assistant with domain knowledge.
+
+Heavy libraries (openai, pandas, tiktoken, icecream) are imported inside
+the functions that use them, so importing this module is fast.
+"""
+from __future__ import annotations
 import random
-import tiktoken
-from icecream import ic
-import pandas as pd
+import json
 import re
 import time
 from datetime import datetime
-import pytz
+from datetime import timezone
 import uuid
-import openai
-from configs import VIDEO_TOPICS
-from configs import QUESTIONS
-from configs import QUESTION_RULES
-from configs import OPEN_AI_CLIENT
-from configs import THREAD
-from configs import ASSISTANT
+from functools import lru_cache
+from itertools import islice
+from configs import get_open_ai_client
+from configs import get_thread
+from configs import get_assistant
+from configs import get_secret
 from configs import CREATE_TITLE_PROMPT
+from configs import CREATE_SCRIPT_AND_TITLE_PROMPT
+from configs import GENERATE_SCRIPT_AND_TITLE_TOGETHER
 from configs import GPT_BASE_MODEL
 from configs import VIDEO_TITLE_TEMP
-from configs import GPT_ASSISTANT_ID
-from configs import PRICE_PER_TOKEN
-
-
-# TODO: Refactor (break into smaller functions)
-def create_video_script_prompts(num_prompts: int = 10) -> list:
+from configs import TTS_MODEL
+from configs import MAX_SCRIPT_REGENERATIONS
+from configs import URL_TO_REDIRECT_TO
+from configs import SHORT_LINK_BASE_URL
+from generate_youtube_videos.audio.generation import _pick_random_voice
+from generate_youtube_videos.cost_ledger import CostLedger
+from generate_youtube_videos.short_links import short_code
+from generate_youtube_videos.short_links import existing_codes
+from generate_youtube_videos.text.prompts import UsedPrompts
+from generate_youtube_videos.text.prompts import format_prompt
+from generate_youtube_videos.text.prompts import iterate_prompt_combinations
+from typing import Callable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from generate_youtube_videos.text.deduplication import ScriptIndex
+    from generate_youtube_videos.history import HistoryStore
+
+
+def create_video_script_prompts(
+        num_prompts: int = 10,
+        used_prompts: UsedPrompts = None) -> list:
     """DESCRIPTION:
     Creates combinations of questions and topics, which are used 
     to generate videos. Will by default create 10 videos. Can create
     up to 100. Have not tested over 100. Currently using 10, because
-    thats okay for YouTube daily upload limit.
+    thats okay for YouTube daily upload limit. Combinations used in 
+    previous runs are skipped.
 
     ARGS:
     - num_prompts (int): Number of prompts to create.
+    - used_prompts (UsedPrompts): Combinations already used.
 
     RETURNS:
     prompts: list
     """
-
-    prompts = []
-
-    topics = VIDEO_TOPICS
-    random.shuffle(topics)
-
-    questions = QUESTIONS
-    random.shuffle(questions)
-
-    # Looping through each topic and question.
-    for question in questions:
-        for topic in topics:
-            # Formatting the question and appending the rules
-            prompt =\
-                question.format(topic=topic) + " " + QUESTION_RULES
-
-            prompts.append(prompt)
-
-            # Stopping script when enough prompts are generated.
-            if len(prompts) == num_prompts:
-                return prompts
-
-    return prompts
+    combinations = iterate_prompt_combinations(used=used_prompts)
+    return [
+        format_prompt(topic, question)
+        for topic, question in islice(combinations, num_prompts)
+    ]
 
 
+@lru_cache(maxsize=None)
 def encoding_getter(encoding_type: str):
     """DESCRIPTION:
     Returns the appropriate encoding based on the given encoding type 
     (either an encoding string or a model name). Used for calculating
-    inference cost.
+    inference cost. Encodings are cached, so they are only looked up
+    once per encoding type.
 
     ARGS:
     - encoding_type (str): Encoded string or model name.
@@ -72,6 +81,7 @@ def encoding_getter(encoding_type: str):
     RETURNS:
     Encoding object.
     """
+    import tiktoken
     if "k_base" in encoding_type:
         return tiktoken.get_encoding(encoding_type)
     else:
@@ -111,35 +121,101 @@ def token_counter(string: str, encoding_type: str) -> int:
     return num_tokens
 
 
-def ask_gpt_jellyfish_expert(question: str) -> str:
+def token_counts(strings: list, encoding_type: str) -> list:
     """DESCRIPTION:
-    Asks the GPT assistant with domain knowledge a quesetion and 
-    returns a text response.
+    Returns the number of tokens in each string, encoding all the 
+    strings in a single batch.
+
+    ARGS:
+    - strings (list): Strings to count tokens from.
+    - encoding_type: (str): Encoding type for tokenizer.
+
+    RETURNS:
+    num_tokens (list)
+    """
+    encoding = encoding_getter(encoding_type)
+    return [len(tokens) for tokens in encoding.encode_batch(strings)]
+
+
+def record_call_usage(
+        ledger: CostLedger,
+        call: str,
+        usage,
+        prompt: str,
+        completion: str,
+        latency: float,
+        model: str = GPT_BASE_MODEL) -> None:
+    """DESCRIPTION:
+    Records the usage returned by the API in the cost ledger. Only 
+    when the API did not return usage, the tokens are counted locally.
+
+    ARGS:
+    - ledger (CostLedger): Ledger for the current video, can be None.
+    - call (str): Name of the call, used for the history columns.
+    - usage: Usage object returned by the API, can be None.
+    - prompt (str): Text sent to the API.
+    - completion (str): Text returned by the API.
+    - latency (float): Time the call took in seconds.
+    - model (str): Model the call was billed for.
+
+    RETURNS: None
+    """
+    if ledger is None:
+        return
+    if usage is not None:
+        ledger.record_usage(call, model, usage, latency=latency)
+        return
+    prompt_tokens, completion_tokens = token_counts(
+        [prompt, completion], GPT_BASE_MODEL)
+    ledger.record_tokens(
+        call, model, prompt_tokens, completion_tokens, latency)
+
+
+def run_assistant(question: str, response_format: dict = None) -> tuple:
+    """DESCRIPTION:
+    Adds a question to the assistant thread, runs the assistant and 
+    waits for the response.
 
     ARGS:
     - question (str): Question to ask GPT with knowledge base.
+    - response_format (dict): Optional response format for the run, 
+    for example {"type": "json_object"}.
 
     RETURNS:
-    cleaned_response (str): Answer from GPT that has been cleaned.
+    (response: str, usage, model: str): The raw text of the latest 
+    message in the thread, and the token usage and model of the run. 
+    The run uses the assistant's model, which can differ from 
+    GPT_BASE_MODEL.
     """
+    from icecream import ic
+
+    # Client, assistant and thread are created on first use.
+    client = get_open_ai_client()
+    thread = get_thread()
 
     # Creating the message.
-    message = OPEN_AI_CLIENT.beta.threads.messages.create(
-        thread_id=THREAD.id,
+    message = client.beta.threads.messages.create(
+        thread_id=thread.id,
         role="user",
         content=question
     )
 
+    # Only passing the response format when one is requested.
+    run_kwargs = {}
+    if response_format:
+        run_kwargs["response_format"] = response_format
+
     # Running the thread to get chat history.
-    run = openai.beta.threads.runs.create(
-        thread_id=THREAD.id,
-        assistant_id=ASSISTANT.id
+    run = client.beta.threads.runs.create(
+        thread_id=thread.id,
+        assistant_id=get_assistant().id,
+        **run_kwargs
     )
 
     # Waiting for response from thread.
     while run.status != "completed":
-        run = openai.beta.threads.runs.retrieve(
-            thread_id=THREAD.id,
+        run = client.beta.threads.runs.retrieve(
+            thread_id=thread.id,
             run_id=run.id
         )
         # Only check the status once every 5 seconds.
@@ -147,30 +223,179 @@ def ask_gpt_jellyfish_expert(question: str) -> str:
         time.sleep(5)
 
     # Extracting messages from thread.
-    messages = openai.beta.threads.messages.list(
-        thread_id=THREAD.id
+    messages = client.beta.threads.messages.list(
+        thread_id=thread.id
     )
 
     # Getting the latest message from the thread.
     response = messages.data[0].content[0].text.value
 
-    # Removing the "source" links so they are not spoken outloud.
+    return response, run.usage, run.model
+
+
+def remove_source_links(response: str) -> str:
+    """DESCRIPTION:
+    Removes the "source" links the assistant adds to its answers, so 
+    they are not spoken outloud.
+
+    ARGS:
+    - response (str): Text returned by the assistant.
+
+    RETURNS:
+    cleaned_response (str)
+    """
     pattern = r'\u3010.*?\u3011'
     cleaned_response = re.sub(pattern, '', response)
-
     return cleaned_response
 
 
-def create_video_title(video_transcript: str) -> tuple:
+def ask_gpt_jellyfish_expert(question: str, ledger: CostLedger = None) -> str:
+    """DESCRIPTION:
+    Asks the GPT assistant with domain knowledge a quesetion and 
+    returns a text response.
+
+    ARGS:
+    - question (str): Question to ask GPT with knowledge base.
+    - ledger (CostLedger): Records the usage of the run when passed.
+
+    RETURNS:
+    cleaned_response (str): Answer from GPT that has been cleaned.
+    """
+    start_time = time.time()
+    response, usage, model = run_assistant(question)
+    record_call_usage(
+        ledger, "SCRIPT", usage, question, response, time.time() - start_time,
+        model=model)
+    return remove_source_links(response)
+
+
+def style_video_title(title: str) -> str:
+    """DESCRIPTION:
+    Styling the video title. 🪼
+
+    ARGS:
+    - title (str): Title returned by GPT.
+
+    RETURNS:
+    video_title (str)
+    """
+    return f"{title} #shorts #jellyfish"
+
+
+def get_title_character_limit(title_prompt: dict = CREATE_TITLE_PROMPT) -> int:
+    """DESCRIPTION:
+    Reads the title length limit from the "less than N characters" 
+    rule in the title prompt, so the limit is only defined in one 
+    place.
+
+    ARGS:
+    - title_prompt (dict): Prompt containing the title rules.
+
+    RETURNS:
+    max_title_chars (int)
+    """
+    match = re.search(r"less than (\d+) characters", title_prompt["SYSTEM"])
+    if not match:
+        raise ValueError("Title prompt does not contain a character limit.")
+    return int(match.group(1))
+
+
+def parse_script_and_title(response: str, max_title_chars: int) -> tuple:
+    """DESCRIPTION:
+    Parses and validates the JSON response containing the script and 
+    the title. Either value is returned as None when it is missing or 
+    invalid.
+
+    ARGS:
+    - response (str): JSON text returned by the assistant.
+    - max_title_chars (int): Titles must be shorter than this.
+
+    RETURNS:
+    (video_script: str | None, title: str | None)
+    """
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError:
+        return None, None
+
+    if not isinstance(data, dict):
+        return None, None
+
+    video_script = data.get("script")
+    if not isinstance(video_script, str) or not video_script.strip():
+        video_script = None
+    else:
+        video_script = remove_source_links(video_script).strip()
+
+    title = data.get("title")
+    if not isinstance(title, str) or not title.strip():
+        title = None
+    else:
+        title = title.strip().strip('"')
+        if len(title) >= max_title_chars:
+            title = None
+
+    return video_script, title
+
+
+def ask_gpt_for_script_and_title(
+        question: str, ledger: CostLedger = None) -> tuple:
+    """DESCRIPTION:
+    Asks the GPT assistant for the script and the title in a single 
+    JSON response, instead of sending the transcript again in a 
+    second request to create the title.
+
+    ARGS:
+    - question (str): Question to ask GPT with knowledge base.
+    - ledger (CostLedger): Records the usage of the run when passed.
+
+    RETURNS:
+    (video_script: str | None, video_title: str | None, 
+    video_title_prompt: str)
+    """
+    from icecream import ic
+    from openai import BadRequestError
+    max_title_chars = get_title_character_limit()
+    instructions = CREATE_SCRIPT_AND_TITLE_PROMPT.format(
+        max_title_chars=max_title_chars
+    )
+    question = f"{question} {instructions}"
+
+    start_time = time.time()
+    try:
+        response, usage, model = run_assistant(
+            question,
+            response_format={"type": "json_object"}
+        )
+    except BadRequestError as e:
+        # Assistant or model does not support JSON output.
+        ic(e)
+        return None, None, f"User: {question}"
+
+    # Both the script and title are billed to the script call.
+    record_call_usage(
+        ledger, "SCRIPT", usage, question, response, time.time() - start_time,
+        model=model)
+
+    video_script, title = parse_script_and_title(response, max_title_chars)
+    video_title = style_video_title(title) if title else None
+
+    return video_script, video_title, f"User: {question}"
+
+
+def create_video_title(
+        video_transcript: str, ledger: CostLedger = None) -> tuple:
     """DESCRIPTION
     Calls GPT to create a video title based on the video transcript.
 
     ARGS:
     - video_transcript (str): Generated script for video.
+    - ledger (CostLedger): Records the usage of the call when passed.
 
     RETURNS:
     (video_title: str, video_title_prompt: str)
     """
+    from icecream import ic
 
     # The user message explains the context.
     system_message = CREATE_TITLE_PROMPT["SYSTEM"]
@@ -183,7 +408,8 @@ def create_video_title(video_transcript: str) -> tuple:
     video_title_prompt = f"System: {system_message}\nUser: {user_message}"
 
     # Making the API call
-    response = OPEN_AI_CLIENT.chat.completions.create(
+    start_time = time.time()
+    response = get_open_ai_client().chat.completions.create(
         model=GPT_BASE_MODEL,
         temperature=VIDEO_TITLE_TEMP,
         messages=[
@@ -197,22 +423,132 @@ def create_video_title(video_transcript: str) -> tuple:
     # Extracting text from API response.
     formatted_response = response.choices[0].message.content
 
+    record_call_usage(
+        ledger,
+        "TITLE",
+        response.usage,
+        video_title_prompt,
+        formatted_response,
+        time.time() - start_time
+    )
+
     # Styling the video title. 🪼
-    video_title = f"{formatted_response} #shorts #jellyfish"
+    video_title = style_video_title(formatted_response)
 
     return video_title, video_title_prompt
 
 
-def generate_youtube_shorts_scripts(video_script_prompts: list) -> pd.DataFrame:
+def generate_script_and_title(
+        video_script_prompt: str,
+        generate_together: bool = GENERATE_SCRIPT_AND_TITLE_TOGETHER,
+        ledger: CostLedger = None) -> tuple:
+    """DESCRIPTION:
+    Generates the video script and title. When generating them together
+    fails validation, falls back to asking for the script and then 
+    creating the title from it. A valid script from the single call is 
+    kept, and only the title is generated again.
+
+    ARGS:
+    - video_script_prompt (str): Prompt used to create the video script.
+    - generate_together (bool): Use a single JSON request for both.
+    - ledger (CostLedger): Records the usage of every call when passed.
+
+    RETURNS:
+    (video_script: str, video_title: str, video_title_prompt: str)
+    """
+    from icecream import ic
+    video_script, video_title = None, None
+
+    if generate_together:
+        video_script, video_title, video_title_prompt =\
+            ask_gpt_for_script_and_title(video_script_prompt, ledger)
+
+    if video_script and video_title:
+        return video_script, video_title, video_title_prompt
+
+    ic("Falling back to generating the script and title separately.")
+
+    # Generating video script, from expert response.
+    if not video_script:
+        video_script = ask_gpt_jellyfish_expert(video_script_prompt, ledger)
+
+    # Generating video title from video script.
+    video_title, video_title_prompt = create_video_title(video_script, ledger)
+
+    return video_script, video_title, video_title_prompt
+
+
+def generate_unique_script_and_title(
+        video_script_prompt: str,
+        generate_together: bool = GENERATE_SCRIPT_AND_TITLE_TOGETHER,
+        ledger: CostLedger = None,
+        script_index: ScriptIndex = None,
+        max_regenerations: int = MAX_SCRIPT_REGENERATIONS) -> tuple:
+    """DESCRIPTION:
+    Generates the video script and title, regenerating them when the 
+    script is a near duplicate of a current or historical script. This
+    happens before any audio or video is created for the script.
+
+    ARGS:
+    - video_script_prompt (str): Prompt used to create the video script.
+    - generate_together (bool): Use a single JSON request for both.
+    - ledger (CostLedger): Records the usage of every call when passed.
+    - script_index (ScriptIndex): Index of previous scripts. No near 
+    duplicate check is done when None.
+    - max_regenerations (int): Number of times to regenerate a near
+    duplicate script before dropping it.
+
+    RETURNS:
+    (video_script: str, video_title: str, video_title_prompt: str) or 
+    None when the script is dropped.
+    """
+    from icecream import ic
+    for _ in range(max_regenerations + 1):
+        video_script, video_title, video_title_prompt =\
+            generate_script_and_title(
+                video_script_prompt, generate_together, ledger)
+
+        if script_index is None:
+            return video_script, video_title, video_title_prompt
+
+        similar_id, similarity = script_index.most_similar(video_script)
+        if similarity < script_index.threshold:
+            return video_script, video_title, video_title_prompt
+
+        ic(f"Script is {similarity:.0%} similar to {similar_id}.")
+
+    ic(f"Dropping near duplicate script for: {video_script_prompt}")
+    return None
+
+
+def generate_youtube_shorts_scripts(
+        video_script_prompts: list,
+        generate_together: bool = GENERATE_SCRIPT_AND_TITLE_TOGETHER,
+        script_index: ScriptIndex = None,
+        history: HistoryStore = None,
+        pick_voice: Callable = _pick_random_voice
+) -> pd.DataFrame:
     """DESCRIPTION:
     Calling the API to create the scripts data csv and dataframe.
 
     ARGS:
     - video_script_prompts (list): All prompts used to create video scripts.
+    - generate_together (bool): Generate the script and title with a 
+    single request.
+    - script_index (ScriptIndex): Index of previous scripts. Near 
+    duplicate scripts are regenerated or dropped, and accepted scripts
+    are added to the index.
+    - history (HistoryStore): Each row is appended as soon as its script
+    completes, so a crash part way through keeps the finished scripts.
+    Short codes already in the history are not reused.
+    - pick_voice (Callable): Picks the TTS VOICE of each script, kept in
+    its row so clicks can be reported by voice.
 
     RETURNS:
     df (pd.DataFrame): A dataframe containing scripts, and meta data.
     """
+    import pandas as pd
+    from icecream import ic
 
     # Randomly order the scripts.
     random.shuffle(video_script_prompts)
@@ -220,50 +556,48 @@ def generate_youtube_shorts_scripts(video_script_prompts: list) -> pd.DataFrame:
     # List of dictionaries used to create a csv and dataframe.
     data = []
 
+    # Short codes in use, so each video gets its own link.
+    codes = existing_codes(history) if history is not None else set()
+
     for video_script_prompt in video_script_prompts:
 
         # Logging the time to make a request from API.
         inference_start_time = time.time()
 
         # Creating a BQ/Google Sheets date time format.
-        current_datetime = datetime.now(pytz.UTC)
+        current_datetime = datetime.now(timezone.utc)
         datetime_str = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
 
-        # Generating video script, from expert response.
-        video_script = ask_gpt_jellyfish_expert(video_script_prompt)
+        # Every API call for this video is priced from its usage.
+        ledger = CostLedger()
 
-        # Generating video title from video script.
-        video_title, video_title_prompt = create_video_title(video_script)
-
-        # UUID used across text, audio and videos.
-        inference_id = str(uuid.uuid4())
-
-        # Computing inference dollar amount.
-        num_tokens_script = token_counter(video_script, GPT_BASE_MODEL)
-        num_tokens_script_prompt = token_counter(
+        # Generating video script and title.
+        script_and_title = generate_unique_script_and_title(
             video_script_prompt,
-            GPT_BASE_MODEL
+            generate_together,
+            ledger,
+            script_index
         )
+        if script_and_title is None:
+            continue
+        video_script, video_title, video_title_prompt = script_and_title
 
-        num_tokens_title = token_counter(video_title, GPT_BASE_MODEL)
-        num_tokens_title_prompt = token_counter(
-            video_title_prompt,
-            GPT_BASE_MODEL
-        )
+        # UUID used across text, audio and videos.
+        inference_id = str(uuid.uuid4())
 
-        total_tokens = [
-            num_tokens_script,
-            num_tokens_script_prompt,
-            num_tokens_title,
-            num_tokens_title_prompt
-        ]
+        # Short link in the video description, resolved by the redirect
+        # app to the target URL.
+        code = short_code(inference_id, taken=codes)
 
-        cost_of_tts = len(video_title) * .000015
+        # Later scripts in the batch are compared against this one too.
+        if script_index is not None:
+            script_index.add(inference_id, video_script)
 
-        cost_of_text_generation = sum(total_tokens) * PRICE_PER_TOKEN
+        # TTS is billed per character of the script that is spoken.
+        ledger.record_characters("TTS", TTS_MODEL, len(video_script))
 
         # Total cost of inference.
-        cost_of_inference = cost_of_tts + cost_of_text_generation
+        cost_of_inference = ledger.total_cost()
 
         inference_time = time.time() - inference_start_time
 
@@ -278,14 +612,21 @@ def generate_youtube_shorts_scripts(video_script_prompts: list) -> pd.DataFrame:
             "NUM_CHARS_TITLE":     len(video_title),
             "NUM_WORDS_TITLE":     len(video_title.split(" ")),
             "INFERENCE_ID":        inference_id,
-            "GPT_ASSISTANT_ID":    GPT_ASSISTANT_ID,
+            "GPT_ASSISTANT_ID":    get_secret("GPT_ASSISTANT_ID"),
             "DATE_TIME":           datetime_str,
             "COST_OF_INFERENCE":   cost_of_inference,
             "GPT_BASE_MODEL":      GPT_BASE_MODEL,
-            "INFERENCE_TIME":      inference_time
+            "VOICE":               pick_voice(),
+            "INFERENCE_TIME":      inference_time,
+            "SHORT_CODE":          code,
+            "SHORT_LINK":          SHORT_LINK_BASE_URL + code,
+            "TARGET_URL":          URL_TO_REDIRECT_TO,
+            **ledger.to_columns()
         }
 
         data.append(row)
+        if history is not None:
+            history.append(row)
 
         ic(row)
 
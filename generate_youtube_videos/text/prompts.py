@@ -0,0 +1,152 @@
+"""Lazily generates video script prompts over every topic and question
+combination, skipping the combinations used in previous runs.
+
+Combinations used in previous runs are kept as a set of hashes in a
+text file, one hash per line, which is appended to after each run.
+Sampling is weighted by topic, and the config lists are never mutated.
+
+Typical usage example:
+
+    used_prompts = UsedPrompts.load("STATE/used_prompts.txt")
+    for topic, question in iterate_prompt_combinations(used=used_prompts):
+        ...
+"""
+import hashlib
+import heapq
+import os
+import random
+from itertools import product
+from configs import VIDEO_TOPICS
+from configs import QUESTIONS
+from configs import QUESTION_RULES
+from configs import TOPIC_WEIGHTS
+
+
+def format_prompt(topic: str, question: str) -> str:
+    """Formats the question and appends the rules."""
+    return question.format(topic=topic) + " " + QUESTION_RULES
+
+
+def prompt_combinations(
+        topics: list = VIDEO_TOPICS,
+        questions: list = QUESTIONS) -> dict:
+    """Topic and question combination of each formatted prompt."""
+    return {
+        format_prompt(topic, question): (topic, question)
+        for topic, question in product(topics, questions)
+    }
+
+
+def prompt_key(topic: str, question: str) -> str:
+    """Stable hash of a topic and question combination."""
+    combination = f"{topic}\n{question}".encode("utf-8")
+    return hashlib.sha1(combination).hexdigest()[:16]
+
+
+class UsedPrompts:
+    """Set of topic and question combinations already used, persisted
+    to a text file."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.keys = set()
+
+    @classmethod
+    def load(cls, path: str) -> "UsedPrompts":
+        """Loads the used combinations from the file, if it exists."""
+        used = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                used.keys = {line.strip() for line in file if line.strip()}
+        return used
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, combination: tuple) -> bool:
+        return prompt_key(*combination) in self.keys
+
+    def add(self, topic: str, question: str) -> None:
+        """Marks a combination as used, and appends it to the file."""
+        key = prompt_key(topic, question)
+        if key in self.keys:
+            return
+        self.keys.add(key)
+
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(key + "\n")
+
+    def add_history(
+            self,
+            df,
+            topics: list = VIDEO_TOPICS,
+            questions: list = QUESTIONS) -> int:
+        """DESCRIPTION:
+        Marks the combinations of the VIDEO_SCRIPT_PROMPT values in a
+        history dataframe as used. A run that kept no scripts gives an
+        empty dataframe without the column, which adds nothing.
+
+        ARGS:
+        - df (pd.DataFrame): History data.
+        - topics (list): Topics the prompts were created from.
+        - questions (list): Questions the prompts were created from.
+
+        RETURNS:
+        num_added (int)
+        """
+        if df is None or "VIDEO_SCRIPT_PROMPT" not in df:
+            return 0
+        combinations = prompt_combinations(topics, questions)
+        num_added = 0
+        for prompt in df["VIDEO_SCRIPT_PROMPT"]:
+            combination = combinations.get(prompt)
+            if combination and combination not in self:
+                self.add(*combination)
+                num_added += 1
+        return num_added
+
+
+def iterate_prompt_combinations(
+        topics: list = VIDEO_TOPICS,
+        questions: list = QUESTIONS,
+        used: UsedPrompts = None,
+        weights: dict = TOPIC_WEIGHTS,
+        rng: random.Random = random):
+    """DESCRIPTION:
+    Lazily yields unused (topic, question) combinations in a random
+    order, weighted by topic. Uses weighted sampling without
+    replacement (Efraimidis-Spirakis), where each combination gets the
+    key u ** (1 / weight), and combinations are popped from a heap in
+    order of their keys.
+
+    ARGS:
+    - topics (list): Video topics. Not mutated.
+    - questions (list): Question templates. Not mutated.
+    - used (UsedPrompts): Combinations to skip.
+    - weights (dict): Weight per topic, defaults to 1.
+    - rng (random.Random): Random number generator.
+
+    YIELDS:
+    (topic: str, question: str)
+    """
+    heap = []
+    for index, topic in enumerate(topics):
+        weight = weights.get(topic, 1)
+        if weight <= 0:
+            continue
+        for question_index in range(len(questions)):
+            # Negated so the largest key is popped first.
+            key = rng.random() ** (1 / weight)
+            heap.append((-key, index, question_index))
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, question_index = heapq.heappop(heap)
+        combination = (topics[index], questions[question_index])
+        if used is not None and combination in used:
+            continue
+        yield combination
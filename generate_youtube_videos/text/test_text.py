@@ -7,9 +7,20 @@ from generate_youtube_videos.text.generation import create_video_script_prompts
 from generate_youtube_videos.text.generation import encoding_getter
 from generate_youtube_videos.text.generation import tokenizer
 from generate_youtube_videos.text.generation import token_counter
+from generate_youtube_videos.text.generation import token_counts
 from generate_youtube_videos.text.generation import ask_gpt_jellyfish_expert
 from generate_youtube_videos.text.generation import create_video_title
 from generate_youtube_videos.text.generation import generate_youtube_shorts_scripts
+from generate_youtube_videos.text.generation import get_title_character_limit
+from generate_youtube_videos.text.generation import parse_script_and_title
+from generate_youtube_videos.cost_ledger import CostLedger
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.text.deduplication import ScriptIndex
+from generate_youtube_videos.text.prompts import UsedPrompts
+from generate_youtube_videos.text.prompts import format_prompt
+from generate_youtube_videos.text.prompts import iterate_prompt_combinations
+import os
+import tempfile
 from configs import GPT_BASE_MODEL
 
 
@@ -46,6 +57,60 @@ def test_create_video_script_prompts() -> None:
     # combinations.
 
 
+def test_iterate_prompt_combinations() -> None:
+    """DESCRIPTION:
+    Tests the lazy prompt generator yields every unused combination 
+    once, skips used combinations, and does not mutate the config 
+    lists.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    topics = ["the diet of jellyfish", "the anatomy of jellyfish"]
+    questions = ["Briefly explain {topic}.", "Can you briefly explain {topic}?"]
+    topics_before, questions_before = list(topics), list(questions)
+
+    combinations = list(iterate_prompt_combinations(topics, questions))
+    message = "Did not yield every combination once."
+    assert sorted(combinations) == sorted(
+        (t, q) for t in topics for q in questions), message
+
+    message = "Config lists were mutated."
+    assert topics == topics_before and questions == questions_before, message
+
+    with tempfile.TemporaryDirectory() as temp_output_dir:
+        path = os.path.join(temp_output_dir, "used_prompts.txt")
+        used = UsedPrompts.load(path)
+        used.add(topics[0], questions[0])
+        used = UsedPrompts.load(path)
+        combinations = list(
+            iterate_prompt_combinations(topics, questions, used=used))
+        message = "Used combination was not skipped after reloading."
+        assert (topics[0], questions[0]) not in combinations, message
+        assert len(combinations) == 3, message
+
+        message = "A run that kept no scripts should add nothing."
+        assert used.add_history(pd.DataFrame([])) == 0, message
+        history = pd.DataFrame({"VIDEO_SCRIPT_PROMPT": [
+            format_prompt(topics[1], questions[1]), "Not a known prompt."]})
+        message = "History prompts should be marked as used."
+        assert used.add_history(history, topics, questions) == 1, message
+        assert (topics[1], questions[1]) in used, message
+
+        for topic, question in combinations:
+            used.add(topic, question)
+        message = "Nothing should be left once every combination is used."
+        assert list(iterate_prompt_combinations(
+            topics, questions, used=used)) == [], message
+
+    # Topics with a weight of 0 are never sampled.
+    combinations = list(iterate_prompt_combinations(
+        topics, questions, weights={topics[1]: 0}))
+    message = "Topic with a weight of 0 was sampled."
+    assert all(topic == topics[0] for topic, _ in combinations), message
+
+
 def test_encoding_getter() -> None:
     """DESCRIPTION:
 
@@ -87,6 +152,120 @@ def test_token_counter() -> None:
     assert num_tokens > 0, message
 
 
+def test_token_counts() -> None:
+    """DESCRIPTION:
+    Tests batch token counting matches counting strings one at a time.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    test_strings = ["My test string!", "Jellyfish are 95% water."]
+    num_tokens = token_counts(test_strings, GPT_BASE_MODEL)
+    expected = [token_counter(s, GPT_BASE_MODEL) for s in test_strings]
+    message = "Batch token counts do not match single token counts."
+    assert num_tokens == expected, message
+
+
+def test_cost_ledger() -> None:
+    """DESCRIPTION:
+    Tests pricing API usage and creating the history table columns, 
+    and that unpriced models are priced as a fallback model.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    prices = {
+        "gpt-4": {"PROMPT_TOKEN": 0.01, "COMPLETION_TOKEN": 0.02},
+        "tts-1": {"CHARACTER": 0.001}
+    }
+    ledger = CostLedger(prices=prices)
+    ledger.record_tokens("SCRIPT", "gpt-4", 100, 50, latency=2.0)
+    ledger.record_tokens("SCRIPT", "gpt-4", 10, 0, latency=1.0)
+    ledger.record_characters("TTS", "tts-1", 1000)
+
+    message = "Total cost is wrong."
+    assert abs(ledger.total_cost() - (1 + 1 + 0.1 + 1)) < 1e-9, message
+
+    columns = ledger.to_columns()
+    message = "Calls were not summed into the columns."
+    assert columns["SCRIPT_PROMPT_TOKENS"] == 110, message
+    assert columns["SCRIPT_LATENCY"] == 3.0, message
+    assert columns["TTS_CHARACTERS"] == 1000, message
+
+    message = "Calls not made should still have columns."
+    assert columns["TITLE_COST"] == 0, message
+
+    message = "Calls priced with their own model are not fallbacks."
+    assert columns["PRICE_FALLBACKS"] == "", message
+
+    entry = ledger.record_tokens("SCRIPT", "gpt-4-0613", 100, 50)
+    message = "Versions of a model should be priced as the model."
+    assert entry.cost == 2 and entry.priced_model == "gpt-4", message
+    entry = ledger.record_tokens("SCRIPT", "new-model", 100, 50)
+    message = "Unknown models should be priced as the fallback model."
+    assert entry.cost == 2 and entry.priced_model == "gpt-4", message
+    message = "Fallback prices should be recorded in the row."
+    assert ledger.to_columns()["PRICE_FALLBACKS"] ==\
+        "gpt-4-0613 as gpt-4, new-model as gpt-4", message
+
+    ledger = CostLedger(prices=prices, fallback_model="unpriced")
+    entry = ledger.record_tokens("SCRIPT", "new-model", 100, 50)
+    message = "Models without any price should be recorded without a cost."
+    assert entry.cost == 0 and entry.prompt_tokens == 100, message
+
+
+def test_script_index() -> None:
+    """DESCRIPTION:
+    Tests finding near duplicate scripts, and that the index is 
+    persisted and reloaded.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    script = (
+        "Jellyfish reproduction is fascinating! They have a two-stage "
+        "life cycle: the polyp stage and the medusa stage. In the polyp "
+        "stage, they can reproduce asexually by budding."
+    )
+    near_duplicate = script.replace("fascinating", "really fascinating")
+    different = (
+        "Box jellyfish have venom that can be deadly to humans, and they "
+        "hunt small fish using tentacles armed with stinging cells."
+    )
+
+    with tempfile.TemporaryDirectory() as temp_output_dir:
+        path = os.path.join(temp_output_dir, "script_index.jsonl")
+        script_index = ScriptIndex.load(path, threshold=0.5)
+        script_index.add("1", script)
+
+        message = "Near duplicate script was not found."
+        assert script_index.is_near_duplicate(near_duplicate), message
+
+        message = "Different script was found as a near duplicate."
+        assert not script_index.is_near_duplicate(different), message
+
+        script_index.add("1", script)
+        reloaded = ScriptIndex.load(path, threshold=0.5)
+        message = "Index was not persisted once per script."
+        assert len(reloaded) == 1, message
+        assert reloaded.most_similar(script) == ("1", 1.0), message
+
+        history = HistoryStore(os.path.join(temp_output_dir, "h.sqlite3"))
+        history.append({"INFERENCE_ID": "1", "VIDEO_SCRIPT": script})
+        history.append({"INFERENCE_ID": "2", "VIDEO_SCRIPT": different})
+        history.append({"INFERENCE_ID": "3"})
+        added = reloaded.add_history(
+            history.read_columns(["INFERENCE_ID", "VIDEO_SCRIPT"]))
+        message = "Only history scripts not indexed yet should be added."
+        assert added == 1 and len(reloaded) == 2, message
+        message = "History scripts should be found as near duplicates."
+        assert reloaded.most_similar(different)[0] == "2", message
+        history.close()
+
+
 def test_ask_gpt_jellyfish_expert() -> None:
     """DESCRIPTION:
 
@@ -144,6 +323,53 @@ def test_generate_youtube_shorts_scripts() -> None:
     assert not has_missing_values, message
 
 
+def test_get_title_character_limit() -> None:
+    """DESCRIPTION:
+    Tests reading the title length limit from the title prompt.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    message = "Did not read limit from the configured title prompt."
+    assert get_title_character_limit() == 80, message
+
+    prompt = {"SYSTEM": "Keep the length of the title less than 60 characters."}
+    message = "Did not read limit from a custom prompt."
+    assert get_title_character_limit(prompt) == 60, message
+
+
+def test_parse_script_and_title() -> None:
+    """DESCRIPTION:
+    Tests parsing the JSON response containing the script and the 
+    title, including the invalid responses that fall back to the two 
+    call path.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    response = '{"script": "Jellyfish have no brain.\u30104:0\u2020source\u3011", '\
+        '"title": "Jellyfish Have No Brain"}'
+    video_script, title = parse_script_and_title(response, 80)
+    message = "Source links were not removed from the script."
+    assert video_script == "Jellyfish have no brain.", message
+    message = "Title was not parsed."
+    assert title == "Jellyfish Have No Brain", message
+
+    # Title too long is rejected, but the script is kept.
+    response = '{"script": "A script.", "title": "%s"}' % ("a" * 80)
+    video_script, title = parse_script_and_title(response, 80)
+    message = "Title over the limit was not rejected."
+    assert video_script == "A script." and title is None, message
+
+    # Invalid JSON, and JSON missing keys.
+    message = "Invalid response was not rejected."
+    assert parse_script_and_title("not json", 80) == (None, None), message
+    assert parse_script_and_title('["a"]', 80) == (None, None), message
+    assert parse_script_and_title('{"title": ""}', 80) == (None, None), message
+
+
 def main():
     test_generate_youtube_shorts_scripts()
     pass
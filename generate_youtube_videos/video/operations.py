@@ -1,5 +1,4 @@
 import os
-from icecream import ic
 import subprocess
 
 
@@ -101,6 +100,7 @@ def merge_audio_video(
         stderr=subprocess.PIPE,
         text=True
     )
+    from icecream import ic
     ic(result)
 
     # Check if FFmpeg command was successful.
@@ -167,6 +167,7 @@ def fade_and_slice_video(
     try:
         subprocess.run(command, check=True)
     except Exception as e:
+        from icecream import ic
         ic(f'An error occurred: {e}')
         return None
     return output_video_path
@@ -189,6 +190,7 @@ def burn_subtitles_into_video(
     videos_with_subtitles_dir (str): The path to the output video file 
     with subtitles.
     """
+    from icecream import ic
     ic("HERE ATTEMPTING TO BURN SUBTITLES INTO VIDEO")
     # Ensure the output directory exists
     if not os.path.exists(videos_with_subtitles_dir):
@@ -0,0 +1,699 @@
+"""Uploads the finished videos with the YouTube Data API.
+
+Videos are uploaded with the resumable upload protocol. A POST with
+the metadata starts an upload session and returns its upload URI, and
+the file is then sent in chunks with PUT requests, each answered with
+308 and the bytes received so far until the last one returns the video.
+Several videos are uploaded at once, each in its own session.
+
+The upload URI and the bytes sent of each video are kept in a SQLite
+table, so an interrupted upload asks the server how much it received
+and continues from there, instead of starting over and paying for a
+new session. Starting a session costs 1600 quota units, which are
+reserved in the same database before each new session, so uploads stop
+once the daily quota is used up. Server errors and dropped connections
+are retried with exponential backoff.
+
+Titles come from the history, and the description from
+YOUTUBE_DESCRIPTION with the SHORT_LINK of the video.
+
+LocalYouTubeServer is a local HTTP stand-in implementing the resumable
+upload protocol, for tests.
+
+Typical usage example:
+
+    uploader = YouTubeUploader(get_youtube_session(), UploadState(path))
+    results = uploader.upload_many(videos_to_upload(history, videos_dir))
+"""
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Callable
+from ipaddress import ip_address
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+from zoneinfo import ZoneInfo
+from configs import ROOT_DIR
+from configs import VIDEOS_WITH_SUBTITLES
+from configs import STATE_DIR
+from configs import HISTORY_STORE
+from configs import URL_TO_REDIRECT_TO
+from configs import YOUTUBE_UPLOAD_URL
+from configs import YOUTUBE_TOKEN
+from configs import YOUTUBE_UPLOAD_STATE
+from configs import YOUTUBE_CHUNK_SIZE
+from configs import MAX_YOUTUBE_UPLOADS
+from configs import YOUTUBE_DAILY_QUOTA
+from configs import YOUTUBE_UPLOAD_COST
+from configs import YOUTUBE_MAX_RETRIES
+from configs import YOUTUBE_BACKOFF_SECONDS
+from configs import YOUTUBE_PRIVACY_STATUS
+from configs import YOUTUBE_CATEGORY_ID
+from configs import YOUTUBE_DESCRIPTION
+from generate_youtube_videos.history import HistoryStore
+from generate_youtube_videos.sheets_sync import status_code
+
+YOUTUBE_UPLOAD_SCOPE = "https://www.googleapis.com/auth/youtube.upload"
+# Rate limits, and server errors worth retrying.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+RESUME_INCOMPLETE = 308
+# The quota of a project resets at midnight Pacific time.
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+# Chunks other than the last must be a multiple of this.
+CHUNK_MULTIPLE = 256 * 1024
+MAX_TITLE_LENGTH = 100
+
+
+class UploadError(Exception):
+    """Unexpected response from the upload API, with the response, so
+    status_code works on it like on the API errors of other clients."""
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f"{response.status_code}: {response.text[:200]}")
+
+
+class SessionExpired(Exception):
+    """The upload URI is no longer valid, a new session is needed."""
+
+
+class QuotaExhausted(Exception):
+    """No quota left today to start another upload."""
+
+
+def get_youtube_session(
+        token_path: str = YOUTUBE_TOKEN,
+        max_workers: int = MAX_YOUTUBE_UPLOADS):
+    """Requests session that adds and refreshes the OAuth token, with a
+    connection pool sized for the concurrent uploads."""
+    from google.auth.transport.requests import AuthorizedSession
+    from google.oauth2.credentials import Credentials
+    from requests.adapters import HTTPAdapter
+    credentials = Credentials.from_authorized_user_file(
+        token_path, scopes=[YOUTUBE_UPLOAD_SCOPE])
+    session = AuthorizedSession(credentials)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=max_workers, pool_maxsize=max_workers))
+    return session
+
+
+def quota_day(now: float = None) -> str:
+    """Day the quota is counted on, in Pacific time."""
+    now = time.time() if now is None else now
+    return datetime.fromtimestamp(now, QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+
+def received_bytes(response) -> int:
+    """Bytes the server has, from the Range header of a 308 response.
+    No Range header means nothing was received."""
+    match = re.match(r"bytes=0-(\d+)", response.headers.get("Range", ""))
+    return int(match.group(1)) + 1 if match else 0
+
+
+class UploadState:
+    """Upload URI, bytes sent and status of each video, and the quota
+    used per day, in a SQLite database shared by the upload threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "INFERENCE_ID TEXT PRIMARY KEY, "
+                "FILE_PATH TEXT NOT NULL, "
+                "FILE_SIZE INTEGER NOT NULL, "
+                "UPLOAD_URI TEXT, "
+                "BYTES_SENT INTEGER NOT NULL DEFAULT 0, "
+                "STATUS TEXT NOT NULL, "
+                "VIDEO_ID TEXT, "
+                "ERROR TEXT, "
+                "UPDATED REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS quota ("
+                "DAY TEXT PRIMARY KEY, "
+                "UNITS INTEGER NOT NULL)"
+            )
+
+    def get(self, inference_id: str) -> dict:
+        """Upload row of a video, None if never started."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT * FROM uploads WHERE INFERENCE_ID = ?",
+                (inference_id,)
+            )
+            values = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, values)) if values is not None else None
+
+    def update(self, inference_id: str, **values) -> None:
+        """Inserts or updates the upload row of a video."""
+        values["UPDATED"] = time.time()
+        updates = ", ".join(f"{column} = ?" for column in values)
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                f"UPDATE uploads SET {updates} WHERE INFERENCE_ID = ?",
+                (*values.values(), inference_id)
+            )
+            if cursor.rowcount:
+                return
+            columns = ", ".join(values)
+            placeholders = ", ".join("?" for _ in values)
+            self._connection.execute(
+                f"INSERT INTO uploads (INFERENCE_ID, {columns}) "
+                f"VALUES (?, {placeholders})",
+                (inference_id, *values.values())
+            )
+
+    def uploaded_ids(self) -> set:
+        with self._lock:
+            return {
+                inference_id for (inference_id,) in self._connection.execute(
+                    "SELECT INFERENCE_ID FROM uploads "
+                    "WHERE STATUS = 'uploaded'")
+            }
+
+    def reserve_quota(
+            self,
+            units: int = YOUTUBE_UPLOAD_COST,
+            daily_quota: int = YOUTUBE_DAILY_QUOTA) -> bool:
+        """DESCRIPTION:
+        Adds the units to the quota used today, if they fit.
+
+        ARGS:
+        - units (int): Cost of the API call.
+        - daily_quota (int): Units the project gets per day.
+
+        RETURNS:
+        reserved (bool): False if the quota would be exceeded.
+        """
+        day = quota_day()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT UNITS FROM quota WHERE DAY = ?", (day,)).fetchone()
+            used = row[0] if row else 0
+            if used + units > daily_quota:
+                return False
+            self._connection.execute(
+                "INSERT INTO quota (DAY, UNITS) VALUES (?, ?) "
+                "ON CONFLICT (DAY) DO UPDATE SET UNITS = excluded.UNITS",
+                (day, used + units)
+            )
+        return True
+
+    def release_quota(self, units: int = YOUTUBE_UPLOAD_COST) -> None:
+        """Gives back units reserved today for a session that was never
+        started."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE quota SET UNITS = MAX(UNITS - ?, 0) WHERE DAY = ?",
+                (units, quota_day())
+            )
+
+    def quota_used(self, day: str = None) -> int:
+        """Units reserved on a day, today by default."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT UNITS FROM quota WHERE DAY = ?",
+                (day or quota_day(),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def is_loopback_url(url: str) -> bool:
+    """Checks if a URL points at this machine, like the default 
+    SHORT_LINK_BASE_URL, so it only works for the person running it."""
+    host = urlparse(url).hostname or ""
+    if host == "localhost":
+        return True
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_unspecified
+
+
+def video_metadata(
+        row: dict,
+        description: str = YOUTUBE_DESCRIPTION,
+        privacy_status: str = YOUTUBE_PRIVACY_STATUS) -> dict:
+    """DESCRIPTION:
+    Builds the video resource of a history row. YouTube rejects titles
+    over 100 characters and the < and > characters. Short links on a 
+    loopback address are replaced with URL_TO_REDIRECT_TO, so a local
+    SHORT_LINK_BASE_URL is never published.
+
+    ARGS:
+    - row (dict): History row, with VIDEO_TITLE and SHORT_LINK.
+    - description (str): Description, {link} is the video's link.
+    - privacy_status (str): "private", "unlisted" or "public".
+
+    RETURNS:
+    metadata (dict)
+    """
+    title = (row.get("VIDEO_TITLE") or row["INFERENCE_ID"]).strip('" ')
+    title = title.replace("<", "").replace(">", "")[:MAX_TITLE_LENGTH]
+    link = row.get("SHORT_LINK")
+    if not link or is_loopback_url(link):
+        link = URL_TO_REDIRECT_TO
+    return {
+        "snippet": {
+            "title": title,
+            "description": description.format(link=link)
+            .replace("<", "").replace(">", ""),
+            "categoryId": YOUTUBE_CATEGORY_ID,
+        },
+        "status": {
+            "privacyStatus": privacy_status,
+            "selfDeclaredMadeForKids": False,
+        },
+    }
+
+
+def videos_to_upload(
+        history: HistoryStore,
+        videos_dir: str,
+        state: UploadState = None) -> list:
+    """DESCRIPTION:
+    Finds the finished videos not uploaded yet, with their metadata.
+
+    ARGS:
+    - history (HistoryStore)
+    - videos_dir (str): Dir of the finished videos, named by ID.
+    - state (UploadState): Videos already uploaded are skipped.
+
+    RETURNS:
+    videos (list): (INFERENCE_ID, path, metadata) tuples.
+    """
+    uploaded = state.uploaded_ids() if state is not None else set()
+    paths = {
+        os.path.splitext(file_name)[0]: os.path.join(videos_dir, file_name)
+        for file_name in sorted(os.listdir(videos_dir))
+        if file_name.endswith(".mp4")
+    }
+    videos = []
+    for inference_id, path in paths.items():
+        row = history.get(inference_id)
+        if row is None or inference_id in uploaded:
+            continue
+        videos.append((inference_id, path, video_metadata(row)))
+    return videos
+
+
+class YouTubeUploader:
+    """Uploads videos with resumable sessions, several at once."""
+
+    def __init__(
+            self,
+            session,
+            state: UploadState,
+            upload_url: str = YOUTUBE_UPLOAD_URL,
+            chunk_size: int = YOUTUBE_CHUNK_SIZE,
+            max_workers: int = MAX_YOUTUBE_UPLOADS,
+            daily_quota: int = YOUTUBE_DAILY_QUOTA,
+            max_retries: int = YOUTUBE_MAX_RETRIES,
+            backoff_seconds: float = YOUTUBE_BACKOFF_SECONDS,
+            sleep: Callable = time.sleep):
+        """
+        ARGS:
+        - session: requests Session that authorizes the requests.
+        - state (UploadState): Where the progress of each upload is kept.
+        - upload_url (str): Upload endpoint of videos.insert.
+        - chunk_size (int): Bytes per PUT, a multiple of 256 KB.
+        - max_workers (int): Videos uploaded at once.
+        - daily_quota (int): Quota units the project gets per day.
+        - max_retries (int): Retries of server and connection errors.
+        - backoff_seconds (float): Wait before the first retry, doubled
+        after each retry.
+        - sleep (Callable): Used to wait between retries.
+        """
+        if chunk_size % CHUNK_MULTIPLE:
+            raise ValueError("chunk_size must be a multiple of 256 KB.")
+        self.session = session
+        self.state = state
+        self.upload_url = upload_url
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.daily_quota = daily_quota
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.sleep = sleep
+
+    def start_session(self, path: str, metadata: dict) -> str:
+        """Starts an upload session, returns its upload URI."""
+        response = self.session.post(
+            self.upload_url,
+            params={"uploadType": "resumable", "part": "snippet,status"},
+            json=metadata,
+            headers={
+                "X-Upload-Content-Length": str(os.path.getsize(path)),
+                "X-Upload-Content-Type": "video/*",
+            }
+        )
+        if response.status_code != 200 or "Location" not in response.headers:
+            raise UploadError(response)
+        return response.headers["Location"]
+
+    def _check_response(self, response):
+        """Video ID of a finished upload, or the bytes received for a
+        308 response."""
+        if response.status_code in (200, 201):
+            return response.json()["id"], None
+        if response.status_code == RESUME_INCOMPLETE:
+            return None, received_bytes(response)
+        if response.status_code in (404, 410):
+            raise SessionExpired(response.text[:200])
+        raise UploadError(response)
+
+    def query_offset(self, upload_uri: str, file_size: int) -> tuple:
+        """DESCRIPTION:
+        Asks the server how much of an interrupted upload it received.
+
+        ARGS:
+        - upload_uri (str)
+        - file_size (int)
+
+        RETURNS:
+        (video_id: str, offset: int), the video ID is set when the
+        upload already finished.
+        """
+        response = self.session.put(
+            upload_uri,
+            headers={
+                "Content-Length": "0",
+                "Content-Range": f"bytes */{file_size}",
+            }
+        )
+        return self._check_response(response)
+
+    def send_chunks(
+            self,
+            inference_id: str,
+            upload_uri: str,
+            path: str,
+            offset: int) -> str:
+        """DESCRIPTION:
+        Sends the file from the offset in chunks. The server may keep
+        less than a whole chunk, so each chunk starts where the server
+        says it is.
+
+        ARGS:
+        - inference_id (str): The id that connects data in pipeline.
+        - upload_uri (str)
+        - path (str): Path of the video.
+        - offset (int): Bytes the server already has.
+
+        RETURNS:
+        video_id (str)
+        """
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as file:
+            while True:
+                file.seek(offset)
+                chunk = file.read(self.chunk_size)
+                end = offset + len(chunk) - 1
+                response = self.session.put(
+                    upload_uri,
+                    data=chunk,
+                    headers={
+                        "Content-Length": str(len(chunk)),
+                        "Content-Range": f"bytes {offset}-{end}/{file_size}",
+                    }
+                )
+                video_id, offset = self._check_response(response)
+                if video_id is not None:
+                    return video_id
+                self.state.update(inference_id, BYTES_SENT=offset)
+
+    def upload(self, inference_id: str, path: str, metadata: dict) -> str:
+        """DESCRIPTION:
+        Uploads a video, resuming its session if it has one. Server
+        errors and dropped connections are retried with backoff, each
+        retry asking the server where to continue from. Quota is 
+        reserved once per session, and given back if no session could
+        be started.
+
+        ARGS:
+        - inference_id (str): The id that connects data in pipeline.
+        - path (str): Path of the video.
+        - metadata (dict): Video resource, see video_metadata.
+
+        RETURNS:
+        video_id (str)
+        """
+        from requests.exceptions import ConnectionError
+        from requests.exceptions import Timeout
+
+        row = self.state.get(inference_id)
+        if row is not None and row["STATUS"] == "uploaded":
+            return row["VIDEO_ID"]
+        file_size = os.path.getsize(path)
+        upload_uri = row["UPLOAD_URI"] if row is not None else None
+        if row is not None and row["FILE_SIZE"] != file_size:
+            # The video was rendered again, the old session is for the
+            # old file.
+            upload_uri = None
+        # Quota reserved for a session not started yet, kept across the
+        # retries of starting it.
+        reserved = False
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                offset = 0
+                if upload_uri is not None:
+                    video_id, offset = self.query_offset(upload_uri, file_size)
+                    if video_id is not None:
+                        break
+                else:
+                    if not reserved and not self.state.reserve_quota(
+                            YOUTUBE_UPLOAD_COST, self.daily_quota):
+                        raise QuotaExhausted(
+                            f"No quota left today for {inference_id}.")
+                    reserved = True
+                    upload_uri = self.start_session(path, metadata)
+                    reserved = False
+                self.state.update(
+                    inference_id,
+                    FILE_PATH=path,
+                    FILE_SIZE=file_size,
+                    UPLOAD_URI=upload_uri,
+                    BYTES_SENT=offset,
+                    STATUS="uploading",
+                    ERROR=None
+                )
+                video_id = self.send_chunks(
+                    inference_id, upload_uri, path, offset)
+                break
+            except SessionExpired:
+                # Sessions last about a week, the upload starts over.
+                upload_uri = None
+                if attempt == self.max_retries:
+                    raise
+            except (UploadError, ConnectionError, Timeout) as e:
+                retryable = isinstance(e, (ConnectionError, Timeout))\
+                    or status_code(e) in RETRYABLE_STATUS_CODES
+                if not retryable or attempt == self.max_retries:
+                    if reserved:
+                        self.state.release_quota(YOUTUBE_UPLOAD_COST)
+                    self.state.update(
+                        inference_id,
+                        FILE_PATH=path,
+                        FILE_SIZE=file_size,
+                        STATUS="failed",
+                        ERROR=str(e)
+                    )
+                    raise
+                wait = self.backoff_seconds * 2 ** attempt
+                self.sleep(wait + random.uniform(0, wait))
+
+        self.state.update(
+            inference_id,
+            FILE_PATH=path,
+            FILE_SIZE=file_size,
+            BYTES_SENT=file_size,
+            STATUS="uploaded",
+            VIDEO_ID=video_id,
+            ERROR=None
+        )
+        return video_id
+
+    def upload_many(self, videos: list) -> dict:
+        """DESCRIPTION:
+        Uploads videos concurrently. Videos left once the quota is used
+        up are not started, and are uploaded on a later run.
+
+        ARGS:
+        - videos (list): (INFERENCE_ID, path, metadata) tuples.
+
+        RETURNS:
+        results (dict): Video ID, or the exception, by INFERENCE_ID.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                inference_id: executor.submit(
+                    self.upload, inference_id, path, metadata)
+                for inference_id, path, metadata in videos
+            }
+            results = {}
+            for inference_id, future in futures.items():
+                try:
+                    results[inference_id] = future.result()
+                except Exception as e:
+                    results[inference_id] = e
+        return results
+
+
+class LocalYouTubeServer:
+    """Local HTTP stand-in for the resumable upload endpoint of
+    videos.insert. Uploaded videos are kept in memory.
+
+    fail_next is a list of status codes returned by the next chunk
+    requests instead of storing them, and partial_next makes the next
+    chunk requests keep only half of their bytes, as the real server
+    may. expire() makes a session return 404.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.videos = {}
+        self.sessions_started = 0
+        self.bytes_received = 0
+        self.fail_next = []
+        self.partial_next = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def upload_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/upload/youtube/v3/videos"
+
+    def start(self) -> "LocalYouTubeServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def expire(self, upload_id: str) -> None:
+        self.sessions.pop(upload_id, None)
+
+    def _start_session(self, handler) -> tuple:
+        query = parse_qs(urlparse(handler.path).query)
+        if query.get("uploadType") != ["resumable"]:
+            return 400, {}, b"uploadType must be resumable"
+        length = int(handler.headers["Content-Length"] or 0)
+        metadata = json.loads(handler.rfile.read(length) or b"{}")
+        if not metadata.get("snippet", {}).get("title"):
+            return 400, {}, b"The video needs a title"
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[upload_id] = {
+                "SIZE": int(handler.headers["X-Upload-Content-Length"]),
+                "DATA": bytearray(),
+                "METADATA": metadata,
+            }
+            self.sessions_started += 1
+        location = f"{self.upload_url}?uploadType=resumable" \
+            f"&upload_id={upload_id}"
+        return 200, {"Location": location}, b""
+
+    def _progress(self, upload_id: str, session: dict) -> tuple:
+        received = len(session["DATA"])
+        if received == session["SIZE"]:
+            video_id = session.setdefault("VIDEO_ID", uuid.uuid4().hex[:11])
+            self.videos[video_id] =\
+                (bytes(session["DATA"]), session["METADATA"])
+            body = json.dumps({"id": video_id, **session["METADATA"]})
+            return 200, {"Content-Type": "application/json"}, body.encode()
+        headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+        return RESUME_INCOMPLETE, headers, b""
+
+    def _put_chunk(self, handler) -> tuple:
+        query = parse_qs(urlparse(handler.path).query)
+        upload_id = query.get("upload_id", [None])[0]
+        length = int(handler.headers["Content-Length"] or 0)
+        chunk = handler.rfile.read(length)
+        with self._lock:
+            session = self.sessions.get(upload_id)
+            if session is None:
+                return 404, {}, b"Upload session not found"
+            content_range = handler.headers["Content-Range"]
+            if content_range == f"bytes */{session['SIZE']}":
+                return self._progress(upload_id, session)
+
+            match = re.match(r"bytes (\d+)-(\d+)/(\d+)", content_range or "")
+            start, end, total = map(int, match.groups())
+            if start != len(session["DATA"]) or total != session["SIZE"]\
+                    or end - start + 1 != len(chunk):
+                return 400, {}, b"Content-Range does not match the upload"
+            if end + 1 != total and len(chunk) % CHUNK_MULTIPLE:
+                return 400, {}, b"Chunks must be a multiple of 256 KB"
+            if self.fail_next:
+                return self.fail_next.pop(0), {}, b"Backend error"
+            if self.partial_next:
+                self.partial_next -= 1
+                chunk = chunk[:len(chunk) // 2]
+            session["DATA"] += chunk
+            self.bytes_received += len(chunk)
+            return self._progress(upload_id, session)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, status: int, headers: dict, body: bytes):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self._respond(*server._start_session(self))
+
+            def do_PUT(self):
+                self._respond(*server._put_chunk(self))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    from icecream import ic
+    history = HistoryStore(os.path.join(STATE_DIR, HISTORY_STORE))
+    state = UploadState(os.path.join(STATE_DIR, YOUTUBE_UPLOAD_STATE))
+    videos = videos_to_upload(
+        history, os.path.join(ROOT_DIR, VIDEOS_WITH_SUBTITLES), state)
+    uploader = YouTubeUploader(get_youtube_session(), state)
+    ic(uploader.upload_many(videos))
+
+
+if __name__ == "__main__":
+    main()
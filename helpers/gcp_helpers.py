@@ -1,8 +1,12 @@
-from google.cloud import storage
+from generate_youtube_videos.cloud_storage import get_bucket
+from generate_youtube_videos.cloud_storage import upload_file
+from generate_youtube_videos.cloud_storage import sync_directory_to_bucket
+
 
 def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     """
-    Uploads a file to Google Cloud Storage
+    Uploads a file to Google Cloud Storage, using the shared storage 
+    client. Large files are uploaded in resumable chunks.
 
     Args:
     bucket_name (str): Name of the GCS bucket.
@@ -12,24 +16,20 @@ def upload_to_gcs(bucket_name, source_file_name, destination_blob_name):
     Returns:
     str: GCS URL of the uploaded file
     """
-    # Initialize a storage client using your service account key
-    storage_client = storage.Client()
-
-    # Get the bucket object
-    bucket = storage_client.bucket(bucket_name)
-
-    # Create a new blob and upload the file's content to GCS
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
-
-    # The public URL can be used to access the file directly via HTTP
-    return f"gs://{bucket_name}/{destination_blob_name}"
+    return upload_file(
+        get_bucket(bucket_name),
+        source_file_name,
+        destination_blob_name
+    )
 
 # Example usage
+# Run from the root dir: python -m helpers.gcp_helpers
 if __name__ == "__main__":
     bucket_name = 'videos-with-subtitles'
-    source_file_name = '/Users/paulfentress/Desktop/Jellyfish/VIDEOS_WITH_SUBTITLES'
-    destination_blob_name = 'destination-filename-in-gcs'
+    source_dir = '/Users/paulfentress/Desktop/Jellyfish/VIDEOS_WITH_SUBTITLES'
+    destination_prefix = 'Jellyfish/VIDEOS_WITH_SUBTITLES/'
 
-    uploaded_file_url = upload_to_gcs(bucket_name, source_file_name, destination_blob_name)
-    print(f"File uploaded to {uploaded_file_url}")
+    # Directories are synced in parallel, skipping unchanged files.
+    uploaded_file_urls = sync_directory_to_bucket(
+        get_bucket(bucket_name), source_dir, destination_prefix)
+    print(f"Files uploaded to {uploaded_file_urls}")
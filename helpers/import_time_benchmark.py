@@ -0,0 +1,102 @@
+"""
+Measures the startup cost of each entry point with `python -X importtime`
+and compares it against the budget stored in import_time_budget.json.
+
+Each entry point is imported in a fresh interpreter, so nothing is
+cached between measurements. The import time reported is the sum of the
+cumulative times of the top level imports made by the entry point, and
+does not include the interpreter startup (site) itself.
+
+# How to run the benchmark:
+# CD into root dir.
+# Run: python helpers/import_time_benchmark.py
+# Exits with status 1 when any entry point is over budget.
+"""
+import json
+import os
+import subprocess
+import sys
+
+BUDGET_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "import_time_budget.json")
+
+
+def measure_import_time(module: str, repeats: int = 3) -> tuple:
+    """DESCRIPTION:
+    Imports a module in a fresh interpreter with -X importtime, and
+    returns the best of the repeated measurements.
+
+    ARGS:
+    - module (str): Dotted module name of the entry point.
+    - repeats (int): Number of fresh interpreters to measure.
+
+    RETURNS:
+    (import_ms: float, slowest_imports: list)
+    """
+    best_ms, best_imports = None, []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+        total_us, imports, in_site = 0, [], False
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            imports.append((int(cumulative), name))
+            # Top level imports. The site module is interpreter startup.
+            if depth == 0 and name != "site":
+                total_us += int(cumulative)
+
+        import_ms = total_us / 1000
+        if best_ms is None or import_ms < best_ms:
+            best_ms = import_ms
+            best_imports = sorted(imports, reverse=True)[:5]
+
+    return best_ms, best_imports
+
+
+def load_budget(budget_path: str = BUDGET_PATH) -> dict:
+    """Loads the import time budget in milliseconds per entry point."""
+    with open(budget_path, "r") as file:
+        return json.load(file)
+
+
+def run_benchmark(budget: dict) -> bool:
+    """DESCRIPTION:
+    Measures every entry point in the budget and prints a report.
+
+    ARGS:
+    - budget (dict): Budget in milliseconds per entry point.
+
+    RETURNS:
+    within_budget (bool)
+    """
+    within_budget = True
+    print(f"{'ENTRY POINT':<48} {'IMPORT MS':>10} {'BUDGET MS':>10}")
+    for module, budget_ms in budget.items():
+        import_ms, slowest_imports = measure_import_time(module)
+        status = "OK" if import_ms <= budget_ms else "OVER BUDGET"
+        print(f"{module:<48} {import_ms:>10.1f} {budget_ms:>10.1f} {status}")
+        if import_ms > budget_ms:
+            within_budget = False
+            for cumulative_us, name in slowest_imports:
+                print(f"    {name:<44} {cumulative_us / 1000:>10.1f}")
+    return within_budget
+
+
+def main():
+    within_budget = run_benchmark(load_budget())
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
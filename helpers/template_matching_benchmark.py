@@ -0,0 +1,155 @@
+"""
+Replays the screenshots of a recorded upload session through the screen
+matcher, and reports the matching latency, hit rate and false positives
+per template and confidence. Needs no display or network, so matcher
+changes can be evaluated on a headless box.
+
+Frames are replayed in the order they were recorded, with one matcher
+per confidence, so the last known regions are searched first as they
+were live. Labels come from the clicks: on a frame where a template was
+clicked, a match overlapping the clicked box is a hit, a match
+elsewhere is a false positive, and no match is a miss. Matches on
+frames with no click of the template are unlabelled, and are counted
+separately.
+
+# How to record a session:
+# RECORD_SESSION_DIR=sessions/2024-01-01 python automated_uploading.py
+# How to run the benchmark:
+# CD into root dir.
+# Run: python helpers/template_matching_benchmark.py sessions/2024-01-01
+# Add --baseline to compare with full resolution matching.
+"""
+import argparse
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from screen_matching import Match  # noqa: E402
+from screen_matching import Screen  # noqa: E402
+from screen_matching import ScreenMatcher  # noqa: E402
+from screen_matching import load_session  # noqa: E402
+from screen_matching import match_scores  # noqa: E402
+
+CONFIDENCES = (0.7, 0.8, 0.9)
+
+
+class FullScreenMatcher(ScreenMatcher):
+    """Baseline that matches every template across the whole screen at
+    full resolution, like pyautogui.locateOnScreen in grayscale."""
+
+    def find(
+            self,
+            template: str,
+            confidence: float = 0.9,
+            screen: Screen = None) -> Match:
+        gray = self._templates[template][0]
+        scores = match_scores(screen.gray, gray)
+        _, score, _, (left, top) = cv2.minMaxLoc(scores)
+        if score < confidence:
+            return None
+        height, width = gray.shape
+        return Match(left, top, width, height, score)
+
+
+def overlaps(match: Match, box: Match) -> bool:
+    """Checks if the center of a match is inside the clicked box."""
+    center_x = match.left + match.width / 2
+    center_y = match.top + match.height / 2
+    return box.left <= center_x <= box.left + box.width\
+        and box.top <= center_y <= box.top + box.height
+
+
+def replay(session: dict, confidence: float, matcher_class=ScreenMatcher):
+    """DESCRIPTION:
+    Matches every template of the session against every frame.
+
+    ARGS:
+    - session (dict): Session as returned by load_session.
+    - confidence (float): Confidence of the matches.
+    - matcher_class: ScreenMatcher or a subclass to benchmark.
+
+    RETURNS:
+    results (dict): Counts and latencies in milliseconds by template.
+    """
+    matcher = matcher_class(grab=None)
+    results = {}
+    for name, path in session["TEMPLATES"].items():
+        matcher.add_template(name, cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+        results[name] = {
+            "CLICKS": 0, "HITS": 0, "MISSES": 0, "FALSE_POSITIVES": 0,
+            "UNLABELLED": 0, "LATENCIES": [],
+        }
+
+    for frame, path in session["FRAMES"]:
+        screen = Screen(cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+        clicked = {}
+        for name, box in session["CLICKS"].get(frame, []):
+            clicked[name] = box
+        for name, result in results.items():
+            start = time.perf_counter()
+            match = matcher.find(name, confidence, screen)
+            result["LATENCIES"].append((time.perf_counter() - start) * 1000)
+            if name not in clicked:
+                result["UNLABELLED"] += match is not None
+                continue
+            result["CLICKS"] += 1
+            if match is None:
+                result["MISSES"] += 1
+            elif overlaps(match, clicked[name]):
+                result["HITS"] += 1
+            else:
+                result["FALSE_POSITIVES"] += 1
+    return results
+
+
+def print_report(results_by_confidence: dict) -> None:
+    print(
+        f"{'TEMPLATE':<44} {'CONF':>5} {'CLICKS':>7} {'HIT RATE':>9} "
+        f"{'FALSE POS':>10} {'UNLABELLED':>11} {'P50 MS':>8} {'P95 MS':>8}"
+    )
+    for confidence, results in results_by_confidence.items():
+        for name, result in results.items():
+            latencies = result["LATENCIES"] or [0.0]
+            hit_rate = result["HITS"] / result["CLICKS"]\
+                if result["CLICKS"] else float("nan")
+            print(
+                f"{name[-44:]:<44} {confidence:>5.2f} {result['CLICKS']:>7} "
+                f"{hit_rate:>9.2f} {result['FALSE_POSITIVES']:>10} "
+                f"{result['UNLABELLED']:>11} "
+                f"{np.percentile(latencies, 50):>8.2f} "
+                f"{np.percentile(latencies, 95):>8.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("session", help="Dir of a recorded session.")
+    parser.add_argument(
+        "--confidence", type=float, nargs="+", default=list(CONFIDENCES))
+    parser.add_argument(
+        "--baseline", action="store_true",
+        help="Also replay through full resolution matching.")
+    args = parser.parse_args()
+
+    session = load_session(args.session)
+    print(
+        f"{len(session['FRAMES'])} frames, "
+        f"{len(session['TEMPLATES'])} templates, "
+        f"{sum(map(len, session['CLICKS'].values()))} clicks."
+    )
+    matchers = [("SCREEN MATCHER", ScreenMatcher)]
+    if args.baseline:
+        matchers.append(("FULL RESOLUTION BASELINE", FullScreenMatcher))
+    for title, matcher_class in matchers:
+        print(f"\n{title}")
+        print_report({
+            confidence: replay(session, confidence, matcher_class)
+            for confidence in args.confidence
+        })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Counts clicks per INFERENCE_ID in memory, and publishes the counts of
+each window as a few compact records instead of one message per click.
+
+Records are msgpack maps with the window start and end (unix seconds),
+and the click count of each INFERENCE_ID clicked in the window:
+
+    {"WINDOW_START": 1719300000.0, "WINDOW_END": 1719300001.0,
+     "COUNTS": {"<INFERENCE_ID>": 12, ...}}
+
+Messages have a FORMAT attribute, so subscribers can tell the count
+records from the raw click events. Counts of the current window are
+only in memory until the window is flushed, and are flushed when the
+aggregator is stopped.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+LOGGER = logging.getLogger(__name__)
+
+RAW_FORMAT = "CLICK_JSON"
+COUNTS_FORMAT = "CLICK_COUNTS_MSGPACK"
+
+# Keeps records far below the Pub/Sub message size limit.
+MAX_IDS_PER_RECORD = 1000
+
+
+def encode_counts(
+        window_start: float,
+        window_end: float,
+        counts: dict) -> bytes:
+    """Packs the click counts of a window into a msgpack record."""
+    import msgpack
+    return msgpack.packb({
+        "WINDOW_START": window_start,
+        "WINDOW_END": window_end,
+        "COUNTS": counts,
+    })
+
+
+def decode_counts(data: bytes) -> dict:
+    """Unpacks a msgpack record of click counts."""
+    import msgpack
+    return msgpack.unpackb(data)
+
+
+class ClickAggregator:
+    """Counts clicks per INFERENCE_ID, and hands the counts to the sink
+    as records every window."""
+
+    def __init__(
+            self,
+            sink: Callable,
+            window_seconds: float = 1.0,
+            max_ids_per_record: int = MAX_IDS_PER_RECORD,
+            clock: Callable = time.time):
+        """
+        ARGS:
+        - sink (Callable): Called with the data and attributes of each
+        record, like ClickPublisher.publish.
+        - window_seconds (float): Seconds of clicks counted per record.
+        - max_ids_per_record (int): Windows with more IDs are split
+        into multiple records.
+        - clock (Callable): Returns the current unix time.
+        """
+        self.sink = sink
+        self.window_seconds = window_seconds
+        self.max_ids_per_record = max_ids_per_record
+        self.clock = clock
+        self.records = 0
+        self.clicks = 0
+        self._counts = Counter()
+        self._window_start = clock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, inference_id: str, count: int = 1) -> None:
+        """Counts a click. Only updates a counter, so it is cheap enough
+        to call on the event loop."""
+        with self._lock:
+            self._counts[inference_id] += count
+
+    def flush(self) -> int:
+        """DESCRIPTION:
+        Hands the counts of the current window to the sink, and starts
+        a new window.
+
+        ARGS: None
+
+        RETURNS:
+        clicks (int): Number of clicks in the flushed window.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            window_start, window_end = self._window_start, self.clock()
+            self._window_start = window_end
+
+        if not counts:
+            return 0
+
+        items = list(counts.items())
+        for start in range(0, len(items), self.max_ids_per_record):
+            record = encode_counts(
+                window_start,
+                window_end,
+                dict(items[start:start + self.max_ids_per_record])
+            )
+            self.sink(record, FORMAT=COUNTS_FORMAT)
+            self.records += 1
+
+        clicks = sum(counts.values())
+        self.clicks += clicks
+        return clicks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.window_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                LOGGER.exception("Click counts not flushed: %s", e)
+
+    def start(self) -> None:
+        """Flushes every window on a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background thread, and flushes the last window."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,172 @@
+"""
+Filters the clicks of bots and repeated refreshes before they are
+published. The redirect is still returned for every click.
+
+ClickDeduplicator suppresses a click when the same client clicked the
+same video within the window. RateLimiter gives each client a token
+bucket, and suppresses its clicks once the bucket is empty.
+
+Both keep their entries in an OrderedDict with a maximum size, so
+memory is bounded and every click costs O(1): a dict lookup, a move to
+the end, and popping the oldest entries. Clients are keyed by a salted
+hash of their IP, and the salt is random per process, so IPs are never
+stored. Neither class is thread safe, both are used from the event
+loop.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+def hash_client(host: str, salt: bytes) -> str:
+    """Salted hash of a client IP."""
+    return hashlib.blake2b(
+        host.encode("utf-8"), key=salt, digest_size=16).hexdigest()
+
+
+class ClickDeduplicator:
+    """Clicks seen in the window, keyed by (client hash, source), in
+    the order they were first seen."""
+
+    def __init__(
+            self,
+            window_seconds: float = 60.0,
+            max_entries: int = 100000,
+            clock: Callable = time.monotonic):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.suppressed = 0
+        self.evicted = 0
+        self._seen = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        # Entries are in the order they were first seen, so the expired
+        # ones are at the front.
+        while self._seen:
+            key, first_seen = next(iter(self._seen.items()))
+            if now - first_seen < self.window_seconds:
+                return
+            del self._seen[key]
+
+    def is_duplicate(self, client: str, source: str) -> bool:
+        """DESCRIPTION:
+        Checks if the client clicked the source within the window, and
+        records the click otherwise.
+
+        ARGS:
+        - client (str): Hash of the client IP.
+        - source (str): INFERENCE_ID of the video clicked.
+
+        RETURNS:
+        duplicate (bool)
+        """
+        now = self.clock()
+        self._expire(now)
+        key = (client, source)
+        if key in self._seen:
+            self.suppressed += 1
+            return True
+
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            # Full of clicks still in the window, the oldest is dropped.
+            self._seen.popitem(last=False)
+            self.evicted += 1
+        return False
+
+
+class RateLimiter:
+    """Token bucket per client. Buckets are kept in least recently used
+    order, and the least recently used is dropped past max_clients."""
+
+    def __init__(
+            self,
+            rate: float = 1.0,
+            burst: int = 10,
+            max_clients: int = 100000,
+            clock: Callable = time.monotonic):
+        """
+        ARGS:
+        - rate (float): Tokens added to a bucket per second.
+        - burst (int): Tokens a bucket holds, and starts with.
+        - max_clients (int): Buckets kept in memory.
+        - clock (Callable): Returns the current time in seconds.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.limited = 0
+        self._buckets = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, client: str) -> bool:
+        """Takes a token from the client's bucket, False when the bucket
+        is empty."""
+        now = self.clock()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.limited += 1
+
+        self._buckets[client] = (tokens, now)
+        self._buckets.move_to_end(client)
+        if len(self._buckets) > self.max_clients:
+            # A client coming back after eviction starts with a full
+            # bucket, like a new client.
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class ClickFilter:
+    """Decides which clicks are published, deduplicating first so that
+    repeated clicks do not use up the client's tokens."""
+
+    def __init__(
+            self,
+            deduplicator: ClickDeduplicator = None,
+            rate_limiter: RateLimiter = None,
+            salt: bytes = None):
+        self.deduplicator = deduplicator
+        self.rate_limiter = rate_limiter
+        self.salt = salt if salt is not None else os.urandom(16)
+
+    def should_publish(self, host: str, source: str) -> bool:
+        """DESCRIPTION:
+        Checks if a click should be published.
+
+        ARGS:
+        - host (str): IP of the client.
+        - source (str): INFERENCE_ID of the video clicked.
+
+        RETURNS:
+        publish (bool): False for duplicate and rate limited clicks.
+        """
+        client = hash_client(host, self.salt)
+        if self.deduplicator is not None\
+                and self.deduplicator.is_duplicate(client, source):
+            return False
+        if self.rate_limiter is not None\
+                and not self.rate_limiter.allow(client):
+            return False
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "DUPLICATES": self.deduplicator.suppressed
+            if self.deduplicator else 0,
+            "RATE_LIMITED": self.rate_limiter.limited
+            if self.rate_limiter else 0,
+        }
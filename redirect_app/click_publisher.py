@@ -0,0 +1,158 @@
+"""
+Hands clicks to the Pub/Sub publisher without waiting for the publish.
+
+The Pub/Sub client batches messages on its own threads, and publish()
+returns a future right away. A callback on each future counts the
+publishes that succeeded or failed, and records the publish latency,
+so failures are no longer silently discarded. When the client's flow
+control limits are hit, the click is counted as dropped instead of
+blocking the redirect.
+
+LocalPublisher is a stand-in for the Pub/Sub PublisherClient, with
+optional latency and failures, for tests and load tests.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+LOGGER = logging.getLogger(__name__)
+
+# Latencies kept for percentiles.
+MAX_LATENCIES = 10000
+
+
+class PublishStats:
+    """Counts of the publishes, and the latencies of recent publishes.
+    Updated from the publisher's callback threads."""
+
+    def __init__(self, max_latencies: int = MAX_LATENCIES):
+        # Only incremented by the thread handing messages to the
+        # publisher, so it needs no lock.
+        self.accepted = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=max_latencies)
+        self._lock = threading.Lock()
+
+    def record_published(self, latency: float) -> None:
+        with self._lock:
+            self.published += 1
+            self.latencies.append(latency)
+
+    def record_failed(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def record_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    @property
+    def in_flight(self) -> int:
+        """Messages handed to the publisher, not yet published or
+        failed."""
+        return self.accepted - self.published - self.failed
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Publish latency in seconds at a percentile (0 to 100) of the
+        recent publishes, None when nothing was published."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        index = round(percentile / 100 * (len(latencies) - 1))
+        return latencies[index]
+
+    def to_dict(self) -> dict:
+        return {
+            "PUBLISHED": self.published,
+            "FAILED": self.failed,
+            "DROPPED": self.dropped,
+            "LATENCY_P50": self.latency_percentile(50),
+            "LATENCY_P99": self.latency_percentile(99),
+        }
+
+
+class ClickPublisher:
+    """Publishes messages without blocking, and tracks the results."""
+
+    def __init__(self, publisher, topic_path: str, clock=time.perf_counter):
+        self.publisher = publisher
+        self.topic_path = topic_path
+        self.clock = clock
+        self.stats = PublishStats()
+
+    def publish(self, data: bytes, **attributes) -> bool:
+        """DESCRIPTION:
+        Hands a message to the publisher. The publisher batches and
+        sends it in the background.
+
+        ARGS:
+        - data (bytes): Message data.
+        - attributes: Message attributes.
+
+        RETURNS:
+        accepted (bool): False when the message was dropped, because
+        the publisher's flow control limits were hit.
+        """
+        start = self.clock()
+        try:
+            future = self.publisher.publish(
+                self.topic_path, data=data, **attributes)
+        except Exception as e:
+            # FlowControlLimitError, or the publisher is shut down.
+            LOGGER.warning("Click dropped: %s", e)
+            self.stats.record_dropped()
+            return False
+        self.stats.accepted += 1
+        future.add_done_callback(partial(self._on_done, start))
+        return True
+
+    def _on_done(self, start: float, future) -> None:
+        error = future.exception()
+        if error is not None:
+            LOGGER.error("Click publish failed: %s", error)
+            self.stats.record_failed()
+        else:
+            self.stats.record_published(self.clock() - start)
+
+
+class LocalPublisher:
+    """Stand-in for the Pub/Sub PublisherClient. Messages are published
+    after a latency on a thread pool, and fail at the failure rate."""
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            failure_rate: float = 0.0,
+            max_workers: int = 4):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.messages = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def topic_path(self, project: str, topic: str) -> str:
+        return f"projects/{project}/topics/{topic}"
+
+    def _send(self, data: bytes, attributes: dict) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Local publish failed.")
+        with self._lock:
+            self.messages.append((data, attributes))
+            return str(len(self.messages))
+
+    def publish(self, topic: str, data: bytes, **attributes) -> Future:
+        return self._executor.submit(self._send, data, attributes)
+
+    def stop(self) -> None:
+        """Waits for the messages in flight, like PublisherClient.stop."""
+        self._executor.shutdown(wait=True)
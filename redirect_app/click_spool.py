@@ -0,0 +1,361 @@
+"""
+Durable local spool for clicks, drained to Pub/Sub in the background.
+
+Every click is written to a SQLite database in WAL mode before the
+redirect returns, so clicks are kept when Pub/Sub is slow or down. A
+single writer thread commits the clicks waiting at that moment in one
+transaction (group commit), so one fsync covers many clicks, and the
+redirect latency stays the same whatever the state of Pub/Sub.
+
+A drainer thread publishes the spooled clicks in order, and moves a
+checkpoint past each prefix of clicks that were published. Published
+clicks are deleted with the checkpoint, in the same transaction. On
+startup the drainer resumes from the checkpoint. Delivery is at least
+once: clicks published but not yet checkpointed before a crash are
+published again, so each message has a SPOOL_ID attribute for
+deduplication.
+
+Several uvicorn workers can share one spool. Each worker appends to it,
+and a lock file makes sure only one drainer publishes at a time. The
+lock is released by the OS when its process dies, so another worker
+takes over.
+"""
+import fcntl
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from click_publisher import PublishStats
+
+LOGGER = logging.getLogger(__name__)
+
+# Publishes are waited on in slices, so a flush can cut a wait short.
+WAIT_SLICE_SECONDS = 0.1
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Opens the spool database, waiting on locks held by the other
+    thread instead of failing."""
+    connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Every commit is fsynced, so a click is durable once its future
+    # is resolved.
+    connection.execute("PRAGMA synchronous=FULL")
+    return connection
+
+
+class ClickSpool:
+    """Append only spool of click messages, with a checkpoint of the
+    last message published."""
+
+    def __init__(self, path: str, max_batch: int = 1000):
+        self.path = path
+        self.max_batch = max_batch
+        self.has_clicks = threading.Event()
+        self._queue = queue.Queue()
+        self._writer = connect(path)
+        # Used by the drainer and the app threads, one at a time.
+        self._reader = connect(path)
+        self._reader_lock = threading.Lock()
+        with self._writer:
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS clicks ("
+                "ID INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "DATA BLOB NOT NULL, "
+                "ATTRIBUTES TEXT NOT NULL, "
+                "CREATED REAL NOT NULL)"
+            )
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint ("
+                "NAME TEXT PRIMARY KEY, "
+                "LAST_ID INTEGER NOT NULL)"
+            )
+        if self.pending():
+            self.has_clicks.set()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def append(self, data: bytes, **attributes) -> Future:
+        """DESCRIPTION:
+        Queues a click to be written. The future resolves once the
+        click is committed to disk.
+
+        ARGS:
+        - data (bytes): Message data.
+        - attributes: Message attributes, published with the data.
+
+        RETURNS:
+        future (Future): Resolves to the spool ID of the click.
+        """
+        future = Future()
+        self._queue.put((data, json.dumps(attributes), time.time(), future))
+        return future
+
+    def _write(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Group commit every click waiting, in one transaction.
+            items = [item]
+            while len(items) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                items.append(item)
+
+            try:
+                with self._writer:
+                    ids = [
+                        self._writer.execute(
+                            "INSERT INTO clicks (DATA, ATTRIBUTES, CREATED) "
+                            "VALUES (?, ?, ?)",
+                            (data, attributes, created)
+                        ).lastrowid
+                        for data, attributes, created, _ in items
+                    ]
+            except Exception as e:
+                for *_, future in items:
+                    future.set_exception(e)
+                continue
+
+            for click_id, (*_, future) in zip(ids, items):
+                future.set_result(click_id)
+            self.has_clicks.set()
+
+    def last_checkpoint(self) -> int:
+        """ID of the last click published, 0 before the first."""
+        with self._reader_lock:
+            row = self._reader.execute(
+                "SELECT LAST_ID FROM checkpoint WHERE NAME = 'PUBLISHED'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def read_batch(self, limit: int) -> list:
+        """Oldest clicks after the checkpoint, as (ID, DATA, ATTRIBUTES)
+        tuples."""
+        last_id = self.last_checkpoint()
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT ID, DATA, ATTRIBUTES FROM clicks "
+                "WHERE ID > ? ORDER BY ID LIMIT ?",
+                (last_id, limit)
+            ).fetchall()
+        return [
+            (click_id, data, json.loads(attributes))
+            for click_id, data, attributes in rows
+        ]
+
+    def checkpoint(self, last_id: int) -> None:
+        """Moves the checkpoint to a published click, and deletes the
+        clicks up to it in the same transaction."""
+        with self._reader_lock, self._reader:
+            self._reader.execute(
+                "INSERT INTO checkpoint (NAME, LAST_ID) VALUES ('PUBLISHED', ?) "
+                "ON CONFLICT (NAME) DO UPDATE SET LAST_ID = excluded.LAST_ID",
+                (last_id,)
+            )
+            self._reader.execute("DELETE FROM clicks WHERE ID <= ?", (last_id,))
+
+    def pending(self) -> int:
+        """Number of clicks not yet published."""
+        last_id = self.last_checkpoint()
+        with self._reader_lock:
+            return self._reader.execute(
+                "SELECT COUNT(*) FROM clicks WHERE ID > ?", (last_id,)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        """Writes the clicks already queued, and closes the database."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._writer.close()
+        self._reader.close()
+
+
+class SpoolDrainer:
+    """Publishes spooled clicks in order, retrying with exponential
+    backoff while publishes fail."""
+
+    def __init__(
+            self,
+            spool: ClickSpool,
+            publisher,
+            topic_path: str,
+            batch_size: int = 500,
+            publish_timeout: float = 30.0,
+            retry_seconds: float = 0.5,
+            max_retry_seconds: float = 30.0,
+            lock_path: str = None):
+        self.spool = spool
+        self.publisher = publisher
+        self.topic_path = topic_path
+        self.batch_size = batch_size
+        self.publish_timeout = publish_timeout
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.lock_path = lock_path
+        self.stats = PublishStats()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        # Moved earlier by flush(), to cut short the batch in progress.
+        self._flush_deadline = float("inf")
+
+    def drain_once(self) -> bool:
+        """DESCRIPTION:
+        Publishes a batch of spooled clicks, and checkpoints the clicks
+        published before the first failure.
+
+        ARGS: None
+
+        RETURNS:
+        succeeded (bool): False when a publish in the batch failed.
+        """
+        batch = self.spool.read_batch(self.batch_size)
+        if not batch:
+            return True
+
+        start = time.perf_counter()
+        # The publish timeout is for the whole batch.
+        deadline = time.monotonic() + self.publish_timeout
+        futures = [
+            self.publisher.publish(
+                self.topic_path,
+                data=data,
+                SPOOL_ID=str(click_id),
+                **attributes
+            )
+            for click_id, data, attributes in batch
+        ]
+        self.stats.accepted += len(futures)
+        last_published = None
+        for (click_id, *_), future in zip(batch, futures):
+            try:
+                self._wait(future, deadline)
+            except Exception as e:
+                LOGGER.warning(
+                    "Spooled click %s not published: %s", click_id, e)
+                self.stats.record_failed()
+                break
+            self.stats.record_published(time.perf_counter() - start)
+            last_published = click_id
+
+        # Publishes left after a failure are not waited on, the retry
+        # sends them again.
+        self.stats.accepted = self.stats.published + self.stats.failed
+
+        if last_published is not None:
+            self.spool.checkpoint(last_published)
+        return last_published == batch[-1][0]
+
+    def _wait(self, future: Future, deadline: float) -> None:
+        """Waits for a publish until the deadline, or the flush deadline
+        if it is earlier."""
+        while True:
+            remaining = min(deadline, self._flush_deadline)\
+                - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Publish not confirmed in time.")
+            try:
+                future.result(timeout=min(remaining, WAIT_SLICE_SECONDS))
+                return
+            except FutureTimeoutError:
+                continue
+
+    def _acquire_lock(self) -> bool:
+        """Takes the lock file without waiting, True when no lock path
+        was given."""
+        if self.lock_path is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _release_lock(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _run(self) -> None:
+        # Waits while the drainer of another worker holds the lock.
+        while not self._acquire_lock():
+            if self._stop.wait(1.0):
+                return
+
+        retry_seconds = self.retry_seconds
+        while not self._stop.is_set():
+            self.spool.has_clicks.clear()
+            try:
+                succeeded = self.drain_once()
+            except Exception as e:
+                LOGGER.exception("Spool drain failed: %s", e)
+                succeeded = False
+
+            if not succeeded:
+                self._stop.wait(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, self.max_retry_seconds)
+                continue
+            retry_seconds = self.retry_seconds
+            if not self.spool.pending():
+                # Woken by the next commit, or checks again after a
+                # second.
+                self.spool.has_clicks.wait(1.0)
+
+    def start(self) -> None:
+        """Starts draining on a background thread, resuming from the
+        last checkpoint."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the drainer. Clicks not yet published stay in the
+        spool, and are published after the next start."""
+        self._stop.set()
+        self.spool.has_clicks.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._release_lock()
+
+    def flush(self, timeout: float) -> int:
+        """DESCRIPTION:
+        Stops the drainer, then publishes the spooled clicks until the
+        spool is empty, a publish fails, or the timeout passes. Used on
+        shutdown. Only the drainer holding the lock flushes, so workers
+        shutting down together do not publish the same clicks.
+
+        ARGS:
+        - timeout (float): Seconds to spend publishing.
+
+        RETURNS:
+        pending (int): Clicks left in the spool for the next start.
+        """
+        self._flush_deadline = time.monotonic() + timeout
+        self._stop.set()
+        self.spool.has_clicks.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            if self._acquire_lock():
+                while self.spool.pending()\
+                        and time.monotonic() < self._flush_deadline:
+                    if not self.drain_once():
+                        break
+        finally:
+            self._flush_deadline = float("inf")
+            self._release_lock()
+        return self.spool.pending()
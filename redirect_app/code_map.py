@@ -0,0 +1,101 @@
+"""
+In memory map of short link codes, reloaded when the file changes.
+
+The pipeline exports the code map as JSON, code to INFERENCE_ID and
+TARGET_URL. The map is loaded into a dict, so resolving a code is a
+single lookup. A background thread checks the modification time of the
+file, and loads a changed file into a new dict that replaces the old
+one in a single assignment, so requests never see a partly loaded map.
+A map that fails to load is logged, and the previous map is kept.
+"""
+import json
+import logging
+import os
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CodeMap:
+    """Short codes to (INFERENCE_ID, TARGET_URL)."""
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._codes = {}
+        self._inference_ids = frozenset()
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def resolve(self, code: str) -> tuple:
+        """(INFERENCE_ID, TARGET_URL) of a code, None for unknown
+        codes."""
+        return self._codes.get(code)
+
+    @property
+    def loaded(self) -> bool:
+        """Checks if a map was loaded since the start."""
+        return self._mtime is not None
+
+    def has_video(self, inference_id: str) -> bool:
+        """Checks if an INFERENCE_ID has a code in the map."""
+        return inference_id in self._inference_ids
+
+    def reload(self) -> bool:
+        """DESCRIPTION:
+        Loads the map if the file changed since the last load.
+
+        ARGS: None
+
+        RETURNS:
+        reloaded (bool)
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file)
+            codes = {
+                code: (entry["INFERENCE_ID"], entry["TARGET_URL"])
+                for code, entry in entries.items()
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.error("Code map %s not loaded: %s", self.path, e)
+            return False
+
+        # IDs are replaced first, so a code that resolves always has its
+        # ID known.
+        self._inference_ids = frozenset(
+            inference_id for inference_id, _ in codes.values())
+        self._codes = codes
+        self._mtime = mtime
+        self.reloads += 1
+        LOGGER.info("Loaded %s short codes from %s.", len(codes), self.path)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            self.reload()
+
+    def start(self) -> None:
+        """Loads the map, and checks the file for changes on a
+        background thread."""
+        self.reload()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,6 +1,78 @@
+import os
 
 # GCP SETTINGS
 TEST_DATA_BUCKET_GCP = "test-data-jellyfish"
 GCP_PROJECT_ID = "video-generation-404817"
 CLICKED_LINK_TOPIC_ID = "CLICKED-LINK"
 URL_TO_REDIRECT_TO = "https://www.wildanimalinitiative.org/donate"
+
+# PUBLISHER SETTINGS
+# Clicks are batched by the publisher, and a batch is sent when any of
+# these limits is reached.
+BATCH_MAX_MESSAGES = 100
+BATCH_MAX_BYTES = 1024 * 1024
+BATCH_MAX_LATENCY = 0.01
+# Messages waiting to be sent. Past these limits, clicks are dropped
+# ("error") instead of blocking the redirect ("block").
+FLOW_CONTROL_MAX_MESSAGES = 10000
+FLOW_CONTROL_MAX_BYTES = 10 * 1024 * 1024
+FLOW_CONTROL_LIMIT_EXCEEDED_BEHAVIOR = "error"
+
+# SPOOL SETTINGS
+# Clicks are written to a local spool before the redirect returns, and
+# published from the spool in the background.
+SPOOL_ENABLED = True
+SPOOL_PATH = "spool/clicks.sqlite3"
+# Clicks committed in one transaction, and published per drain.
+SPOOL_MAX_BATCH = 1000
+SPOOL_DRAIN_BATCH = 500
+SPOOL_PUBLISH_TIMEOUT = 30.0
+SPOOL_RETRY_SECONDS = 0.5
+SPOOL_MAX_RETRY_SECONDS = 30.0
+
+# AGGREGATION SETTINGS
+# "raw" publishes one message per click. "aggregate" counts the clicks
+# per INFERENCE_ID, and publishes the counts of each window.
+CLICK_MODE = os.environ.get("CLICK_MODE", "raw")
+AGGREGATION_WINDOW_SECONDS = 1.0
+
+# CLICK FILTER SETTINGS
+# Clicks of the same video by the same client within the window are 
+# only published once.
+DEDUPE_ENABLED = os.environ.get("DEDUPE_ENABLED", "1") == "1"
+DEDUPE_WINDOW_SECONDS = 60.0
+DEDUPE_MAX_ENTRIES = 100000
+# Each client can publish a burst of clicks, then one click per second.
+# Clicks over the limit are still redirected, but not published.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_PER_SECOND = 1.0
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_MAX_CLIENTS = 100000
+# Both filters key clients on their IP. Behind a load balancer every 
+# request comes from the balancer, so requests from these addresses 
+# (comma separated IPs or networks, "*" for any) are keyed on the 
+# client address they give in X-Forwarded-For instead. Only list 
+# proxies that overwrite the header, as clients can send their own.
+FORWARDED_ALLOW_IPS = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# SHUTDOWN SETTINGS
+# Seconds each worker spends flushing its clicks after SIGTERM. Kept 
+# under the grace period before the container is killed.
+SHUTDOWN_FLUSH_SECONDS = 8.0
+
+# SHORT LINK SETTINGS
+# Code map exported by the pipeline, reloaded when it changes.
+CODE_MAP_PATH = "codes/code_map.json"
+CODE_MAP_CHECK_SECONDS = 1.0
+
+# LOAD TEST SETTINGS
+# load_generator.py swaps the Pub/Sub publisher for a LocalPublisher with 
+# latency and failures, through these environment variables. Each worker
+# writes its publish counts to a JSON file in PUBLISHER_STANDIN_STATS 
+# on shutdown.
+PUBLISHER_STANDIN = os.environ.get("PUBLISHER_STANDIN") == "1"
+PUBLISHER_STANDIN_LATENCY = float(
+    os.environ.get("PUBLISHER_STANDIN_LATENCY", 0))
+PUBLISHER_STANDIN_FAILURE_RATE = float(
+    os.environ.get("PUBLISHER_STANDIN_FAILURE_RATE", 0))
+PUBLISHER_STANDIN_STATS = os.environ.get("PUBLISHER_STANDIN_STATS")
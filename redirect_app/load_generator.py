@@ -0,0 +1,351 @@
+"""
+Load test of the redirect app.
+
+Starts the app under uvicorn with one or more workers, with the Pub/Sub
+publisher swapped for a LocalPublisher stand-in that can add publish
+latency and failures, and sends redirect requests with an asyncio httpx
+client. Reports the throughput, the p50/p95/p99 latency of the
+redirects, and the messages published by the workers.
+
+Closed loop: each of the concurrent clients sends its next request as
+soon as the last one returns, which finds the maximum throughput.
+Open loop (--rate): requests are sent at a fixed rate whatever the
+latency, and each latency is measured from the time the request was
+due, so a slow server is not hidden by clients waiting on it.
+
+Typical usage example:
+
+    python redirect_app/load_generator.py --workers 2 --concurrency 64
+    python redirect_app/load_generator.py --rate 2000 --latency 0.05 \\
+        --failure-rate 0.01
+    python redirect_app/load_generator.py --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import glob
+import importlib.util
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from click_spool import ClickSpool
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The redirect returns a temporary redirect to the donation page.
+REDIRECT_STATUS_CODE = 307
+
+
+def load_app_configs():
+    """The configs of the redirect app, loaded from their file. Where
+    the pipeline's configs are already imported as configs, like in 
+    the tests, importing configs would give those."""
+    spec = importlib.util.spec_from_file_location(
+        "redirect_app_configs", os.path.join(APP_DIR, "configs.py"))
+    configs = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(configs)
+    return configs
+
+
+def percentile(values: list, percentile: float) -> float:
+    """Value at a percentile (0 to 100), None when there are no values."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[round(percentile / 100 * (len(values) - 1))]
+
+
+class LoadResult:
+    """Latencies and errors of the requests sent."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def record(self, latency: float, succeeded: bool) -> None:
+        self.latencies.append(latency)
+        if not succeeded:
+            self.errors += 1
+
+    def to_dict(self) -> dict:
+        requests = len(self.latencies)
+        return {
+            "REQUESTS": requests,
+            "ERRORS": self.errors,
+            "THROUGHPUT": requests / self.elapsed if self.elapsed else None,
+            "LATENCY_P50": percentile(self.latencies, 50),
+            "LATENCY_P95": percentile(self.latencies, 95),
+            "LATENCY_P99": percentile(self.latencies, 99),
+        }
+
+
+async def send_request(
+        client: httpx.AsyncClient,
+        source: str,
+        result: LoadResult,
+        due: float) -> None:
+    """Sends a redirect request, and records its latency from the time
+    it was due."""
+    try:
+        response = await client.get("/redirect", params={"source": source})
+        succeeded = response.status_code == REDIRECT_STATUS_CODE
+    except httpx.HTTPError:
+        succeeded = False
+    result.record(time.perf_counter() - due, succeeded)
+
+
+async def run_load(
+        client: httpx.AsyncClient,
+        duration: float,
+        concurrency: int = 32,
+        rate: float = None,
+        num_ids: int = 100) -> LoadResult:
+    """DESCRIPTION:
+    Sends redirect requests for the duration, closed loop with the
+    concurrent clients, or open loop at the rate.
+
+    ARGS:
+    - client (httpx.AsyncClient): Client with the base URL of the app.
+    - duration (float): Seconds to send requests for.
+    - concurrency (int): Concurrent clients of the closed loop.
+    - rate (float): Requests per second of the open loop, the closed
+    loop is used when None.
+    - num_ids (int): Number of INFERENCE_IDs the clicks are spread over.
+
+    RETURNS:
+    result (LoadResult)
+    """
+    result = LoadResult()
+    start = time.perf_counter()
+
+    if rate is None:
+        deadline = start + duration
+
+        async def closed_loop_client(index: int) -> None:
+            sent = 0
+            while time.perf_counter() < deadline:
+                source = f"load-test-{(index + sent * concurrency) % num_ids}"
+                await send_request(
+                    client, source, result, time.perf_counter())
+                sent += 1
+
+        await asyncio.gather(
+            *(closed_loop_client(index) for index in range(concurrency)))
+    else:
+        tasks = []
+        for index in range(int(rate * duration)):
+            due = start + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_request(
+                client, f"load-test-{index % num_ids}", result, due)))
+        await asyncio.gather(*tasks)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+class RedirectServer:
+    """Runs the redirect app under uvicorn in a temporary directory, so
+    the spool of each load test starts empty. A code map of the load 
+    test IDs is written there, so their clicks are published."""
+
+    def __init__(
+            self,
+            port: int = 8765,
+            workers: int = 1,
+            latency: float = 0.0,
+            failure_rate: float = 0.0,
+            filter_clicks: bool = False,
+            num_ids: int = 100,
+            click_mode: str = "raw"):
+        self.port = port
+        self.workers = workers
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.filter_clicks = filter_clicks
+        self.num_ids = num_ids
+        self.click_mode = click_mode
+        self.url = f"http://127.0.0.1:{port}"
+        self._temp_dir = None
+        self._process = None
+
+    @property
+    def stats_dir(self) -> str:
+        return os.path.join(self._temp_dir.name, "stats")
+
+    def start(self, timeout: float = 30.0) -> None:
+        """Starts uvicorn, and waits until the app answers."""
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._write_code_map()
+        env = dict(
+            os.environ,
+            PUBLISHER_STANDIN="1",
+            PUBLISHER_STANDIN_LATENCY=str(self.latency),
+            PUBLISHER_STANDIN_FAILURE_RATE=str(self.failure_rate),
+            PUBLISHER_STANDIN_STATS=self.stats_dir,
+            # Every request comes from this host, so the click filters
+            # would suppress nearly all of them.
+            DEDUPE_ENABLED="1" if self.filter_clicks else "0",
+            RATE_LIMIT_ENABLED="1" if self.filter_clicks else "0",
+            CLICK_MODE=self.click_mode,
+        )
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--app-dir", APP_DIR,
+                "--port", str(self.port),
+                "--workers", str(self.workers),
+                "--log-level", "warning",
+            ],
+            cwd=self._temp_dir.name,
+            env=env,
+        )
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("The redirect app exited on startup.")
+            try:
+                if httpx.get(f"{self.url}/").status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        self.stop()
+        raise TimeoutError("The redirect app did not start in time.")
+
+    def stop(self, timeout: float = 60.0) -> dict:
+        """DESCRIPTION:
+        Stops uvicorn gracefully, so the workers flush their publishes,
+        and adds up the publish counts of the workers.
+
+        ARGS:
+        - timeout (float): Seconds to wait for the workers to exit.
+
+        RETURNS:
+        stats (dict): Messages published, failed and dropped, the clicks
+        in the messages published, and the messages left in the spool.
+        """
+        self._process.send_signal(signal.SIGTERM)
+        self._process.wait(timeout=timeout)
+
+        stats = {
+            "MESSAGES_PUBLISHED": 0,
+            "CLICKS_PUBLISHED": 0,
+            "PUBLISH_FAILED": 0,
+            "DROPPED": 0,
+            "DUPLICATES": 0,
+            "RATE_LIMITED": 0,
+        }
+        for path in glob.glob(os.path.join(self.stats_dir, "*.json")):
+            with open(path, "r") as file:
+                worker = json.load(file)
+            stats["MESSAGES_PUBLISHED"] += worker["MESSAGES"]
+            stats["CLICKS_PUBLISHED"] += worker["CLICKS"]
+            for source in ("CLICK_PUBLISHER", "DRAINER"):
+                if worker[source]:
+                    stats["PUBLISH_FAILED"] += worker[source]["FAILED"]
+                    stats["DROPPED"] += worker[source]["DROPPED"]
+            for counter in ("DUPLICATES", "RATE_LIMITED"):
+                stats[counter] += worker["FILTERED"][counter]
+            if worker["AGGREGATED_CLICKS"] is not None:
+                stats["AGGREGATED_CLICKS"] =\
+                    stats.get("AGGREGATED_CLICKS", 0)\
+                    + worker["AGGREGATED_CLICKS"]
+        stats["SPOOL_PENDING"] = self._spool_pending()
+
+        self._temp_dir.cleanup()
+        return stats
+
+    def _write_code_map(self) -> None:
+        """Writes a code map with each load test ID as its own code."""
+        path = os.path.join(
+            self._temp_dir.name, load_app_configs().CODE_MAP_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump({
+                f"load-test-{index}": {
+                    "INFERENCE_ID": f"load-test-{index}",
+                    "TARGET_URL": "https://example.com",
+                }
+                for index in range(self.num_ids)
+            }, file)
+
+    def _spool_pending(self) -> int:
+        """Messages spooled but not published before the workers exited,
+        clicks in raw mode and counts in aggregate mode."""
+        path = os.path.join(
+            self._temp_dir.name, load_app_configs().SPOOL_PATH)
+        if not os.path.exists(path):
+            return 0
+        spool = ClickSpool(path)
+        pending = spool.pending()
+        spool.close()
+        return pending
+
+
+async def load_test(url: str, **load) -> LoadResult:
+    limits = httpx.Limits(max_connections=load.get("concurrency", 32))
+    async with httpx.AsyncClient(
+            base_url=url,
+            limits=limits,
+            timeout=httpx.Timeout(30.0)) as client:
+        return await run_load(client, **load)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Load test a running app instead.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Requests per second, closed loop if unset.")
+    parser.add_argument("--ids", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to each stand-in publish.")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Fraction of stand-in publishes that fail.")
+    parser.add_argument("--filter-clicks", action="store_true",
+                        help="Keep deduplication and rate limiting on.")
+    parser.add_argument("--click-mode", choices=("raw", "aggregate"),
+                        default="raw")
+    args = parser.parse_args()
+
+    load = {
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "num_ids": args.ids,
+    }
+    if args.url:
+        report = asyncio.run(load_test(args.url, **load)).to_dict()
+    else:
+        server = RedirectServer(
+            port=args.port,
+            workers=args.workers,
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            filter_clicks=args.filter_clicks,
+            num_ids=args.ids,
+            click_mode=args.click_mode,
+        )
+        server.start()
+        try:
+            report = asyncio.run(load_test(server.url, **load)).to_dict()
+        finally:
+            stats = server.stop()
+        report.update(stats)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
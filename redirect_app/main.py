@@ -2,43 +2,425 @@
 # How to run the code locally:
 # CD into root dir.
 # Run: uvicorn redirect_app.main:app --reload
+# One worker per core, from within redirect_app:
+# uvicorn main:app --workers 4
 # To access the redirect app use this URL:
 # http://127.0.0.1:8000/redirect?source=INFERENCE_ID
 """
 
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from starlette.responses import RedirectResponse
+from starlette.responses import Response
 from google.cloud import pubsub_v1
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+import asyncio
 import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
 from configs import URL_TO_REDIRECT_TO
 from configs import GCP_PROJECT_ID
 from configs import CLICKED_LINK_TOPIC_ID
+from configs import BATCH_MAX_MESSAGES
+from configs import BATCH_MAX_BYTES
+from configs import BATCH_MAX_LATENCY
+from configs import FLOW_CONTROL_MAX_MESSAGES
+from configs import FLOW_CONTROL_MAX_BYTES
+from configs import FLOW_CONTROL_LIMIT_EXCEEDED_BEHAVIOR
+from configs import SPOOL_ENABLED
+from configs import SPOOL_PATH
+from configs import SPOOL_MAX_BATCH
+from configs import SPOOL_DRAIN_BATCH
+from configs import SPOOL_PUBLISH_TIMEOUT
+from configs import SPOOL_RETRY_SECONDS
+from configs import SPOOL_MAX_RETRY_SECONDS
+from configs import CLICK_MODE
+from configs import AGGREGATION_WINDOW_SECONDS
+from configs import DEDUPE_ENABLED
+from configs import DEDUPE_WINDOW_SECONDS
+from configs import DEDUPE_MAX_ENTRIES
+from configs import RATE_LIMIT_ENABLED
+from configs import RATE_LIMIT_PER_SECOND
+from configs import RATE_LIMIT_BURST
+from configs import RATE_LIMIT_MAX_CLIENTS
+from configs import FORWARDED_ALLOW_IPS
+from configs import CODE_MAP_PATH
+from configs import CODE_MAP_CHECK_SECONDS
+from configs import SHUTDOWN_FLUSH_SECONDS
+from configs import PUBLISHER_STANDIN
+from configs import PUBLISHER_STANDIN_LATENCY
+from configs import PUBLISHER_STANDIN_FAILURE_RATE
+from configs import PUBLISHER_STANDIN_STATS
+from click_aggregator import ClickAggregator
+from click_aggregator import COUNTS_FORMAT
+from click_aggregator import RAW_FORMAT
+from click_aggregator import decode_counts
+from click_filter import ClickDeduplicator
+from click_filter import ClickFilter
+from click_filter import RateLimiter
+from click_publisher import ClickPublisher
+from click_publisher import LocalPublisher
+from click_spool import ClickSpool
+from click_spool import SpoolDrainer
+from code_map import CodeMap
+from metrics import CONTENT_TYPE
+from metrics import EventLoopMonitor
+from metrics import RequestMetrics
+from metrics import RequestMetricsMiddleware
+from metrics import format_metric
+from metrics import publish_metrics
 
 
-app = FastAPI()
+LOGGER = logging.getLogger(__name__)
 
-PUBLISHER = pubsub_v1.PublisherClient()
-TOPIC_PATH = PUBLISHER.topic_path(GCP_PROJECT_ID, CLICKED_LINK_TOPIC_ID)
+
+def create_publisher() -> pubsub_v1.PublisherClient:
+    """DESCRIPTION:
+    Creates the Pub/Sub publisher with the batch and flow control 
+    settings from the configs. Under load tests, a LocalPublisher 
+    stand-in is created instead.
+
+    ARGS: None
+
+    RETURNS:
+    publisher (pubsub_v1.PublisherClient | LocalPublisher)
+    """
+    if PUBLISHER_STANDIN:
+        return LocalPublisher(
+            latency=PUBLISHER_STANDIN_LATENCY,
+            failure_rate=PUBLISHER_STANDIN_FAILURE_RATE,
+        )
+    batch_settings = pubsub_v1.types.BatchSettings(
+        max_messages=BATCH_MAX_MESSAGES,
+        max_bytes=BATCH_MAX_BYTES,
+        max_latency=BATCH_MAX_LATENCY,
+    )
+    flow_control = pubsub_v1.types.PublishFlowControl(
+        message_limit=FLOW_CONTROL_MAX_MESSAGES,
+        byte_limit=FLOW_CONTROL_MAX_BYTES,
+        limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior(
+            FLOW_CONTROL_LIMIT_EXCEEDED_BEHAVIOR),
+    )
+    return pubsub_v1.PublisherClient(
+        batch_settings=batch_settings,
+        publisher_options=pubsub_v1.types.PublisherOptions(
+            flow_control=flow_control),
+    )
+
+
+def create_spool(publisher, topic_path: str) -> tuple:
+    """DESCRIPTION:
+    Opens the click spool, and the drainer that publishes from it.
+
+    ARGS:
+    - publisher: Publisher of the worker.
+    - topic_path (str): Topic the clicks are published to.
+
+    RETURNS:
+    (spool: ClickSpool | None, drainer: SpoolDrainer | None)
+    """
+    if not SPOOL_ENABLED:
+        return None, None
+    directory = os.path.dirname(SPOOL_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    spool = ClickSpool(SPOOL_PATH, max_batch=SPOOL_MAX_BATCH)
+    drainer = SpoolDrainer(
+        spool,
+        publisher,
+        topic_path,
+        batch_size=SPOOL_DRAIN_BATCH,
+        publish_timeout=SPOOL_PUBLISH_TIMEOUT,
+        retry_seconds=SPOOL_RETRY_SECONDS,
+        max_retry_seconds=SPOOL_MAX_RETRY_SECONDS,
+        lock_path=SPOOL_PATH + ".lock",
+    )
+    return spool, drainer
+
+
+def create_click_filter() -> ClickFilter:
+    """Deduplication and rate limiting, as enabled in the configs."""
+    return ClickFilter(
+        deduplicator=ClickDeduplicator(
+            window_seconds=DEDUPE_WINDOW_SECONDS,
+            max_entries=DEDUPE_MAX_ENTRIES,
+        ) if DEDUPE_ENABLED else None,
+        rate_limiter=RateLimiter(
+            rate=RATE_LIMIT_PER_SECOND,
+            burst=RATE_LIMIT_BURST,
+            max_clients=RATE_LIMIT_MAX_CLIENTS,
+        ) if RATE_LIMIT_ENABLED else None,
+    )
+
+
+def start_worker(state) -> None:
+    """DESCRIPTION:
+    Creates the publisher of this worker and everything that publishes
+    with it, and starts their background threads. Runs in each worker 
+    after it is started, so no Pub/Sub client is shared across a fork.
+
+    ARGS:
+    - state (State): The app state the worker's objects are kept on.
+
+    RETURNS: None
+    """
+    state.publisher = create_publisher()
+    state.topic_path = state.publisher.topic_path(
+        GCP_PROJECT_ID, CLICKED_LINK_TOPIC_ID)
+    state.click_publisher = ClickPublisher(state.publisher, state.topic_path)
+    state.spool, state.drainer = create_spool(
+        state.publisher, state.topic_path)
+
+    def publish_click(data: bytes, **attributes) -> None:
+        """Writes a message to the spool, or hands it to the publisher 
+        when the spool is disabled. Waits for the write to commit, so
+        counts flushed on shutdown are in the spool before it is
+        drained."""
+        if state.spool is not None:
+            state.spool.append(data, **attributes).result()
+        else:
+            state.click_publisher.publish(data, **attributes)
+
+    state.aggregator = ClickAggregator(
+        publish_click,
+        window_seconds=AGGREGATION_WINDOW_SECONDS
+    ) if CLICK_MODE == "aggregate" else None
+    state.code_map = CodeMap(
+        CODE_MAP_PATH, check_interval=CODE_MAP_CHECK_SECONDS)
+    state.click_filter = create_click_filter()
+
+    # Publishes the clicks left in the spool by the last run, and the 
+    # new clicks.
+    state.code_map.start()
+    if state.drainer is not None:
+        state.drainer.start()
+    if state.aggregator is not None:
+        state.aggregator.start()
+
+
+def stop_worker(state, timeout: float = SHUTDOWN_FLUSH_SECONDS) -> None:
+    """DESCRIPTION:
+    Flushes the clicks of this worker before it exits: the click counts
+    of the last window, the spooled clicks, and the messages batched in
+    the publisher. Gives up at the timeout, so the worker exits before 
+    it is killed. Spooled clicks not published by then are published 
+    after the next start.
+
+    ARGS:
+    - state (State): The app state of the worker.
+    - timeout (float): Seconds to spend flushing.
+
+    RETURNS: None
+    """
+    deadline = time.monotonic() + timeout
+    state.code_map.stop()
+    if state.aggregator is not None:
+        state.aggregator.stop()
+    if state.drainer is not None:
+        pending = state.drainer.flush(
+            timeout=max(0.0, deadline - time.monotonic()))
+        if pending:
+            LOGGER.warning("%s clicks left in the spool.", pending)
+        state.spool.close()
+
+    # Sends the messages still batched in the publisher. stop() blocks
+    # until they are sent, so it is waited on until the deadline.
+    stopping = threading.Thread(target=state.publisher.stop, daemon=True)
+    stopping.start()
+    stopping.join(timeout=max(0.0, deadline - time.monotonic()))
+    if stopping.is_alive():
+        LOGGER.warning("Publisher not flushed before the deadline.")
+    if PUBLISHER_STANDIN_STATS:
+        write_standin_stats(state, PUBLISHER_STANDIN_STATS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the worker, and flushes its clicks on shutdown, when 
+    uvicorn gets SIGTERM. Flushing runs in a thread, so the event loop
+    is free while it waits on Pub/Sub."""
+    start_worker(app.state)
+    app.state.event_loop_monitor = EventLoopMonitor()
+    app.state.event_loop_monitor.start()
+    try:
+        yield
+    finally:
+        app.state.event_loop_monitor.stop()
+        await asyncio.to_thread(stop_worker, app.state)
+
+
+app = FastAPI(lifespan=lifespan)
+
+REQUEST_METRICS = RequestMetrics(
+    {"/", "/redirect", "/s/{code}", "/metrics"})
+app.add_middleware(RequestMetricsMiddleware, metrics=REQUEST_METRICS)
+# Sets the client of requests from the trusted proxies to the address
+# in X-Forwarded-For, so clicks are filtered per client under any 
+# server. uvicorn does the same when run with --proxy-headers.
+app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=FORWARDED_ALLOW_IPS)
+
+
+def write_standin_stats(state, directory: str) -> str:
+    """DESCRIPTION:
+    Writes the publish counts of this worker, and the clicks in the 
+    messages published, for the load test to add up across workers.
+
+    ARGS:
+    - state (State): The app state of the worker.
+    - directory (str): Directory of the stats files, one per worker.
+
+    RETURNS:
+    path (str): Path of the stats file.
+    """
+    stats = {
+        "MESSAGES": len(state.publisher.messages),
+        "CLICKS": sum(
+            sum(decode_counts(data)["COUNTS"].values())
+            if attributes.get("FORMAT") == COUNTS_FORMAT else 1
+            for data, attributes in state.publisher.messages),
+        "CLICK_PUBLISHER": state.click_publisher.stats.to_dict(),
+        "DRAINER": state.drainer.stats.to_dict() if state.drainer else None,
+        "AGGREGATED_CLICKS":
+            state.aggregator.clicks if state.aggregator else None,
+        "FILTERED": state.click_filter.to_dict(),
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with open(path, "w") as file:
+        json.dump(stats, file)
+    return path
+
+
+async def record_click(request: Request, source: str) -> None:
+    """DESCRIPTION:
+    Records a click. Data is logged in bigquery using pub-sub. Only 
+    the INFERENCE_ID is collected, and additional meta data is added 
+    automatically by pub sub.
+
+    The click is written to the local spool before redirecting, and 
+    published from the spool in the background, so the redirect does 
+    not wait for Pub/Sub and clicks are kept while Pub/Sub is down.
+    Without the spool, the click is handed to the publisher's batch.
+    In aggregate mode, the click is only counted, and the counts are 
+    published every window. Duplicate and rate limited clicks are 
+    not published. Clients are keyed on the address set by the proxy
+    headers middleware, and filtered per worker.
+
+    ARGS:
+    - request (Request): Request of the click.
+    - source (str): INFERENCE_ID of the video that was clicked.
+
+    RETURNS: None
+    """
+    state = request.app.state
+    host = request.client.host if request.client else "unknown"
+    if not state.click_filter.should_publish(host, source):
+        return
+
+    if state.aggregator is not None:
+        state.aggregator.add(source)
+        return
+
+    data = json.dumps({"INFERENCE_ID": source}).encode("utf-8")
+    if state.spool is not None:
+        await asyncio.wrap_future(
+            state.spool.append(data, FORMAT=RAW_FORMAT))
+    else:
+        state.click_publisher.publish(data, FORMAT=RAW_FORMAT)
 
 
 @app.get("/redirect")
-def redirect_url(source: str = Query(default="unknown")):
+async def redirect_url(
+        request: Request,
+        source: str = Query(default="unknown")):
     """DESCRIPTION:
     Redirects clicks on this URL, to the target URL for donations
-    URL_TO_REDIRECT_TO. Data is logged in bigquery using pub-sub. 
-    Pub-sub is used for low latency. Only the INFERENCE_ID is 
-    collected, and additional meta data is added automatically by pub
-    sub.
+    URL_TO_REDIRECT_TO, and records the click. Used by the links of 
+    videos from before short links. Sources that are not a video in the
+    code map are redirected without being recorded, so made up sources
+    are never published. Until a code map is loaded, every source is
+    recorded, so no click is lost when the map is missing.
+
+    The route runs on the event loop instead of the thread pool.
 
     ARGS:
+    - source (str): INFERENCE_ID of the video that was clicked.
 
     RETURNS:
+    RedirectResponse
     """
-    data = json.dumps({"INFERENCE_ID": source}).encode("utf-8")
-    _ = PUBLISHER.publish(TOPIC_PATH, data=data)
+    code_map = request.app.state.code_map
+    if not code_map.loaded or code_map.has_video(source):
+        await record_click(request, source)
     return RedirectResponse(url=URL_TO_REDIRECT_TO)
 
 
+@app.get("/s/{code}")
+async def redirect_short_link(request: Request, code: str):
+    """DESCRIPTION:
+    Redirects a short link to the target URL of its video, and records
+    the click. Unknown codes are rejected before anything is published.
+
+    ARGS:
+    - code (str): Short code of the video that was clicked.
+
+    RETURNS:
+    RedirectResponse
+    """
+    entry = request.app.state.code_map.resolve(code)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown link.")
+    inference_id, target_url = entry
+    await record_click(request, inference_id)
+    return RedirectResponse(url=target_url)
+
+
+@app.get("/metrics")
+async def read_metrics(request: Request):
+    """DESCRIPTION:
+    Serves the metrics of this worker in the Prometheus text format: 
+    requests by status and their latency, publish results, latency and
+    publishes in flight, spool depth, filtered clicks, and event loop 
+    lag.
+
+    ARGS: None
+
+    RETURNS:
+    Response
+    """
+    state = request.app.state
+    stats = {"publisher": state.click_publisher.stats}
+    if state.drainer is not None:
+        stats["drainer"] = state.drainer.stats
+    # Counting the spool is a query, so it does not block the loop.
+    spool_pending = await asyncio.to_thread(state.spool.pending)\
+        if state.spool is not None else 0
+    filtered = state.click_filter.to_dict()
+
+    text = REQUEST_METRICS.to_text() + publish_metrics(stats)\
+        + format_metric(
+            "redirect_spool_pending", "gauge",
+            "Clicks in the spool not yet published.",
+            [("", {}, spool_pending)]
+        ) + format_metric(
+            "redirect_clicks_filtered_total", "counter",
+            "Clicks redirected without being published.",
+            [
+                ("", {"reason": "duplicate"}, filtered["DUPLICATES"]),
+                ("", {"reason": "rate_limited"}, filtered["RATE_LIMITED"]),
+            ]
+        ) + state.event_loop_monitor.to_text()
+    if state.aggregator is not None:
+        text += format_metric(
+            "redirect_aggregated_clicks_total", "counter",
+            "Clicks published as counts.",
+            [("", {}, state.aggregator.clicks)]
+        )
+    return Response(content=text, media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -0,0 +1,239 @@
+"""
+Metrics of the redirect app, in the Prometheus text format.
+
+Requests are counted and timed by an ASGI middleware. Observations are
+plain integer increments on the event loop thread, so the redirect path
+takes no locks. Publish counts and latencies come from PublishStats,
+and the event loop lag is measured by a task that sleeps for a fixed
+interval and records how late it wakes up.
+
+Each uvicorn worker has its own metrics, so with several workers each
+scrape returns the metrics of the worker that answered it.
+"""
+import asyncio
+import bisect
+import time
+from collections import Counter
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')\
+        .replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def format_metric(
+        name: str,
+        metric_type: str,
+        help_text: str,
+        samples: list) -> str:
+    """DESCRIPTION:
+    Formats a metric and its samples in the Prometheus text format.
+
+    ARGS:
+    - name (str): Metric name.
+    - metric_type (str): "counter", "gauge", "histogram" or "summary".
+    - help_text (str): Description of the metric.
+    - samples (list): (suffix, labels, value) tuples, the suffix is
+    added to the name, like "_bucket" for histograms.
+
+    RETURNS:
+    text (str)
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines += [
+        f"{name}{suffix}{format_labels(labels)} {format_value(value)}"
+        for suffix, labels, value in samples
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum. Not thread
+    safe, observed from the event loop only."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, labels: dict = None) -> list:
+        """Cumulative bucket counts, sum and count of the histogram."""
+        labels = labels or {}
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append(
+                ("_bucket", {**labels, "le": format_value(bound)}, cumulative))
+        samples.append(("_sum", labels, self.sum))
+        samples.append(("_count", labels, self.count))
+        return samples
+
+
+class RequestMetrics:
+    """Request counts by path and status, and the request latency."""
+
+    def __init__(self, paths: set):
+        """
+        ARGS:
+        - paths (set): Paths counted by name. Other paths are counted
+        as "other", so random paths do not add labels without bound.
+        """
+        self.paths = set(paths)
+        self.requests = Counter()
+        self.latency = Histogram()
+
+    def observe(self, path: str, status: int, latency: float) -> None:
+        path = path if path in self.paths else "other"
+        self.requests[(path, status)] += 1
+        self.latency.observe(latency)
+
+    def to_text(self) -> str:
+        return format_metric(
+            "redirect_requests_total", "counter",
+            "Requests by path and status code.",
+            [
+                ("", {"path": path, "status": status}, count)
+                for (path, status), count in sorted(self.requests.items())
+            ]
+        ) + format_metric(
+            "redirect_request_seconds", "histogram",
+            "Request latency in seconds.",
+            self.latency.samples()
+        )
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording the status and latency of each HTTP
+    request. Plain ASGI, so it adds no task per request."""
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router adds the matched route, labelled by its path
+            # template, like "/s/{code}".
+            route = scope.get("route")
+            path = getattr(route, "path", scope["path"])
+            self.metrics.observe(path, status, time.perf_counter() - start)
+
+
+class EventLoopMonitor:
+    """Measures how late the event loop runs a task that sleeps for a
+    fixed interval. A lag means requests wait on blocking work."""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.lag = 0.0
+        self.histogram = Histogram()
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.histogram.observe(self.lag)
+
+    def start(self) -> None:
+        """Starts measuring, must be called from the event loop."""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def to_text(self) -> str:
+        return format_metric(
+            "redirect_event_loop_last_lag_seconds", "gauge",
+            "Lag of the event loop at the last measurement.",
+            [("", {}, self.lag)]
+        ) + format_metric(
+            "redirect_event_loop_lag_seconds", "histogram",
+            "Lag of the event loop in seconds.",
+            self.histogram.samples()
+        )
+
+
+def publish_metrics(stats_by_source: dict) -> str:
+    """DESCRIPTION:
+    Formats the publish counts, the publishes in flight and the publish
+    latency of PublishStats.
+
+    ARGS:
+    - stats_by_source (dict): PublishStats by source, like "publisher"
+    or "drainer".
+
+    RETURNS:
+    text (str)
+    """
+    counts, in_flight, latencies = [], [], []
+    for source, stats in stats_by_source.items():
+        for result, count in (
+                ("published", stats.published),
+                ("failed", stats.failed),
+                ("dropped", stats.dropped)):
+            counts.append(("", {"source": source, "result": result}, count))
+        in_flight.append(("", {"source": source}, stats.in_flight))
+        for quantile in (0.5, 0.95, 0.99):
+            latencies.append((
+                "",
+                {"source": source, "quantile": quantile},
+                stats.latency_percentile(quantile * 100)
+            ))
+        latencies.append(("_count", {"source": source}, stats.published))
+
+    return format_metric(
+        "redirect_publish_total", "counter",
+        "Publishes by source and result.", counts
+    ) + format_metric(
+        "redirect_publish_in_flight", "gauge",
+        "Messages handed to the publisher and not yet published or failed.",
+        in_flight
+    ) + format_metric(
+        "redirect_publish_seconds", "summary",
+        "Publish latency of the recent publishes in seconds.", latencies
+    )
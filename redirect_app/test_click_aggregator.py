@@ -0,0 +1,74 @@
+"""
+Tests for counting clicks in memory and publishing the counts.
+"""
+from click_aggregator import ClickAggregator
+from click_aggregator import COUNTS_FORMAT
+from click_aggregator import decode_counts
+
+
+class RecordSink:
+    """Keeps the records handed to it, like a publisher."""
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, data: bytes, **attributes) -> None:
+        self.records.append((data, attributes))
+
+
+def test_click_aggregator() -> None:
+    """DESCRIPTION:
+    Tests that clicks are counted per ID into one record per window, 
+    and that large windows are split into several records.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    sink = RecordSink()
+    times = iter([100.0, 101.0, 102.0])
+    aggregator = ClickAggregator(sink, clock=lambda: next(times),
+                                 max_ids_per_record=2)
+    for _ in range(500):
+        aggregator.add("id-a")
+    aggregator.add("id-b")
+
+    message = "Clicks of a window should be flushed as one record."
+    assert aggregator.flush() == 501, message
+    assert len(sink.records) == 1, message
+    data, attributes = sink.records[0]
+    assert attributes == {"FORMAT": COUNTS_FORMAT}, message
+    assert decode_counts(data) == {
+        "WINDOW_START": 100.0,
+        "WINDOW_END": 101.0,
+        "COUNTS": {"id-a": 500, "id-b": 1},
+    }, message
+
+    for inference_id in ("id-a", "id-b", "id-c"):
+        aggregator.add(inference_id)
+    aggregator.flush()
+    message = "Windows with many IDs should be split into records."
+    assert len(sink.records) == 3, message
+    counts = {}
+    for data, _ in sink.records[1:]:
+        counts.update(decode_counts(data)["COUNTS"])
+    assert counts == {"id-a": 1, "id-b": 1, "id-c": 1}, message
+
+
+def test_click_aggregator_stop() -> None:
+    """DESCRIPTION:
+    Tests that stopping the aggregator flushes the last window.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    sink = RecordSink()
+    aggregator = ClickAggregator(sink, window_seconds=60)
+    aggregator.start()
+    aggregator.add("id-a")
+    aggregator.stop()
+
+    message = "The last window should be flushed on stop."
+    assert aggregator.clicks == 1 and len(sink.records) == 1, message
+    assert aggregator.flush() == 0, "Nothing should be left to flush."
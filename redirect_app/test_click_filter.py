@@ -0,0 +1,105 @@
+"""
+Tests for suppressing duplicate and rate limited clicks.
+"""
+from click_filter import ClickDeduplicator
+from click_filter import ClickFilter
+from click_filter import RateLimiter
+
+
+class Clock:
+    """Clock moved forward by the tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_click_deduplicator() -> None:
+    """DESCRIPTION:
+    Tests that repeated clicks within the window are suppressed, and 
+    that memory stays bounded.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    clock = Clock()
+    deduplicator = ClickDeduplicator(
+        window_seconds=10, max_entries=3, clock=clock)
+
+    message = "Only the first click in the window should be kept."
+    assert not deduplicator.is_duplicate("client", "id-a"), message
+    assert deduplicator.is_duplicate("client", "id-a"), message
+    assert not deduplicator.is_duplicate("client", "id-b"), message
+    assert not deduplicator.is_duplicate("other", "id-a"), message
+    assert deduplicator.suppressed == 1, message
+
+    clock.now = 10
+    message = "Clicks after the window should be kept again."
+    assert not deduplicator.is_duplicate("client", "id-a"), message
+    assert len(deduplicator) == 1, "Expired clicks should be dropped."
+
+    for i in range(10):
+        deduplicator.is_duplicate("client", f"id-{i}")
+    message = "The oldest clicks should be dropped when full."
+    assert len(deduplicator) == 3 and deduplicator.evicted > 0, message
+
+
+def test_rate_limiter() -> None:
+    """DESCRIPTION:
+    Tests that a client is limited after its burst, that tokens are 
+    refilled at the rate, and that buckets are bounded.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    clock = Clock()
+    limiter = RateLimiter(rate=1, burst=3, max_clients=2, clock=clock)
+
+    message = "Clicks past the burst should be limited."
+    assert [limiter.allow("client") for _ in range(4)] ==\
+        [True, True, True, False], message
+    assert limiter.limited == 1, message
+
+    clock.now = 1.5
+    message = "Tokens should be refilled at the rate."
+    assert limiter.allow("client"), message
+    assert not limiter.allow("client"), message
+
+    limiter.allow("other")
+    limiter.allow("third")
+    message = "The least recently used bucket should be dropped."
+    assert len(limiter) == 2, message
+    assert limiter.allow("client"), message
+
+
+def test_click_filter() -> None:
+    """DESCRIPTION:
+    Tests that duplicates do not use up the client's tokens, and that 
+    IPs are not stored.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    clock = Clock()
+    click_filter = ClickFilter(
+        ClickDeduplicator(clock=clock),
+        RateLimiter(rate=0, burst=2, clock=clock),
+    )
+
+    results = [
+        click_filter.should_publish("10.0.0.1", source)
+        for source in ("id-a", "id-a", "id-a", "id-b", "id-c")
+    ]
+    message = "Duplicates should be suppressed before the rate limit."
+    assert results == [True, False, False, True, False], message
+    assert click_filter.to_dict() ==\
+        {"DUPLICATES": 2, "RATE_LIMITED": 1}, message
+
+    message = "Clients should be keyed by a hash of their IP."
+    assert all("10.0.0.1" not in client
+               for client, _ in click_filter.deduplicator._seen), message
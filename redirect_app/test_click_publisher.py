@@ -0,0 +1,60 @@
+"""
+Tests for publishing clicks without blocking, using a LocalPublisher
+stand-in for Pub/Sub.
+"""
+import time
+from click_publisher import ClickPublisher
+from click_publisher import LocalPublisher
+
+
+class FullPublisher:
+    """Publisher whose flow control limits are always hit."""
+
+    def publish(self, topic: str, data: bytes, **attributes):
+        raise RuntimeError("Flow control limit exceeded.")
+
+
+def test_click_publisher() -> None:
+    """DESCRIPTION:
+    Tests that publish returns before the message is sent, and that
+    published and failed messages are counted by the callbacks.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    publisher = LocalPublisher(latency=0.05)
+    clicks = ClickPublisher(publisher, "projects/test/topics/clicks")
+
+    start = time.perf_counter()
+    for _ in range(4):
+        assert clicks.publish(b'{"INFERENCE_ID": "id"}')
+    message = "Publish should not wait for the message to be sent."
+    assert time.perf_counter() - start < 0.05, message
+
+    publisher.stop()
+    message = "Published messages should be counted."
+    assert clicks.stats.published == 4, message
+    assert clicks.stats.latency_percentile(99) >= 0.05, message
+
+    failing = LocalPublisher(failure_rate=1.0)
+    clicks = ClickPublisher(failing, "projects/test/topics/clicks")
+    clicks.publish(b"{}")
+    failing.stop()
+    message = "Failed publishes should be counted."
+    assert clicks.stats.failed == 1 and clicks.stats.published == 0, message
+
+
+def test_click_publisher_dropped() -> None:
+    """DESCRIPTION:
+    Tests that clicks over the flow control limits are dropped and
+    counted, instead of raising in the route.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    clicks = ClickPublisher(FullPublisher(), "projects/test/topics/clicks")
+    message = "Clicks over the flow control limits should be dropped."
+    assert not clicks.publish(b"{}"), message
+    assert clicks.stats.dropped == 1, message
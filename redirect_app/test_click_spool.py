@@ -0,0 +1,156 @@
+"""
+Tests for the durable click spool and its drainer, using a 
+LocalPublisher stand-in for Pub/Sub.
+"""
+import os
+import tempfile
+import time
+from click_publisher import LocalPublisher
+from click_spool import ClickSpool
+from click_spool import SpoolDrainer
+
+TOPIC_PATH = "projects/test/topics/clicks"
+
+
+def test_click_spool() -> None:
+    """DESCRIPTION:
+    Tests that clicks are durable once appended, and that the drainer
+    resumes from the checkpoint after the spool is reopened.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "clicks.sqlite3")
+        spool = ClickSpool(path)
+        futures = [spool.append(f"click {i}".encode("utf-8")) for i in range(5)]
+        ids = [future.result(timeout=5) for future in futures]
+
+        message = "Clicks should be committed in order."
+        assert ids == sorted(ids) and len(set(ids)) == 5, message
+
+        publisher = LocalPublisher()
+        drainer = SpoolDrainer(spool, publisher, TOPIC_PATH, batch_size=3)
+        assert drainer.drain_once(), "First batch should be published."
+        publisher.stop()
+        spool.close()
+
+        # Reopening resumes after the 3 clicks already published.
+        spool = ClickSpool(path)
+        message = "Only unpublished clicks should be left after reopening."
+        assert spool.last_checkpoint() == ids[2], message
+        assert spool.pending() == 2, message
+        assert [data for _, data, _ in spool.read_batch(10)] ==\
+            [b"click 3", b"click 4"], message
+        spool.close()
+
+
+def test_spool_drainer_retries() -> None:
+    """DESCRIPTION:
+    Tests that clicks spooled while Pub/Sub is failing are published
+    once it recovers, without losing any.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        spool = ClickSpool(os.path.join(temp_dir, "clicks.sqlite3"))
+        publisher = LocalPublisher(failure_rate=1.0)
+        drainer = SpoolDrainer(spool, publisher, TOPIC_PATH,
+                               retry_seconds=0.01, max_retry_seconds=0.02)
+        drainer.start()
+
+        for i in range(20):
+            spool.append(f"click {i}".encode("utf-8")).result(timeout=5)
+        time.sleep(0.1)
+        message = "Clicks should stay in the spool while Pub/Sub fails."
+        assert spool.pending() == 20 and drainer.stats.failed > 0, message
+
+        publisher.failure_rate = 0.0
+        deadline = time.time() + 5
+        while spool.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        drainer.stop()
+        publisher.stop()
+
+        message = "Every click should be published once Pub/Sub recovers."
+        assert spool.pending() == 0, message
+        published = sorted(data for data, _ in publisher.messages)
+        expected = sorted(f"click {i}".encode("utf-8") for i in range(20))
+        assert published == expected, message
+        spool.close()
+
+
+def test_spool_drainer_lock() -> None:
+    """DESCRIPTION:
+    Tests that drainers sharing a spool and a lock file, like the 
+    drainers of several workers, publish each click once.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "clicks.sqlite3")
+        spool = ClickSpool(path)
+        publisher = LocalPublisher()
+        drainers = [
+            SpoolDrainer(spool, publisher, TOPIC_PATH, batch_size=5,
+                         lock_path=path + ".lock")
+            for _ in range(2)
+        ]
+        for drainer in drainers:
+            drainer.start()
+
+        for i in range(50):
+            spool.append(f"click {i}".encode("utf-8")).result(timeout=5)
+        deadline = time.time() + 5
+        while spool.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        for drainer in drainers:
+            drainer.stop()
+        publisher.stop()
+
+        message = "Only the drainer holding the lock should publish."
+        assert [drainer.stats.published > 0 for drainer in drainers]\
+            .count(True) == 1, message
+        assert len(publisher.messages) == 50, message
+        spool.close()
+
+
+def test_spool_drainer_flush() -> None:
+    """DESCRIPTION:
+    Tests that flushing publishes the spooled clicks, and stops at the
+    deadline when Pub/Sub is too slow, even during a drain.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        spool = ClickSpool(os.path.join(temp_dir, "clicks.sqlite3"))
+        for i in range(10):
+            spool.append(f"click {i}".encode("utf-8")).result(timeout=5)
+
+        publisher = LocalPublisher()
+        drainer = SpoolDrainer(spool, publisher, TOPIC_PATH, batch_size=3)
+        message = "Flushing should publish every spooled click."
+        assert drainer.flush(timeout=5) == 0, message
+        assert len(publisher.messages) == 10, message
+        publisher.stop()
+
+        for i in range(10):
+            spool.append(f"click {i}".encode("utf-8")).result(timeout=5)
+        slow_publisher = LocalPublisher(latency=0.3)
+        drainer = SpoolDrainer(spool, slow_publisher, TOPIC_PATH)
+        # The flush cuts short the batch the drainer is waiting on.
+        drainer.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        message = "Flushing should stop at the deadline, keeping the clicks."
+        assert drainer.flush(timeout=0.1) == 10, message
+        assert time.monotonic() - start < 0.5, message
+        slow_publisher.stop()
+        spool.close()
@@ -0,0 +1,61 @@
+"""
+Tests for the in memory map of short link codes.
+"""
+import json
+import os
+import tempfile
+from code_map import CodeMap
+
+
+def write_code_map(path: str, codes: dict) -> None:
+    with open(path, "w") as file:
+        json.dump({
+            code: {"INFERENCE_ID": inference_id, "TARGET_URL": target_url}
+            for code, (inference_id, target_url) in codes.items()
+        }, file)
+
+
+def test_code_map() -> None:
+    """DESCRIPTION:
+    Tests resolving codes, reloading a changed map, and keeping the 
+    previous map when the new one is invalid.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "code_map.json")
+        code_map = CodeMap(path)
+        message = "A missing map should resolve nothing."
+        assert not code_map.reload() and code_map.resolve("abc") is None,\
+            message
+        assert not code_map.loaded, "A missing map is not loaded."
+
+        write_code_map(path, {"abc": ("id-a", "https://example.com/a")})
+        assert code_map.reload() and code_map.loaded,\
+            "A new map should be loaded."
+        message = "Codes should resolve to their ID and target URL."
+        assert code_map.resolve("abc") == ("id-a", "https://example.com/a"),\
+            message
+        assert code_map.resolve("xyz") is None, message
+        message = "Only the IDs in the map should be known videos."
+        assert code_map.has_video("id-a") and not code_map.has_video("abc"),\
+            message
+        assert not code_map.reload(), "An unchanged map is not reloaded."
+
+        write_code_map(path, {"xyz": ("id-b", "https://example.com/b")})
+        os.utime(path, ns=(0, 1))
+        message = "A changed map should replace the old one."
+        assert code_map.reload(), message
+        assert code_map.resolve("abc") is None, message
+        assert code_map.resolve("xyz") == ("id-b", "https://example.com/b"),\
+            message
+        assert not code_map.has_video("id-a"), message
+
+        with open(path, "w") as file:
+            file.write("{not json")
+        os.utime(path, ns=(0, 2))
+        message = "An invalid map should keep the previous one."
+        assert not code_map.reload(), message
+        assert len(code_map) == 1 and code_map.reloads == 2, message
@@ -0,0 +1,93 @@
+"""
+Tests for the load generator, against small apps served in process, and
+the redirect app served by uvicorn.
+"""
+import asyncio
+import httpx
+from fastapi import FastAPI
+from starlette.responses import RedirectResponse
+from starlette.responses import Response
+from load_generator import RedirectServer
+from load_generator import load_test
+from load_generator import percentile
+from load_generator import run_load
+
+
+def create_app(status_code: int = 307) -> FastAPI:
+    """App with a redirect route answering with the status code."""
+    app = FastAPI()
+    app.state.sources = []
+
+    @app.get("/redirect")
+    async def redirect(source: str):
+        app.state.sources.append(source)
+        if status_code == 307:
+            return RedirectResponse(url="https://example.com")
+        return Response(status_code=status_code)
+
+    return app
+
+
+def run(app: FastAPI, **load):
+    async def load_test():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+                transport=transport, base_url="http://test") as client:
+            return await run_load(client, **load)
+    return asyncio.run(load_test())
+
+
+def test_run_load() -> None:
+    """DESCRIPTION:
+    Tests the closed and open loops, and that failed redirects are 
+    counted as errors.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    app = create_app()
+    result = run(app, duration=0.2, concurrency=4, num_ids=3)
+    report = result.to_dict()
+    message = "The closed loop should send requests for the duration."
+    assert report["REQUESTS"] > 0 and report["ERRORS"] == 0, message
+    assert report["THROUGHPUT"] > 0, message
+    assert set(app.state.sources) ==\
+        {"load-test-0", "load-test-1", "load-test-2"}, message
+
+    result = run(create_app(), duration=0.2, rate=50)
+    message = "The open loop should send rate * duration requests."
+    assert result.to_dict()["REQUESTS"] == 10, message
+
+    result = run(create_app(status_code=500), duration=0.1, rate=50)
+    message = "Responses other than redirects should be errors."
+    assert result.errors == 5, message
+
+    message = "Percentiles should index into the sorted values."
+    assert percentile([3, 1, 2], 50) == 2, message
+    assert percentile([], 99) is None, message
+
+
+def test_redirect_server() -> None:
+    """DESCRIPTION:
+    Tests that every click redirected by the app under uvicorn is 
+    published or left in the spool, in raw and aggregate mode.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    for click_mode in ("raw", "aggregate"):
+        server = RedirectServer(port=8766, click_mode=click_mode, num_ids=5)
+        server.start()
+        try:
+            result = asyncio.run(load_test(
+                server.url, duration=0.5, concurrency=4, num_ids=5))
+        finally:
+            stats = server.stop()
+        redirects = len(result.latencies) - result.errors
+        message = f"Clicks redirected in {click_mode} mode should be "\
+            f"published, got {stats}."
+        assert redirects > 0, message
+        assert stats["CLICKS_PUBLISHED"] + stats["SPOOL_PENDING"] ==\
+            redirects, message
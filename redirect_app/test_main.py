@@ -0,0 +1,190 @@
+"""
+Tests for the routes of the redirect app, served in process with a
+local stand-in for Pub/Sub.
+"""
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+from fastapi.testclient import TestClient
+from click_aggregator import COUNTS_FORMAT
+from click_aggregator import decode_counts
+from click_spool import ClickSpool
+
+APP_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def load_module(name: str, filename: str):
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(APP_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def import_main(temp_dir: str, **environ):
+    """DESCRIPTION:
+    Imports main.py with the environment variables set, keeping the
+    spool and code map in the temp dir. When the tests run together,
+    the pipeline's configs module is already imported as configs, so
+    the app's configs are swapped in while main.py imports.
+
+    ARGS:
+    - temp_dir (str): Directory of the spool and code map.
+    - environ: Environment variables read by the configs.
+
+    RETURNS:
+    main (module)
+    """
+    environ = {"PUBLISHER_STANDIN": "1", **environ}
+    saved_environ = {name: os.environ.get(name) for name in environ}
+    saved_configs = sys.modules.get("configs")
+    os.environ.update(environ)
+    try:
+        sys.modules["configs"] = load_module("configs", "configs.py")
+        main = load_module("redirect_app_main", "main.py")
+    finally:
+        for name, value in saved_environ.items():
+            if value is None:
+                os.environ.pop(name)
+            else:
+                os.environ[name] = value
+        if saved_configs is None:
+            sys.modules.pop("configs")
+        else:
+            sys.modules["configs"] = saved_configs
+    main.SPOOL_PATH = os.path.join(temp_dir, "spool", "clicks.sqlite3")
+    main.CODE_MAP_PATH = os.path.join(temp_dir, "code_map.json")
+    with open(main.CODE_MAP_PATH, "w") as file:
+        json.dump({
+            "code-a": {
+                "INFERENCE_ID": "id-a",
+                "TARGET_URL": "https://example.com/a"
+            },
+        }, file)
+    return main
+
+
+def published_sources(main) -> list:
+    """INFERENCE_IDs of the raw clicks published by the app."""
+    return [
+        json.loads(data)["INFERENCE_ID"]
+        for data, _ in main.app.state.publisher.messages
+    ]
+
+
+def test_clients_behind_proxy() -> None:
+    """DESCRIPTION:
+    Tests that clicks coming through a trusted proxy are filtered per
+    client in X-Forwarded-For, not per proxy.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # TestClient connects from the "testclient" host.
+        main = import_main(temp_dir, FORWARDED_ALLOW_IPS="testclient")
+        with TestClient(main.app, follow_redirects=False) as client:
+            for address in ("10.0.0.1", "10.0.0.2", "10.0.0.1"):
+                response = client.get(
+                    "/s/code-a", headers={"X-Forwarded-For": address})
+                assert response.status_code == 307, "Clicks are redirected."
+        message = "Each client behind the proxy should be published once."
+        assert published_sources(main) == ["id-a", "id-a"], message
+        assert main.app.state.click_filter.to_dict()["DUPLICATES"] == 1,\
+            message
+
+
+def test_redirect_routes() -> None:
+    """DESCRIPTION:
+    Tests that short links of known codes are redirected to their
+    target and recorded, that unknown codes are rejected, and that old
+    links are only recorded for videos in the code map.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main = import_main(
+            temp_dir, DEDUPE_ENABLED="0", RATE_LIMIT_ENABLED="0")
+        with TestClient(main.app, follow_redirects=False) as client:
+            response = client.get("/s/code-a")
+            message = "A known code should redirect to its target."
+            assert response.status_code == 307, message
+            assert response.headers["Location"] == "https://example.com/a",\
+                message
+            message = "An unknown code should be rejected."
+            assert client.get("/s/code-z").status_code == 404, message
+
+            message = "Old links should always redirect."
+            for source in ("id-a", "made-up"):
+                response = client.get("/redirect", params={"source": source})
+                assert response.status_code == 307, message
+                assert response.headers["Location"] ==\
+                    main.URL_TO_REDIRECT_TO, message
+        message = "Only clicks of videos in the code map should be published."
+        assert published_sources(main) == ["id-a", "id-a"], message
+
+
+def test_redirect_without_code_map() -> None:
+    """DESCRIPTION:
+    Tests that old links are recorded while no code map is loaded.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main = import_main(
+            temp_dir, DEDUPE_ENABLED="0", RATE_LIMIT_ENABLED="0")
+        os.remove(main.CODE_MAP_PATH)
+        with TestClient(main.app, follow_redirects=False) as client:
+            response = client.get("/redirect", params={"source": "id-old"})
+            assert response.status_code == 307, "Old links should redirect."
+        message = "Clicks should be published until a code map is loaded."
+        assert published_sources(main) == ["id-old"], message
+
+
+def test_clicks_flushed_on_shutdown() -> None:
+    """DESCRIPTION:
+    Tests that leaving the lifespan publishes the clicks still in the
+    spool, and in aggregate mode the counts of the open window.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    for click_mode in ("raw", "aggregate"):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            main = import_main(
+                temp_dir, DEDUPE_ENABLED="0", RATE_LIMIT_ENABLED="0")
+            main.CLICK_MODE = click_mode
+            # The window does not end while the app runs.
+            main.AGGREGATION_WINDOW_SECONDS = 3600
+            with TestClient(main.app, follow_redirects=False) as client:
+                for _ in range(3):
+                    client.get("/s/code-a")
+                if click_mode == "aggregate":
+                    message = "Counts of an open window should not be sent."
+                    assert not main.app.state.publisher.messages, message
+
+            messages = main.app.state.publisher.messages
+            if click_mode == "raw":
+                message = "Spooled clicks should be published on shutdown."
+                assert published_sources(main) == ["id-a"] * 3, message
+            else:
+                message = "Click counts should be published on shutdown."
+                assert all(
+                    attributes["FORMAT"] == COUNTS_FORMAT
+                    for _, attributes in messages), message
+                assert sum(
+                    decode_counts(data)["COUNTS"]["id-a"]
+                    for data, _ in messages) == 3, message
+
+            spool = ClickSpool(main.SPOOL_PATH)
+            message = "No clicks should be left in the spool."
+            assert spool.pending() == 0, message
+            spool.close()
@@ -0,0 +1,101 @@
+"""
+Tests for the metrics of the redirect app, in the Prometheus text 
+format.
+"""
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI
+from starlette.responses import RedirectResponse
+from click_publisher import PublishStats
+from metrics import EventLoopMonitor
+from metrics import Histogram
+from metrics import RequestMetrics
+from metrics import RequestMetricsMiddleware
+from metrics import publish_metrics
+
+
+def test_request_metrics() -> None:
+    """DESCRIPTION:
+    Tests that the middleware counts requests by path and status, and 
+    that unknown paths share one label.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    app = FastAPI()
+    metrics = RequestMetrics({"/redirect"})
+    app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
+
+    @app.get("/redirect")
+    async def redirect():
+        return RedirectResponse(url="https://example.com")
+
+    async def send_requests():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+                transport=transport, base_url="http://test") as client:
+            for _ in range(3):
+                await client.get("/redirect")
+            await client.get("/random-path")
+    asyncio.run(send_requests())
+
+    text = metrics.to_text()
+    message = "Requests should be counted by path and status."
+    assert 'redirect_requests_total{path="/redirect",status="307"} 3'\
+        in text, message
+    assert 'redirect_requests_total{path="other",status="404"} 1'\
+        in text, message
+    assert 'redirect_request_seconds_bucket{le="+Inf"} 4' in text, message
+    assert "redirect_request_seconds_count 4" in text, message
+
+
+def test_histogram() -> None:
+    """DESCRIPTION:
+    Tests that histogram buckets are cumulative.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    message = "Buckets should count the values at or below the bound."
+    assert [value for suffix, _, value in histogram.samples()
+            if suffix == "_bucket"] == [2, 3, 4], message
+    assert histogram.sum == 2.65 and histogram.count == 4, message
+
+
+def test_publish_and_event_loop_metrics() -> None:
+    """DESCRIPTION:
+    Tests the publish metrics, and that a blocked event loop shows a 
+    lag.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    stats = PublishStats()
+    stats.accepted = 5
+    stats.record_published(0.01)
+    stats.record_failed()
+    text = publish_metrics({"publisher": stats})
+    message = "Publish results and in flight messages should be shown."
+    assert 'redirect_publish_total{source="publisher",result="failed"} 1'\
+        in text, message
+    assert 'redirect_publish_in_flight{source="publisher"} 3' in text, message
+
+    async def block_loop():
+        monitor = EventLoopMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        monitor.stop()
+        return monitor
+    monitor = asyncio.run(block_loop())
+    message = "Blocking the event loop should show as lag."
+    assert monitor.histogram.sum >= 0.05, message
@@ -0,0 +1,439 @@
+"""Finds UI elements on the screen for the GUI uploader.
+
+pyautogui.locateOnScreen grabs a new screenshot for every element
+looked for, and matches the template across the whole screen at full
+resolution. ScreenMatcher grabs one screenshot per poll and matches
+every template waited for against it. Templates are loaded once, as
+grayscale.
+
+Each template remembers where it was last found, and that region is
+searched first, which takes about a millisecond. Otherwise the
+screen and the template are both downscaled, and the best candidates of
+the downscaled match are checked at full resolution in a small window
+around each. A match must reach the confidence at full resolution, so
+the confidence never needs lowering to find an element.
+
+SessionRecorder saves the screenshots of a real upload session, the
+templates, and the elements that were clicked, so changes to the
+matcher can be benchmarked offline, see
+helpers/template_matching_benchmark.py.
+
+Typical usage example:
+
+    matcher = ScreenMatcher(recorder=SessionRecorder("sessions/today"))
+    found = matcher.find_all([NEXT_BUTTON, PUBLISH_BUTTON], confidence=0.9)
+    match = found.get(NEXT_BUTTON)
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from typing import Callable
+import cv2
+import numpy as np
+
+# Same fields as the boxes pyautogui returns, in screenshot pixels.
+Match = namedtuple("Match", ["left", "top", "width", "height", "score"])
+
+# Templates are not downscaled below this size, small templates have
+# too few pixels left to match.
+MIN_TEMPLATE_SIZE = 12
+# Downscaled scores are lower than full resolution scores, candidates
+# this far below the confidence are still checked.
+COARSE_SLACK = 0.2
+COARSE_CANDIDATES = 3
+
+SESSION_EVENTS = "events.jsonl"
+
+
+def grab_screen():
+    """Screenshot of the screen, pyautogui is imported here as it needs
+    a display."""
+    import pyautogui
+    return pyautogui.screenshot()
+
+
+def to_gray(image) -> np.ndarray:
+    """Grayscale uint8 array of a PIL image or an RGB(A) array."""
+    array = np.asarray(image)
+    if array.ndim == 2:
+        return np.ascontiguousarray(array, dtype=np.uint8)
+    code = cv2.COLOR_RGBA2GRAY if array.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(array.astype(np.uint8, copy=False), code)
+
+
+def downscale(image: np.ndarray, factor: int) -> np.ndarray:
+    if factor == 1:
+        return image
+    height, width = image.shape
+    return cv2.resize(
+        image,
+        (max(1, width // factor), max(1, height // factor)),
+        interpolation=cv2.INTER_AREA
+    )
+
+
+def match_scores(image: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """Normalized correlation of the template at each position. Flat
+    areas give NaN, which count as no match."""
+    scores = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    return np.nan_to_num(scores, nan=-1.0, posinf=-1.0, neginf=-1.0)
+
+
+class Screen:
+    """Grayscale screenshot, with its downscaled copies made once and
+    shared by every template matched against it."""
+
+    def __init__(self, image):
+        self.gray = to_gray(image)
+        self._scaled = {1: self.gray}
+
+    def scaled(self, factor: int) -> np.ndarray:
+        if factor not in self._scaled:
+            self._scaled[factor] = downscale(self.gray, factor)
+        return self._scaled[factor]
+
+
+class SessionRecorder:
+    """Saves the screenshots, templates and clicks of a session.
+
+    Events are appended to events.jsonl as they happen, so a session
+    that crashes part way is still readable. Screenshots are saved as
+    grayscale PNGs, which is what the matcher uses, and a screenshot
+    identical to the one before it is not saved again.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "frames"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "templates"), exist_ok=True)
+        self.frame = None
+        self._last_digest = None
+        self._templates = {}
+        self._events = open(
+            os.path.join(directory, SESSION_EVENTS), "a", buffering=1)
+
+    def _write(self, event: dict) -> None:
+        self._events.write(json.dumps(event) + "\n")
+
+    def record_frame(self, screen: Screen) -> int:
+        """Saves a screenshot, returns its frame number."""
+        digest = hashlib.blake2b(
+            screen.gray.tobytes(), digest_size=16).hexdigest()
+        if digest == self._last_digest:
+            return self.frame
+        self._last_digest = digest
+        self.frame = 0 if self.frame is None else self.frame + 1
+        file_name = os.path.join("frames", f"{self.frame:06d}.png")
+        cv2.imwrite(
+            os.path.join(self.directory, file_name),
+            screen.gray,
+            [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        )
+        self._write({
+            "EVENT": "FRAME",
+            "FRAME": self.frame,
+            "FILE": file_name,
+            "TIME": time.time(),
+        })
+        return self.frame
+
+    def record_template(self, name: str, gray: np.ndarray) -> None:
+        """Saves a template once, under the name the session uses."""
+        if name in self._templates:
+            return
+        file_name = os.path.join("templates", f"{len(self._templates)}.png")
+        cv2.imwrite(os.path.join(self.directory, file_name), gray)
+        self._templates[name] = file_name
+        self._write({"EVENT": "TEMPLATE", "NAME": name, "FILE": file_name})
+
+    def record_click(self, template: str, match) -> None:
+        """Records the box of a template that was clicked, on the last
+        frame saved."""
+        self._write({
+            "EVENT": "CLICK",
+            "FRAME": self.frame,
+            "TEMPLATE": template,
+            "LEFT": int(match.left),
+            "TOP": int(match.top),
+            "WIDTH": int(match.width),
+            "HEIGHT": int(match.height),
+        })
+
+    def close(self) -> None:
+        self._events.close()
+
+
+def load_session(directory: str) -> dict:
+    """DESCRIPTION:
+    Reads a session saved by SessionRecorder.
+
+    ARGS:
+    - directory (str): Dir of the session.
+
+    RETURNS:
+    session (dict): FRAMES, the path of each frame in order,
+    TEMPLATES, the path of each template by name, and CLICKS, the
+    (template, Match) tuples clicked on each frame by frame number.
+    """
+    session = {"FRAMES": [], "TEMPLATES": {}, "CLICKS": {}}
+    with open(os.path.join(directory, SESSION_EVENTS), "r") as file:
+        for line in file:
+            event = json.loads(line)
+            if event["EVENT"] == "FRAME":
+                session["FRAMES"].append(
+                    (event["FRAME"], os.path.join(directory, event["FILE"])))
+            elif event["EVENT"] == "TEMPLATE":
+                session["TEMPLATES"][event["NAME"]] =\
+                    os.path.join(directory, event["FILE"])
+            elif event["EVENT"] == "CLICK":
+                box = Match(
+                    event["LEFT"], event["TOP"],
+                    event["WIDTH"], event["HEIGHT"], None)
+                session["CLICKS"].setdefault(event["FRAME"], []).append(
+                    (event["TEMPLATE"], box))
+    return session
+
+
+class ScreenMatcher:
+    """Matches preloaded templates against one screenshot per poll."""
+
+    def __init__(
+            self,
+            grab: Callable = grab_screen,
+            scale_factor: int = 4,
+            margin: int = 32,
+            recorder: SessionRecorder = None):
+        """
+        ARGS:
+        - grab (Callable): Returns a screenshot.
+        - scale_factor (int): How much the screen is downscaled for the
+        full screen search.
+        - margin (int): Pixels around the last known region searched.
+        - recorder (SessionRecorder): Saves the screenshots grabbed and
+        the templates loaded, when given.
+        """
+        self.grab = grab
+        self.recorder = recorder
+        self.scale_factor = scale_factor
+        self.margin = margin
+        self.region_hits = 0
+        self.full_searches = 0
+        self._templates = {}
+        self._last_found = {}
+
+    def add_template(self, name: str, image) -> None:
+        """Adds a template from an image, instead of a file."""
+        gray = to_gray(image)
+        factor = self.scale_factor
+        while factor > 1 and min(gray.shape) // factor < MIN_TEMPLATE_SIZE:
+            factor //= 2
+        self._templates[name] = (gray, factor, downscale(gray, factor))
+        if self.recorder is not None:
+            self.recorder.record_template(name, gray)
+
+    def load(self, path: str) -> None:
+        """Loads a template file as grayscale, once."""
+        if path in self._templates:
+            return
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise FileNotFoundError(f"No template image at {path}.")
+        self.add_template(path, image)
+
+    def screenshot(self) -> Screen:
+        screen = Screen(self.grab())
+        if self.recorder is not None:
+            self.recorder.record_frame(screen)
+        return screen
+
+    def _match_window(
+            self,
+            screen: Screen,
+            template: np.ndarray,
+            left: int,
+            top: int,
+            right: int,
+            bottom: int) -> tuple:
+        """Best (score, left, top) of the template within a window of
+        the full resolution screen."""
+        height, width = template.shape
+        screen_height, screen_width = screen.gray.shape
+        left, top = max(0, left), max(0, top)
+        right = min(screen_width, max(right, left + width))
+        bottom = min(screen_height, max(bottom, top + height))
+        if right - left < width or bottom - top < height:
+            return -1.0, left, top
+        scores = match_scores(screen.gray[top:bottom, left:right], template)
+        _, score, _, (x, y) = cv2.minMaxLoc(scores)
+        return score, left + x, top + y
+
+    def _search_region(
+            self,
+            screen: Screen,
+            template: np.ndarray,
+            last: tuple) -> tuple:
+        left, top = last
+        height, width = template.shape
+        return self._match_window(
+            screen, template,
+            left - self.margin, top - self.margin,
+            left + width + self.margin, top + height + self.margin
+        )
+
+    def _search_screen(
+            self,
+            screen: Screen,
+            template: np.ndarray,
+            factor: int,
+            small_template: np.ndarray,
+            confidence: float) -> tuple:
+        """Matches the downscaled template against the downscaled
+        screen, and checks the best candidates at full resolution."""
+        small_screen = screen.scaled(factor)
+        if small_screen.shape[0] < small_template.shape[0]\
+                or small_screen.shape[1] < small_template.shape[1]:
+            return -1.0, 0, 0
+        scores = match_scores(small_screen, small_template)
+        best = (-1.0, 0, 0)
+        for _ in range(COARSE_CANDIDATES):
+            _, coarse_score, _, (x, y) = cv2.minMaxLoc(scores)
+            if coarse_score < confidence - COARSE_SLACK:
+                break
+            left, top = x * factor, y * factor
+            height, width = template.shape
+            match = self._match_window(
+                screen, template,
+                left - 2 * factor, top - 2 * factor,
+                left + width + 2 * factor, top + height + 2 * factor
+            )
+            best = max(best, match)
+            if best[0] >= confidence:
+                break
+            # Masks out the candidate, so the next best is elsewhere.
+            half_height = small_template.shape[0] // 2 + 1
+            half_width = small_template.shape[1] // 2 + 1
+            scores[
+                max(0, y - half_height):y + half_height,
+                max(0, x - half_width):x + half_width
+            ] = -1.0
+        return best
+
+    def find(
+            self,
+            template: str,
+            confidence: float = 0.9,
+            screen: Screen = None) -> Match:
+        """DESCRIPTION:
+        Finds a template on the screen, searching the region it was
+        last found in first.
+
+        ARGS:
+        - template (str): Path or name of the template.
+        - confidence (float): Lowest full resolution score of a match.
+        - screen (Screen): Screenshot to search, grabs one by default.
+
+        RETURNS:
+        match (Match): None if the template is not on the screen.
+        """
+        self.load(template)
+        screen = screen if screen is not None else self.screenshot()
+        gray, factor, small = self._templates[template]
+
+        last = self._last_found.get(template)
+        score = -1.0
+        if last is not None:
+            score, left, top = self._search_region(screen, gray, last)
+            if score >= confidence:
+                self.region_hits += 1
+        if score < confidence:
+            self.full_searches += 1
+            score, left, top = self._search_screen(
+                screen, gray, factor, small, confidence)
+        if score < confidence:
+            return None
+
+        self._last_found[template] = (left, top)
+        height, width = gray.shape
+        return Match(left, top, width, height, score)
+
+    def find_all(
+            self,
+            templates: list,
+            confidence: float = 0.9,
+            screen: Screen = None) -> dict:
+        """Matches several templates against one screenshot. Returns
+        the Match of each template found, by template."""
+        screen = screen if screen is not None else self.screenshot()
+        found = {}
+        for template in templates:
+            match = self.find(template, confidence, screen)
+            if match is not None:
+                found[template] = match
+        return found
+
+    def find_every(
+            self,
+            template: str,
+            confidence: float = 0.9,
+            screen: Screen = None,
+            tolerance: int = 20) -> list:
+        """DESCRIPTION:
+        Finds every place a template is on the screen, like 
+        pyautogui.locateAllOnScreen. Every position of the downscaled
+        match close to the confidence is a candidate, best first, and
+        is checked at full resolution. Candidates and matches within 
+        the tolerance of a better one are dropped, so each element is 
+        matched once.
+
+        ARGS:
+        - template (str): Path or name of the template.
+        - confidence (float): Lowest full resolution score of a match.
+        - screen (Screen): Screenshot to search, grabs one by default.
+        - tolerance (int): Pixels between matches of different 
+        elements.
+
+        RETURNS:
+        matches (list): Match of each element, from the top left.
+        """
+        self.load(template)
+        screen = screen if screen is not None else self.screenshot()
+        gray, factor, small = self._templates[template]
+        small_screen = screen.scaled(factor)
+        if small_screen.shape[0] < small.shape[0]\
+                or small_screen.shape[1] < small.shape[1]:
+            return []
+        self.full_searches += 1
+        scores = match_scores(small_screen, small)
+        ys, xs = np.nonzero(scores >= confidence - COARSE_SLACK)
+        order = np.argsort(-scores[ys, xs], kind="stable")
+
+        height, width = gray.shape
+        checked = []
+        matches = []
+        for y, x in zip(ys[order], xs[order]):
+            left, top = int(x) * factor, int(y) * factor
+            if any(abs(left - other_left) < tolerance
+                   and abs(top - other_top) < tolerance
+                   for other_left, other_top in checked):
+                continue
+            checked.append((left, top))
+            score, left, top = self._match_window(
+                screen, gray,
+                left - 2 * factor, top - 2 * factor,
+                left + width + 2 * factor, top + height + 2 * factor
+            )
+            if score >= confidence:
+                matches.append(Match(left, top, width, height, score))
+
+        # Candidates of one element can refine to nearby positions, the
+        # best match of each element is kept.
+        kept = []
+        for match in sorted(matches, key=lambda match: -match.score):
+            if not any(abs(match.left - other.left) < tolerance
+                       and abs(match.top - other.top) < tolerance
+                       for other in kept):
+                kept.append(match)
+        return sorted(kept, key=lambda match: (match.top, match.left))
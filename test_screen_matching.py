@@ -0,0 +1,126 @@
+"""
+Tests for finding UI elements on screenshots.
+"""
+import os
+import tempfile
+import cv2
+import numpy as np
+from screen_matching import Screen
+from screen_matching import ScreenMatcher
+from screen_matching import SessionRecorder
+from screen_matching import load_session
+
+
+def make_screen(buttons: dict) -> np.ndarray:
+    """RGB screenshot with a labelled button at each (left, top)."""
+    screen = np.full((900, 1440, 3), 30, dtype=np.uint8)
+    for label, (left, top) in buttons.items():
+        cv2.rectangle(
+            screen, (left, top), (left + 160, top + 60), (200, 80, 40), -1)
+        cv2.putText(
+            screen, label, (left + 10, top + 45),
+            cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+    return screen
+
+
+def test_screen_matcher() -> None:
+    """DESCRIPTION:
+    Tests that several templates are found in one screenshot, that the
+    last known region is searched first, that moved elements are found
+    again, and that missing elements are not matched.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    screen = make_screen({"NEXT": (200, 150), "PUBLISH": (1000, 700)})
+    screenshots = []
+
+    def grab():
+        screenshots.append(1)
+        return screen
+
+    matcher = ScreenMatcher(grab=grab)
+    matcher.add_template("NEXT", screen[145:215, 195:365])
+    matcher.add_template("PUBLISH", screen[695:765, 995:1165])
+    matcher.add_template("CLOSE", make_screen({"CLOSE": (0, 0)})[0:70, 0:170])
+
+    found = matcher.find_all(["NEXT", "PUBLISH", "CLOSE"])
+    message = "Every template should be matched against one screenshot."
+    assert len(screenshots) == 1, message
+    message = "Templates on the screen should be found where they are."
+    assert found["NEXT"][:4] == (195, 145, 170, 70), message
+    assert found["PUBLISH"][:2] == (995, 695), message
+    assert "CLOSE" not in found, "Missing templates should not match."
+    assert matcher.full_searches == 3, "The first search is full screen."
+
+    matcher.find("NEXT", screen=Screen(screen))
+    message = "A found template should be searched in its region first."
+    assert matcher.region_hits == 1 and matcher.full_searches == 3, message
+
+    moved = make_screen({"NEXT": (900, 100)})
+    match = matcher.find("NEXT", screen=Screen(moved))
+    message = "A moved template should be found by the full search."
+    assert match is not None and match[:2] == (895, 95), message
+    assert match.score >= 0.9, "Matches should reach the confidence."
+
+
+def test_session_recorder() -> None:
+    """DESCRIPTION:
+    Tests that the screenshots, templates and clicks of a session are
+    saved, skipping repeated screenshots, and read back for replaying.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    screens = [
+        make_screen({"NEXT": (200, 150)}),
+        make_screen({"NEXT": (200, 150)}),
+        make_screen({"NEXT": (600, 400)}),
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        recorder = SessionRecorder(temp_dir)
+        matcher = ScreenMatcher(grab=lambda: screens.pop(0), recorder=recorder)
+        matcher.add_template("NEXT", screens[0][145:215, 195:365])
+        for _ in range(3):
+            match = matcher.find("NEXT")
+            recorder.record_click("NEXT", match)
+        recorder.close()
+
+        session = load_session(temp_dir)
+        message = "A repeated screenshot should not be saved again."
+        assert [frame for frame, _ in session["FRAMES"]] == [0, 1], message
+        message = "Frames should be saved as grayscale images."
+        frame = cv2.imread(session["FRAMES"][1][1], cv2.IMREAD_UNCHANGED)
+        assert frame.shape == (900, 1440), message
+        assert os.path.exists(session["TEMPLATES"]["NEXT"]), "Template saved."
+        message = "Clicks should be kept with the frame they were on."
+        assert len(session["CLICKS"][0]) == 2, message
+        assert session["CLICKS"][1][0][1][:2] == (595, 395), message
+
+
+def test_find_every() -> None:
+    """DESCRIPTION:
+    Tests that every copy of a template is found in one screenshot,
+    once each, and that nothing is found on a screen without it.
+
+    ARGS: None
+
+    RETURNS: None
+    """
+    template = make_screen({"FILE": (0, 0)})[0:70, 0:170]
+    screen = make_screen({})
+    for left, top in [(500, 100), (300, 600), (100, 100)]:
+        screen[top:top + 70, left:left + 170] = template
+
+    matcher = ScreenMatcher(grab=lambda: screen)
+    matcher.add_template("FILE", template)
+    matches = matcher.find_every("FILE", confidence=0.9)
+    message = "Every copy should be found once, from the top left."
+    assert [match[:2] for match in matches] ==\
+        [(100, 100), (500, 100), (300, 600)], message
+
+    message = "Nothing should be found on a screen without the template."
+    empty = Screen(make_screen({"NEXT": (200, 150)}))
+    assert matcher.find_every("FILE", 0.9, screen=empty) == [], message